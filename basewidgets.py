@@ -20,7 +20,8 @@ import sys
 import os
 
 from kivy.core.window import Window
-from kivy.properties import StringProperty
+from kivy.graphics import Color, Rectangle
+from kivy.properties import ListProperty, StringProperty
 from kivy.metrics import dp
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
@@ -56,6 +57,35 @@ class TreeViewContainerNode(BoxLayout, TreeViewNode):
     pass
 
 
+class Sparkline(Widget):
+    """
+    Bars of 'values' scaled to the highest one, None leaves a gap
+    """
+    values = ListProperty([])
+    color = ListProperty([0.25, 0.6, 1.0, 0.8])
+
+    def __init__(self, **kwargs):
+        super(Sparkline, self).__init__(**kwargs)
+        self.bind(values=self.redraw, pos=self.redraw, size=self.redraw,
+                  color=self.redraw)
+
+    def redraw(self, *args):
+        self.canvas.clear()
+        known = [value for value in self.values if value is not None]
+        if not known:
+            return
+        highest = max(known) or 1
+        width = float(self.width) / len(self.values)
+        with self.canvas:
+            Color(*self.color)
+            for i, value in enumerate(self.values):
+                if value is None:
+                    continue
+                Rectangle(pos=(self.x + i * width + 1, self.y),
+                          size=(max(width - 2, 1),
+                                max(self.height * value / highest, 1)))
+
+
 class WinSettingPath(SettingPath):
     """
     Special SettingPath to compensate for windows drives
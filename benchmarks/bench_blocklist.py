@@ -0,0 +1,72 @@
+#!/usr/bin/env python2
+
+# XonoticSimpleStarter - Benchmark of the blocked server lookup
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compare the BlockList index with the old prefix scan over all entries
+
+usage: bench_blocklist.py [servers] [blocked entries]
+"""
+
+from __future__ import print_function
+
+import sys
+import timeit
+
+import fixtures
+from serverlist import BlockList
+
+
+def prefix_scan(addresses, blocked):
+    return [address for address in addresses
+            if any([address.startswith(ip) for ip in blocked])]
+
+
+def indexed(addresses, blocklist):
+    return [address for address in addresses if address in blocklist]
+
+
+def main(num_servers=5000, num_blocked=200):
+    addresses = fixtures.server_addresses(num_servers)
+    entries = fixtures.blocked_entries(addresses, num_blocked)
+    blocked = set(entries)
+    blocklist = BlockList(entries)
+
+    runs = 5
+    old = min(timeit.repeat(lambda: prefix_scan(addresses, blocked),
+                            number=1, repeat=runs))
+    new = min(timeit.repeat(lambda: indexed(addresses, blocklist),
+                            number=1, repeat=runs))
+    build = min(timeit.repeat(lambda: BlockList(entries), number=1,
+                              repeat=runs))
+    old_matches = set(prefix_scan(addresses, blocked))
+    new_matches = set(indexed(addresses, blocklist))
+    print("{} servers, {} blocked entries".format(num_servers, num_blocked))
+    print("prefix scan: {:8.2f} ms".format(old * 1000))
+    print("BlockList:   {:8.2f} ms (+{:.2f} ms to build the index)".format(
+        new * 1000, build * 1000))
+    print("speedup:     {:8.1f}x".format(old / new))
+    print("matches: {} with the prefix scan, {} with BlockList".format(
+        len(old_matches), len(new_matches)))
+    for address in sorted(old_matches - new_matches)[:5]:
+        print("  false positive of the prefix scan: {}".format(address))
+    for address in sorted(new_matches - old_matches)[:5]:
+        print("  missed by the prefix scan: {}".format(address))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
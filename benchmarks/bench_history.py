@@ -0,0 +1,117 @@
+#!/usr/bin/env python2
+
+# XonoticSimpleStarter - Benchmark of the population history
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Record months of refreshes into a History and time the queries
+
+usage: bench_history.py [days] [servers]
+
+A refresh every five minutes is recorded, a daily compaction downsamples
+the samples like the starter does on every start.
+"""
+
+from __future__ import print_function
+
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import fixtures
+from history import DAY, History
+from serverlist import ServerRecord
+
+REFRESH_INTERVAL = 300
+# share of the servers that have players at all
+ACTIVE_SHARE = 0.2
+
+
+def max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def refresh(rng, addresses, now):
+    """
+    Players of every server at 'now', busiest in the evening
+    """
+    evening = 0.5 + 0.5 * math.sin((now % DAY) / float(DAY) * 2 * math.pi)
+    for address in addresses:
+        yield ServerRecord(address, maxplayers=16,
+                           numplayers=min(16, int(rng.expovariate(1.0) *
+                                                  8 * evening)))
+
+
+def main(days=90, servers=300):
+    days, servers = int(days), int(servers)
+    rng = random.Random(days)
+    addresses = fixtures.server_addresses(servers, seed=servers)
+    active = addresses[:int(servers * ACTIVE_SHARE)]
+    directory = tempfile.mkdtemp()
+    try:
+        history = History(directory)
+        start = time.time() - days * DAY
+        recording = compacting = 0.0
+        refreshes = 0
+        for day in range(days):
+            for step in range(DAY // REFRESH_INTERVAL):
+                now = start + day * DAY + step * REFRESH_INTERVAL
+                records = list(refresh(rng, active, now)) + [
+                    ServerRecord(address) for address in addresses[
+                        len(active):]]
+                begin = time.time()
+                history.record(records, now)
+                recording += time.time() - begin
+                refreshes += 1
+            begin = time.time()
+            history.compact(start + (day + 1) * DAY)
+            compacting += time.time() - begin
+        print("{} days, {} servers, {} refreshes".format(days, servers,
+                                                       refreshes))
+        print("record   {:8.3f} ms per refresh".format(
+            recording / refreshes * 1000))
+        print("compact  {:8.1f} ms per day".format(compacting / days * 1000))
+        for name in ("samples.bin", "hourly.bin"):
+            print("{:<12} {:8.0f} kB".format(name, os.path.getsize(
+                os.path.join(directory, name)) / 1024.0))
+        rss = max_rss_kb()
+        favourites = active[:5]
+        for query_days in (7, 28, days):
+            begin = time.time()
+            profile = history.hourly_profile(favourites, query_days)
+            print("profile of {} days {:8.1f} ms".format(
+                query_days, (time.time() - begin) * 1000))
+        if rss is not None:
+            print("max rss grew by {} kB during the queries".format(
+                max_rss_kb() - rss))
+        print("all servers: {}".format(" ".join(
+            "{:.0f}".format(value) if value is not None else "-"
+            for value in profile[None])))
+    finally:
+        shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:3]))
@@ -0,0 +1,128 @@
+#!/usr/bin/env python2
+
+# XonoticSimpleStarter - Benchmark of the server records
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compare parse time and memory of ServerRecords with the old dictionaries
+
+usage: bench_records.py [servers]
+"""
+
+from __future__ import print_function
+
+import gc
+import sys
+import time
+from collections import OrderedDict
+
+import fixtures
+from serverlist import (ServerListParser, ServerRecord, mod_category,
+                        parse_qcstatus)
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+
+def dictify(server):
+    """
+    The dictionaries StarterWidget.dictify_server used to build
+    """
+    serverdict = {'status': server.attrib['status']}
+    if serverdict['status'] == 'UP':
+        serverdict['type'] = 'GAMESERVER'
+        serverdict['name'] = server.find('name').text
+        for field in ['numplayers', 'maxplayers']:
+            serverdict[field] = int(server.find(field).text)
+        qcstatus = None
+        for rule in server.findall('rules/rule'):
+            if rule.attrib['name'] == "qcstatus":
+                qcstatus = rule.text
+        gametype, version, mod = parse_qcstatus(qcstatus)
+        serverdict['gametype'] = gametype
+        serverdict['version'] = version
+        serverdict['mod'] = mod
+        # the category used to be computed on every list update
+        mod_category(mod)
+    return server.attrib['address'], serverdict
+
+
+def recordify(server):
+    address = server.attrib['address']
+    if server.attrib['status'] != 'UP':
+        return address, ServerRecord(address,
+                                     status=server.attrib['status'])
+    qcstatus = None
+    for rule in server.findall('rules/rule'):
+        if rule.attrib['name'] == "qcstatus":
+            qcstatus = rule.text
+    gametype, version, mod = parse_qcstatus(qcstatus)
+    return address, ServerRecord(
+        address, name=server.find('name').text,
+        numplayers=int(server.find('numplayers').text),
+        maxplayers=int(server.find('maxplayers').text),
+        gametype=gametype, version=version, mod=mod)
+
+
+def parse(xml, build):
+    servers = OrderedDict()
+
+    def on_server(server):
+        if 'servers' in server.attrib:
+            return
+        address, record = build(server)
+        servers[address] = record
+
+    parser = ServerListParser(on_server)
+    parser.feed(xml)
+    parser.close()
+    return servers
+
+
+def measure(xml, build, runs=5):
+    times = []
+    for _ in range(runs):
+        gc.collect()
+        start = time.time()
+        parse(xml, build)
+        times.append(time.time() - start)
+    memory = None
+    if tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        servers = parse(xml, build)
+        # the servers are still referenced while they are measured
+        memory = tracemalloc.get_traced_memory()[0] / float(len(servers))
+        tracemalloc.stop()
+    return min(times), memory
+
+
+def main(num_servers=5000):
+    xml, _ = fixtures.serverlist_xml(num_servers)
+    print("{} servers, {} kB of xml".format(num_servers, len(xml) // 1024))
+    for label, build in (("dicts", dictify), ("ServerRecord", recordify)):
+        duration, memory = measure(xml, build)
+        line = "{:<13} parse {:7.1f} ms".format(label, duration * 1000)
+        if memory is not None:
+            line += ", retained {:5.0f} bytes per server".format(memory)
+        print(line)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
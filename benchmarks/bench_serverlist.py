@@ -0,0 +1,270 @@
+#!/usr/bin/env python2
+
+# XonoticSimpleStarter - Benchmark of the serverlist pipeline
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Time every stage of the serverlist pipeline for growing serverlists
+
+The stages are measured separately on synthetic masterserver responses:
+
+    parse       xml -> ServerRecords, blocked servers dropped
+    index       building the ServerIndex of the filter
+    sort_<key>  building the order of a sort key
+    filter      a set of typical queries, without cached results
+    typing      a query typed character by character
+    rows        the rows of the view, as update_serverlist builds them
+    players     building the PlayerIndex of as many players as servers
+    player_search  prefix and substring searches of player names
+    widgets     the RecycleView data and its visible widgets, first and
+                second time
+
+usage: bench_serverlist.py [--sizes 100,1000] [--output FILE]
+                           [--compare FILE]
+
+With --output the times are written as JSON, --compare prints the change
+against such a file and exits with 1 if a stage got slower than the
+threshold.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import fixtures
+from serverlist import BlockList, PlayerIndex, SortedServers
+from serverlistbuilder import ServerListBuilder
+from serverquery import Query, QueryError, ServerIndex
+
+SIZES = [100, 1000, 10000, 50000]
+# entries of checkupdate.txt, a quarter of them block listed servers
+MAX_BLOCKED_ENTRIES = 200
+CHUNK_SIZE = 64 * 1024
+
+QUERIES = ["gametype:ctf", "players>=4", "mod:instagib -gametype:dm", "pub",
+           "ser", "players>0 free>0", "version:0.8.* gametype:ctf",
+           "-name:newbie players>2"]
+TYPED_QUERY = "gametype:ctf players>=4 pub"
+PLAYER_QUERIES = ["mor", "samual1", "^3terence*", "a*", "guard", "k^2i"]
+
+SECTIONS = ['fav', 'vanilla', 'insta', 'ok', 'xdf', 'other']
+
+
+def timed(function, runs):
+    """
+    Best time of 'runs' calls in milliseconds and the last result
+    """
+    best = None
+    result = None
+    for _ in range(runs):
+        gc.collect()
+        start = time.time()
+        result = function()
+        duration = (time.time() - start) * 1000
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+
+def parse(xml, blocklist):
+    builder = ServerListBuilder(blocklist, "dpmaster.deathmask.net")
+    for i in range(0, len(xml), CHUNK_SIZE):
+        builder.feed(xml[i:i + CHUNK_SIZE])
+    return builder
+
+
+def filter_queries(index):
+    for text in QUERIES:
+        index._cache.clear()
+        Query(text).evaluate(index)
+
+
+def typing(index):
+    index._cache.clear()
+    for i in range(1, len(TYPED_QUERY) + 1):
+        try:
+            Query(TYPED_QUERY[:i]).evaluate(index)
+        except QueryError:
+            pass
+
+
+def search_players(index):
+    for text in PLAYER_QUERIES:
+        index.search(text)
+
+
+def server_row(server):
+    ping = "{} ms".format(server.ping) if server.ping is not None else "-"
+    return (server.name, "{} ({})".format(server.gametype, server.mod),
+            "{}/{}".format(server.numplayers, server.maxplayers), ping)
+
+
+def build_rows(servers):
+    """
+    The rows StarterWidget.update_serverlist passes to the view
+    """
+    rows = dict((category, []) for category in SECTIONS)
+    for address, server in servers.items():
+        rows[server.category].append((address, server_row(server)))
+    return rows
+
+
+def load_widgets():
+    """
+    Return the ServerListView class or None if kivy is not available
+    """
+    os.environ.setdefault('KIVY_NO_ARGS', "1")
+    os.environ.setdefault('KIVY_NO_CONSOLELOG', "1")
+    try:
+        from kivy.config import Config
+        Config.set('graphics', 'window_state', 'hidden')
+        # the kv files are loaded relative to the starter
+        cwd = os.getcwd()
+        os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(
+            __file__))))
+        try:
+            from serverlistview import ServerListView
+        finally:
+            os.chdir(cwd)
+    except Exception as e:
+        print("No widget benchmark: {}".format(e), file=sys.stderr)
+        return None
+    return ServerListView
+
+
+def build_widgets(view, rows):
+    view.set_rows(rows)
+    # lay out the visible rows right away instead of on the next frame
+    view.refresh_from_data()
+    view.refresh_views()
+
+
+def bench_size(count, runs, view_class):
+    xml, addresses = fixtures.serverlist_xml(count, seed=count)
+    entries = min(MAX_BLOCKED_ENTRIES, max(8, count // 20))
+    blocklist = BlockList(fixtures.blocked_entries(addresses, entries,
+                                                   seed=count))
+    result = {}
+    result['parse'], builder = timed(lambda: parse(xml, blocklist), runs)
+    snapshot = builder.close()
+    servers = snapshot.servers
+    result['index'], index = timed(lambda: ServerIndex(servers.values()),
+                                   runs)
+    records = list(servers.items())
+    for key in sorted(SortedServers.SORT_KEYS):
+        result['sort_' + key] = timed(
+            lambda: SortedServers(records, sort_key=key), runs)[0]
+    result['filter'] = timed(lambda: filter_queries(index), runs)[0]
+    result['typing'] = timed(lambda: typing(index), runs)[0]
+    result['rows'], rows = timed(lambda: build_rows(servers), runs)
+    players = fixtures.player_lists(count, list(servers), seed=count)
+    result['players'], player_index = timed(lambda: PlayerIndex(players),
+                                            runs)
+    result['player_search'] = timed(lambda: search_players(player_index),
+                                    runs)[0]
+    if view_class is not None:
+        view = view_class(size=(800, 600), size_hint=(None, None))
+        result['widgets_first'] = timed(lambda: build_widgets(view, rows),
+                                        1)[0]
+        result['widgets'] = timed(lambda: build_widgets(view, rows),
+                                  runs)[0]
+    info = {'servers': len(servers), 'blocked': len(snapshot.blocked),
+            'xml_kb': len(xml) // 1024}
+    return result, info
+
+
+def revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, "w")).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, threshold):
+    """
+    Print the change of every stage, return the number of regressions
+    """
+    regressions = 0
+    print("\n{:>6} {:<16} {:>10} {:>10} {:>8}".format(
+        "size", "stage", "old ms", "new ms", "change"))
+    for size, stages in sorted(new['results'].items(),
+                               key=lambda item: int(item[0])):
+        old_stages = old['results'].get(size, {})
+        for stage, duration in sorted(stages.items()):
+            if stage not in old_stages:
+                continue
+            before = old_stages[stage]
+            change = (duration - before) / before if before else 0.0
+            # differences below a millisecond are noise
+            slower = change > threshold and duration - before > 1.0
+            regressions += slower
+            print("{:>6} {:<16} {:10.2f} {:10.2f} {:+7.0%}{}".format(
+                size, stage, before, duration, change,
+                "  REGRESSION" if slower else ""))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the serverlist pipeline")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)),
+                        help="comma separated numbers of servers")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="the best of this many runs is reported")
+    parser.add_argument("--no-widgets", action="store_true",
+                        help="skip the kivy widgets")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown that counts as regression")
+    args = parser.parse_args(argv)
+
+    view_class = None if args.no_widgets else load_widgets()
+    results = {'revision': revision(), 'python': platform.python_version(),
+               'platform': platform.platform(), 'time': time.time(),
+               'runs': args.runs, 'results': {}}
+    for count in [int(size) for size in args.sizes.split(",")]:
+        stages, info = bench_size(count, args.runs, view_class)
+        results['results'][str(count)] = stages
+        print("{} servers ({servers} listed, {blocked} blocked, "
+              "{xml_kb} kB of xml)".format(count, **info))
+        for stage, duration in sorted(stages.items()):
+            print("  {:<16} {:10.2f} ms".format(stage, duration))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print("\ncompared with {} ({})".format(args.compare,
+                                              old.get('revision')))
+        if compare(old, results, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python2
+
+# XonoticSimpleStarter - Benchmark of the theme atlas
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compare loading the images of a theme one by one with loading its atlas
+
+usage: bench_theme.py [theme]
+
+Every run starts a new process, kivy caches the textures it loaded.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('KIVY_NO_ARGS', "1")
+os.environ.setdefault('KIVY_NO_CONSOLELOG', "1")
+
+STARTER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# make the modules of the starter importable
+sys.path.insert(0, STARTER_DIR)
+
+
+def load(theme, atlas):
+    """
+    Load every image of 'theme' as texture, return the time in ms and the
+    number of distinct textures
+    """
+    from kivy.config import Config
+    Config.set('graphics', 'window_state', 'hidden')
+    from kivy.base import EventLoop
+    from kivy.core.image import Image
+    # textures need a GL context
+    EventLoop.ensure_window()
+    import themeatlas
+    filenames = themeatlas.theme_images(theme)
+    start = time.time()
+    if atlas:
+        url = "atlas://" + atlas.replace(os.sep, "/")
+        textures = [Image("{}/{}".format(url, os.path.splitext(
+            os.path.basename(filename))[0])).texture
+            for filename in filenames]
+    else:
+        textures = [Image(filename).texture for filename in filenames]
+    duration = (time.time() - start) * 1000
+    # the regions of an atlas share the id of its texture
+    return duration, len(set(texture.id for texture in textures))
+
+
+def run(theme, atlas=""):
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--load", theme, atlas],
+        cwd=STARTER_DIR)
+    duration, textures = output.decode("ascii").split()[-2:]
+    return float(duration), int(textures)
+
+
+def main(theme="luma"):
+    os.chdir(STARTER_DIR)
+    import themeatlas
+    images = themeatlas.theme_images(theme)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        atlas = themeatlas.theme_atlas(theme, cache_dir)
+        built = (time.time() - start) * 1000
+        start = time.time()
+        themeatlas.theme_atlas(theme, cache_dir)
+        cached = (time.time() - start) * 1000
+        print("{}: {} images".format(theme, len(images)))
+        if atlas is None:
+            print("the atlas could not be built")
+            return 1
+        print("atlas built in {:.1f} ms, found in the cache in {:.1f} ms"
+              .format(built, cached))
+        for label, path in (("images", ""), ("atlas", atlas)):
+            duration, textures = run(theme, path)
+            print("{:<7} {:7.1f} ms, {} textures".format(label, duration,
+                                                         textures))
+    finally:
+        shutil.rmtree(cache_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--load"]:
+        duration, textures = load(sys.argv[2], sys.argv[3] or None)
+        print(duration, textures)
+    else:
+        sys.exit(main(*sys.argv[1:2]))
@@ -0,0 +1,152 @@
+# XonoticSimpleStarter - Synthetic fixtures for the benchmarks
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import random
+import sys
+
+# make the modules of the starter importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+
+def random_ipv4(rng):
+    return "{}.{}.{}.{}".format(rng.randint(1, 223), rng.randint(0, 255),
+                                rng.randint(0, 255), rng.randint(1, 254))
+
+
+def random_ipv6(rng):
+    return "2001:db8:{:x}:{:x}::{:x}".format(rng.randint(0, 0xffff),
+                                             rng.randint(0, 0xffff),
+                                             rng.randint(1, 0xffff))
+
+
+def server_addresses(count, seed=0, ipv6_ratio=0.05):
+    """
+    Addresses like the masterserver reports them
+    """
+    rng = random.Random(seed)
+    addresses = []
+    for _ in range(count):
+        port = rng.choice([26000, 26000, 26000, 26001, 26002, 26010])
+        if rng.random() < ipv6_ratio:
+            addresses.append("[{}]:{}".format(random_ipv6(rng), port))
+        else:
+            addresses.append("{}:{}".format(random_ipv4(rng), port))
+    return addresses
+
+
+def blocked_entries(addresses, count, seed=0):
+    """
+    Entries of checkupdate.txt, some of them block listed servers
+    """
+    rng = random.Random(seed)
+    entries = []
+    for i in range(count):
+        if addresses and i % 4 == 0:
+            entries.append(rng.choice(addresses).rsplit(":", 1)[0].strip("[]"))
+        else:
+            entries.append(random_ipv4(rng))
+    return entries
+
+
+GAMETYPES = ["dm", "ctf", "tdm", "ca", "dom", "kh", "ft", "ons", "cts",
+             "race", "lms", "ka", "inv"]
+MODS = ["MXonotic", "MXonotic", "MXonotic", "MInstaGib", "MOverkill",
+        "MXDF", "MXPM", "MNewToys", "MMinstaGib"]
+VERSIONS = ["0.8.2", "0.8.2", "0.8.1", "0.8.5", "git"]
+WORDS = ["Best", "Pub", "CTF", "Instagib", "Fun", "[EU]", "[US]", "Vehicle",
+         "Xonotic", "Duel", "Server", "Clan", "^1Red", "^4Blue", "^x0F0",
+         "Newbie", "Friendly", "Pro", "Overkill", "Race", "Defrag"]
+PLAYER_NAMES = ["^1Morphed", "^xF80Samual", "Mirio", "^3terencehill",
+                "Antibody", "Smilecythe", "^2nyov", "divVerent", "Mario",
+                "^7LegendGuard", "BuddyFriendGuy", "^4Ace", "Zeth",
+                "^1k^2i^3d", "unnamed player"]
+
+
+def player_lists(count, addresses, seed=0):
+    """
+    (address, player names) of 'count' players spread over 'addresses',
+    most names are distinct like on the real servers
+    """
+    rng = random.Random(seed)
+    players = {}
+    for _ in range(count):
+        name = "{}{}{}".format(rng.choice(PLAYER_NAMES),
+                               rng.choice(["", "^7", "|", "-"]),
+                               rng.randint(0, 10 * count))
+        players.setdefault(rng.choice(addresses), []).append(name)
+    return list(players.items())
+
+
+def _escape(text):
+    return (text.replace("&", "&amp;").replace("<", "&lt;")
+            .replace(">", "&gt;").replace('"', "&quot;"))
+
+
+def server_name(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5)))
+
+
+def serverlist_xml(count, seed=0, players=True, down_ratio=0.02):
+    """
+    Serverlist like dpmaster.deathmask.net returns it with 'xml=1'
+
+    Returns the document as bytes and the list of server addresses.
+    """
+    rng = random.Random(seed)
+    addresses = server_addresses(count, seed)
+    parts = ['<?xml version="1.0" encoding="utf-8"?>\n<qstat>\n',
+             '<server type="XONOTICM" address="dpmaster.deathmask.net" '
+             'status="UP" servers="{}">\n</server>\n'.format(count)]
+    for address in addresses:
+        if rng.random() < down_ratio:
+            parts.append('<server type="XONOTICS" address="{}" '
+                         'status="TIMEOUT">\n</server>\n'.format(address))
+            continue
+        maxplayers = rng.choice([8, 12, 16, 16, 24, 32])
+        numplayers = min(maxplayers, int(rng.expovariate(0.3)))
+        qcstatus = "{}:{}:P{}:S{}:F{}:{}::score!!,".format(
+            rng.choice(GAMETYPES), rng.choice(VERSIONS), rng.randint(0, 99),
+            maxplayers - numplayers, rng.randint(0, 15), rng.choice(MODS))
+        parts.append(
+            '<server type="XONOTICS" address="{}" status="UP">\n'
+            ' <hostname>{}</hostname>\n <name>{}</name>\n'
+            ' <gametype>Xonotic</gametype>\n <map>{}</map>\n'
+            ' <numplayers>{}</numplayers>\n <maxplayers>{}</maxplayers>\n'
+            ' <numspectators>0</numspectators>\n <maxspectators>0'
+            '</maxspectators>\n <ping>{}</ping>\n <retries>0</retries>\n'
+            ' <rules>\n  <rule name="gamename">Xonotic</rule>\n'
+            '  <rule name="protocol">3</rule>\n'
+            '  <rule name="qcstatus">{}</rule>\n'
+            '  <rule name="d0_blind_id">1 {}</rule>\n </rules>\n'.format(
+                address, address, _escape(server_name(rng)),
+                rng.choice(["stormkeep", "afterslime", "dance", "drain",
+                            "solarium", "implosion", "silentsiege"]),
+                numplayers, maxplayers, rng.randint(20, 300),
+                _escape(qcstatus), "x" * 44))
+        if players:
+            parts.append(' <players>\n')
+            for _ in range(numplayers):
+                parts.append(
+                    '  <player>\n   <name>{}</name>\n   <score>{}</score>\n'
+                    '   <ping>{}</ping>\n  </player>\n'.format(
+                        _escape(rng.choice(PLAYER_NAMES)),
+                        rng.randint(-5, 150), rng.randint(0, 250)))
+            parts.append(' </players>\n')
+        parts.append('</server>\n')
+    parts.append('</qstat>\n')
+    return "".join(parts).encode("utf-8"), addresses
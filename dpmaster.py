@@ -0,0 +1,502 @@
+# XonoticSimpleStarter - DarkPlaces query module
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Query DarkPlaces master servers and game servers directly over UDP
+
+This is an alternative to the xml interface of dpmaster.deathmask.net.
+The ServerRecords produced here look exactly like the ones that are parsed
+from the xml serverlist.
+"""
+
+import random
+import socket
+import string
+import struct
+
+from twisted.internet import defer, error, task
+from twisted.internet.protocol import DatagramProtocol
+from twisted.python import failure
+
+from serverlist import ServerRecord, parse_qcstatus
+
+
+MASTERSERVERS = [("dpmaster.deathmask.net", 27950),
+                 ("ghdigital.com", 27950),
+                 ("dpmaster.tchr.no", 27950)]
+GAMENAME = "Xonotic"
+PROTOCOL_VERSION = 3
+DEFAULT_PORT = 26000
+
+HEADER = b"\xff\xff\xff\xff"
+EOT = b"EOT\x00\x00\x00"
+
+
+class QueryTimeout(error.TimeoutError):
+    pass
+
+
+def format_address(host, port):
+    if ":" in host:
+        return "[{}]:{}".format(host, port)
+    return "{}:{}".format(host, port)
+
+
+def split_address(address, default_port=DEFAULT_PORT):
+    """
+    Split 'host:port', '[ipv6]:port' or a plain host into (host, port)
+    """
+    if address.startswith("["):
+        host, _, port = address[1:].partition("]")
+        port = port.lstrip(":")
+    elif address.count(":") == 1:
+        host, port = address.split(":")
+    else:
+        host, port = address, ""
+    return host, int(port) if port else default_port
+
+
+def parse_getservers_response(data):
+    """
+    Parse a 'getserversResponse' or 'getserversExtResponse' packet
+
+    Returns the list of addresses and whether the end of transmission
+    marker was found.
+    """
+    for command in (b"getserversExtResponse", b"getserversResponse"):
+        if data.startswith(HEADER + command):
+            data = data[len(HEADER + command):]
+            break
+    else:
+        raise ValueError("Not a getservers response")
+    addresses = []
+    pos = 0
+    while pos < len(data):
+        separator = data[pos:pos + 1]
+        if data[pos + 1:pos + 7] == EOT:
+            return addresses, True
+        if separator == b"\\" and pos + 7 <= len(data):
+            host = socket.inet_ntoa(data[pos + 1:pos + 5])
+            port, = struct.unpack(">H", data[pos + 5:pos + 7])
+            pos += 7
+        elif separator == b"/" and pos + 19 <= len(data):
+            host = socket.inet_ntop(socket.AF_INET6, data[pos + 1:pos + 17])
+            port, = struct.unpack(">H", data[pos + 17:pos + 19])
+            pos += 19
+        else:
+            break
+        # dpmaster pads with empty entries
+        if port:
+            addresses.append(format_address(host, port))
+    return addresses, False
+
+
+def parse_infostring(data):
+    """
+    Parse a '\\key\\value\\key\\value' string into a dictionary
+    """
+    parts = data.split("\\")
+    if parts and not parts[0]:
+        parts = parts[1:]
+    return dict(zip(parts[0::2], parts[1::2]))
+
+
+def parse_info_response(data):
+    """
+    Parse an 'infoResponse' or 'statusResponse' packet
+
+    Returns the info dictionary and the list of player lines; the latter is
+    empty for 'infoResponse'.
+    """
+    for command in (b"infoResponse\n", b"statusResponse\n"):
+        if data.startswith(HEADER + command):
+            data = data[len(HEADER + command):]
+            break
+    else:
+        raise ValueError("Not an info or status response")
+    lines = data.decode("utf-8", "replace").split("\n")
+    info = parse_infostring(lines[0])
+    players = []
+    for line in lines[1:]:
+        # <score> <ping> "<name>" [<team>]
+        fields = line.split(" ", 2)
+        if len(fields) == 3:
+            name = fields[2].rsplit('"', 1)[0].lstrip('"')
+            players.append({'score': fields[0], 'ping': fields[1],
+                            'name': name})
+    return info, players
+
+
+def record_from_info(address, info):
+    """
+    Build the same ServerRecord as serverlist.record_from_element from an
+    info dictionary
+    """
+    gametype, version, mod = parse_qcstatus(info.get('qcstatus'))
+    return ServerRecord(address, name=info.get('hostname', ""),
+                        numplayers=int(info.get('clients', 0)),
+                        maxplayers=int(info.get('sv_maxclients', 0)),
+                        gametype=gametype, version=version, mod=mod)
+
+
+def _challenge():
+    chars = string.ascii_letters + string.digits
+    return "".join(random.choice(chars) for _ in range(12))
+
+
+class DarkPlacesQuery(DatagramProtocol):
+    """
+    Query engine for the DarkPlaces master and server protocol
+
+    A single UDP socket is used for all queries, responses are dispatched by
+    their source address. 'timeout' applies to every single packet, a query
+    is resent 'retries' times before it fails. At most 'max_in_flight'
+    servers are queried at the same time.
+    """
+    def __init__(self, reactor=None, timeout=2.0, retries=1,
+                 max_in_flight=64):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.reactor = reactor
+        self.timeout = timeout
+        self.retries = retries
+        self.semaphore = defer.DeferredSemaphore(max_in_flight)
+        # (host, port) -> challenge -> pending request, every caller gets
+        # its own packet
+        self._pending = {}
+        self._master_queries = {}
+        self._port = None
+
+    def start(self, interface=""):
+        if self._port is None:
+            self._port = self.reactor.listenUDP(0, self, interface=interface)
+        return self._port
+
+    def stop(self):
+        for requests in list(self._pending.values()):
+            for request in list(requests.values()):
+                self._fail(request, defer.CancelledError())
+        if self._port is not None:
+            port, self._port = self._port, None
+            return port.stopListening()
+
+    def datagramReceived(self, data, addr):
+        addr = (addr[0], addr[1])
+        if addr in self._master_queries:
+            self._master_packet(addr, data)
+            return
+        if addr not in self._pending:
+            return
+        try:
+            info, players = parse_info_response(data)
+        except ValueError:
+            return
+        request = self._pending[addr].get(info.get('challenge'))
+        if request is None:
+            return
+        self._remove(request)
+        request['timer'].cancel()
+        if request['command'] == "getstatus":
+            request['deferred'].callback((info, players))
+        else:
+            request['deferred'].callback(info)
+
+    # master servers
+
+    @defer.inlineCallbacks
+    def query_masters(self, masters=MASTERSERVERS, gamename=GAMENAME,
+                      protocol=PROTOCOL_VERSION):
+        """
+        Ask all master servers for their list of game servers
+
+        Fires with the list of unique addresses. Masters that don't answer
+        in time are skipped.
+        """
+        self.start()
+        results = yield defer.DeferredList(
+            [self._query_master(host, port, gamename, protocol)
+             for host, port in masters], consumeErrors=True)
+        addresses = []
+        seen = set()
+        for success, result in results:
+            if not success:
+                continue
+            for address in result:
+                if address not in seen:
+                    seen.add(address)
+                    addresses.append(address)
+        defer.returnValue(addresses)
+
+    @defer.inlineCallbacks
+    def _query_master(self, host, port, gamename, protocol):
+        ip = yield self.reactor.resolve(host)
+        addr = (ip, port)
+        query = {'deferred': defer.Deferred(), 'addresses': [],
+                 'finished': False, 'timer': None}
+        # an address the socket can't send to fails right away
+        self.transport.write(
+            HEADER + "getservers {} {} empty full".format(
+                gamename, protocol).encode("ascii"), addr)
+        self._master_queries[addr] = query
+        query['timer'] = self.reactor.callLater(self.timeout,
+                                                self._master_done, addr)
+        addresses = yield query['deferred']
+        defer.returnValue(addresses)
+
+    def _master_packet(self, addr, data):
+        query = self._master_queries[addr]
+        try:
+            addresses, finished = parse_getservers_response(data)
+        except ValueError:
+            return
+        query['addresses'].extend(addresses)
+        query['timer'].cancel()
+        if finished:
+            query['finished'] = True
+            self._master_done(addr)
+        else:
+            # wait for the next packet
+            query['timer'] = self.reactor.callLater(self.timeout,
+                                                    self._master_done, addr)
+
+    def _master_done(self, addr):
+        query = self._master_queries.pop(addr)
+        if query['timer'].active():
+            query['timer'].cancel()
+        # a master may have no servers to list
+        if query['finished'] or query['addresses']:
+            query['deferred'].callback(query['addresses'])
+        else:
+            query['deferred'].errback(QueryTimeout(
+                "Master server {} did not answer".format(
+                    format_address(*addr))))
+
+    # game servers
+
+    @defer.inlineCallbacks
+    def query_server(self, address, command="getinfo"):
+        """
+        Send 'getinfo' or 'getstatus' to a single server
+
+        Fires with the info dictionary, or (info, players) for 'getstatus'.
+        """
+        addr = yield self._resolve(address)
+        result = None
+        for attempt in range(self.retries + 1):
+            try:
+                result = yield self._send_query(addr, command)
+            except QueryTimeout:
+                if attempt == self.retries:
+                    raise
+            else:
+                break
+        defer.returnValue(result)
+
+    @defer.inlineCallbacks
+    def ping(self, address):
+        """
+        Send a single 'getinfo' to a server
+
+        Fires with (round trip time in seconds, info dictionary). A lost
+        packet is not resent, that would distort the time.
+        """
+        addr = yield self._resolve(address)
+        sent = self.reactor.seconds()
+        info = yield self._send_query(addr, "getinfo")
+        defer.returnValue((self.reactor.seconds() - sent, info))
+
+    @defer.inlineCallbacks
+    def _resolve(self, address):
+        host, port = split_address(address)
+        if ":" in host:
+            ip = host
+        else:
+            ip = yield self.reactor.resolve(host)
+        defer.returnValue((ip, port))
+
+    def _send_query(self, addr, command):
+        request = {'deferred': defer.Deferred(), 'challenge': _challenge(),
+                   'command': command, 'addr': addr}
+        self.start()
+        # an address the socket can't send to, like an IPv6 one, fails
+        # right away and leaves nothing behind
+        self.transport.write(HEADER + "{} {}".format(
+            command, request['challenge']).encode("ascii"), addr)
+        request['timer'] = self.reactor.callLater(
+            self.timeout, self._timeout, addr, request)
+        self._pending.setdefault(addr, {})[request['challenge']] = request
+        return request['deferred']
+
+    def _remove(self, request):
+        requests = self._pending.get(request['addr'], {})
+        if requests.get(request['challenge']) is request:
+            del requests[request['challenge']]
+            if not requests:
+                del self._pending[request['addr']]
+
+    def _timeout(self, addr, request):
+        self._remove(request)
+        request['deferred'].errback(QueryTimeout(
+            "{} timed out".format(format_address(*addr))))
+
+    def _fail(self, request, reason):
+        self._remove(request)
+        if request['timer'].active():
+            request['timer'].cancel()
+        request['deferred'].errback(reason)
+
+    def query_servers(self, addresses, on_server=None):
+        """
+        Query all given servers concurrently
+
+        Fires with a list of (address, ServerRecord) for all servers that
+        answered. 'on_server' is called with the same arguments as soon as a
+        single answer arrives.
+        """
+        results = []
+
+        def got_info(info, address):
+            try:
+                record = record_from_info(address, info)
+            except ValueError:
+                return
+            results.append((address, record))
+            if on_server is not None:
+                on_server(address, record)
+
+        deferreds = []
+        for address in addresses:
+            d = self.semaphore.run(self.query_server, address)
+            d.addCallback(got_info, address)
+            d.addErrback(lambda failure: None)
+            deferreds.append(d)
+        d = defer.DeferredList(deferreds)
+        d.addCallback(lambda _: results)
+        return d
+
+    @defer.inlineCallbacks
+    def request_serverlist(self, masters=MASTERSERVERS, on_server=None):
+        """
+        Ask the master servers for the list and query every single server
+        """
+        addresses = yield self.query_masters(masters)
+        results = yield self.query_servers(addresses, on_server)
+        defer.returnValue(results)
+
+
+class PingProbe(object):
+    """
+    Measure the latency of game servers with 'getinfo' queries
+
+    At most 'max_in_flight' probes run at the same time and no more than
+    'rate' packets per second are sent. The round trip time of a server is
+    an exponential moving average with weight 'alpha' for the newest sample.
+    Results, including servers that did not answer, are cached for 'ttl'
+    seconds; probing a server again within that time costs nothing.
+    """
+    def __init__(self, query, max_in_flight=16, rate=50.0, ttl=300.0,
+                 alpha=0.3):
+        self.query = query
+        self.reactor = query.reactor
+        self.semaphore = defer.DeferredSemaphore(max_in_flight)
+        self.interval = 1.0 / rate
+        self.ttl = ttl
+        self.alpha = alpha
+        # address -> (average round trip time in seconds or None, time)
+        self._results = {}
+        # address -> running probe
+        self._running = {}
+        self._next_send = 0.0
+
+    def rtt(self, address):
+        """
+        Average round trip time of 'address' in seconds, None if it is
+        unknown or the server did not answer
+        """
+        result = self._results.get(address)
+        return result[0] if result is not None else None
+
+    def rtts(self):
+        """
+        Map every address with a known round trip time to it
+        """
+        return dict((address, result[0])
+                    for address, result in self._results.items()
+                    if result[0] is not None)
+
+    def is_fresh(self, address):
+        result = self._results.get(address)
+        return (result is not None and
+                self.reactor.seconds() - result[1] < self.ttl)
+
+    def probe(self, address):
+        """
+        Fires with the average round trip time of 'address' in seconds or
+        None if it did not answer
+        """
+        if self.is_fresh(address):
+            return defer.succeed(self.rtt(address))
+        if address in self._running:
+            d = defer.Deferred()
+            self._running[address].append(d)
+            return d
+        self._running[address] = []
+        d = self.semaphore.run(self._probe, address)
+        d.addBoth(self._probed, address)
+        return d
+
+    @defer.inlineCallbacks
+    def _probe(self, address):
+        now = self.reactor.seconds()
+        send_at = max(now, self._next_send)
+        self._next_send = send_at + self.interval
+        if send_at > now:
+            yield task.deferLater(self.reactor, send_at - now, lambda: None)
+        try:
+            rtt, info = yield self.query.ping(address)
+        except (error.TimeoutError, error.DNSLookupError,
+                defer.CancelledError):
+            rtt = None
+        average = self.rtt(address)
+        if rtt is not None and average is not None:
+            rtt = self.alpha * rtt + (1 - self.alpha) * average
+        self._results[address] = (rtt, self.reactor.seconds())
+        defer.returnValue(rtt)
+
+    def _probed(self, result, address):
+        for d in self._running.pop(address, []):
+            if isinstance(result, failure.Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+        return result
+
+    def probe_all(self, addresses, on_result=None):
+        """
+        Probe all given servers, 'on_result' is called with (address, round
+        trip time) for every server that was not fresh in the cache
+        """
+        deferreds = []
+        for address in addresses:
+            if self.is_fresh(address):
+                continue
+            d = self.probe(address)
+            if on_result is not None:
+                d.addCallback(lambda rtt, address: on_result(address, rtt),
+                              address)
+            d.addErrback(lambda reason: None)
+            deferreds.append(d)
+        return defer.DeferredList(deferreds)
@@ -0,0 +1,248 @@
+# XonoticSimpleStarter - Supervision of the Xonotic client
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Start Xonotic through the reactor and keep track of the running client
+
+Only one client is started. The graphical client doesn't read console
+commands from stdin, so a running client can't be sent to another server;
+it has to be restarted instead. The last lines of its output are kept for
+crash reports. On POSIX the output goes to a log file that is followed,
+with a pipe the client would be killed by SIGPIPE once the starter is
+closed.
+"""
+
+import collections
+import io
+import os
+import subprocess
+import sys
+import time
+
+from twisted.internet import defer, error, protocol, task
+
+from metrics import registry
+
+OUTPUT_LINES = 200
+# longer lines are split
+MAX_LINE_LENGTH = 4096
+# seconds between two reads of the log file
+POLL_INTERVAL = 0.5
+# seconds a stopped client has to exit before it is killed
+KILL_DELAY = 5.0
+
+
+class OutputBuffer(object):
+    """
+    The last 'max_lines' lines of the output of a process
+    """
+    def __init__(self, max_lines=OUTPUT_LINES):
+        self.lines = collections.deque(maxlen=max_lines)
+        # incomplete last line of every file descriptor
+        self._partial = {}
+
+    def feed(self, data, fd=1):
+        lines = (self._partial.get(fd, b"") + data).split(b"\n")
+        partial = lines.pop()
+        if len(partial) > MAX_LINE_LENGTH:
+            lines.append(partial)
+            partial = b""
+        self._partial[fd] = partial
+        for line in lines:
+            self.lines.append(line.rstrip(b"\r").decode("utf-8", "replace"))
+
+    def flush(self):
+        for fd, partial in list(self._partial.items()):
+            if partial:
+                self.feed(b"\n", fd)
+
+    def tail(self, count):
+        return list(self.lines)[-count:]
+
+
+class GameProcess(protocol.ProcessProtocol):
+    """
+    A Xonotic client started by the starter
+    """
+    def __init__(self, profile, server=None, log_path=None):
+        self.profile = profile
+        self.server = server
+        self.log_path = log_path
+        self.output = OutputBuffer()
+        self.pid = None
+        self.running = False
+        self.started = None
+        self.exit_code = None
+        self.signal = None
+        # stopped by the starter, the signal is no crash
+        self.terminated = False
+        # fires with the process once it ended
+        self.ended = defer.Deferred()
+        self._log = None
+        self._poll = None
+
+    def connectionMade(self):
+        self.pid = self.transport.pid
+        self.running = True
+        self.started = time.time()
+        if self.log_path is not None:
+            self._log = io.open(self.log_path, "rb")
+            self._poll = task.LoopingCall(self.read_log)
+            self._poll.start(POLL_INTERVAL, now=False)
+
+    def read_log(self):
+        data = self._log.read()
+        if data:
+            self.output.feed(data)
+
+    def childDataReceived(self, fd, data):
+        self.output.feed(data, fd)
+
+    def processEnded(self, reason):
+        self.running = False
+        if self._poll is not None:
+            self._poll.stop()
+            self.read_log()
+            self._log.close()
+        self.output.flush()
+        if reason.check(error.ProcessTerminated):
+            self.exit_code = reason.value.exitCode
+            self.signal = reason.value.signal
+        else:
+            self.exit_code = 0
+        self.ended.callback(self)
+
+    @property
+    def crashed(self):
+        if self.terminated:
+            return False
+        return bool(self.signal) or bool(self.exit_code)
+
+    @property
+    def runtime(self):
+        return time.time() - self.started if self.started else 0.0
+
+    def terminate(self, signal='TERM'):
+        self.terminated = True
+        try:
+            self.transport.signalProcess(signal)
+        except error.ProcessExitedAlready:
+            pass
+
+    def describe_exit(self):
+        if self.signal:
+            return "killed by signal {}".format(self.signal)
+        return "exited with code {}".format(self.exit_code)
+
+
+class GameSupervisor(object):
+    """
+    Start at most one Xonotic client and report when it ends
+
+    'on_exit' is called with the GameProcess when the client ended.
+    """
+    def __init__(self, reactor, log_dir=None, on_exit=None, platform=None):
+        self.reactor = reactor
+        self.log_dir = log_dir
+        self.on_exit = on_exit
+        self.platform = sys.platform if platform is None else platform
+        self.process = None
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.running
+
+    def launch(self, profile, server=None, requested=None):
+        """
+        Start the client of 'profile' and connect to 'server' if given
+
+        Returns 'started', or 'running' if a client already runs; it is
+        left alone. 'requested' is the time of the click, the delay until
+        the process started is recorded as metric.
+        """
+        requested = time.time() if requested is None else requested
+        if self.running:
+            return 'running'
+        args, cwd, env = profile.command(server)
+        process = GameProcess(profile, server)
+        try:
+            self.spawn(process, args, cwd, env)
+        except NotImplementedError:
+            # spawning needs pywin32 on windows, the client is not tracked
+            # without it
+            subprocess.Popen(args, cwd=cwd, env=env)
+        else:
+            self.process = process
+            process.ended.addCallback(self.ended)
+        registry.timer('launch.start').record(time.time() - requested)
+        return 'started'
+
+    def restart(self, profile, server=None, requested=None):
+        """
+        Stop the running client and start it again like 'launch'
+
+        Fires with the result of 'launch' once the new client started.
+        """
+        requested = time.time() if requested is None else requested
+        if not self.running:
+            return defer.maybeDeferred(self.launch, profile, server,
+                                       requested)
+        d = self.stop()
+        d.addCallback(lambda process: self.launch(profile, server,
+                                                  requested))
+        return d
+
+    def stop(self):
+        """
+        Stop the running client, it is killed if it doesn't exit within
+        KILL_DELAY seconds. Fires with the process once it ended.
+        """
+        process = self.process
+        d = defer.Deferred()
+        kill = self.reactor.callLater(KILL_DELAY, process.terminate, 'KILL')
+
+        def ended(process):
+            if kill.active():
+                kill.cancel()
+            # 'ended' forgot the process already
+            d.callback(process)
+            return process
+        process.ended.addCallback(ended)
+        process.terminate()
+        return d
+
+    def spawn(self, process, args, cwd, env):
+        if self.log_dir is None or self.platform in ["win32", "cygwin"]:
+            self.reactor.spawnProcess(process, args[0], args, env=env,
+                                      path=cwd)
+            return
+        if not os.path.isdir(self.log_dir):
+            os.makedirs(self.log_dir)
+        process.log_path = os.path.join(self.log_dir, "xonotic.log")
+        with io.open(process.log_path, "wb") as log:
+            self.reactor.spawnProcess(
+                process, args[0], args, env=env, path=cwd,
+                childFDs={0: 'w', 1: log.fileno(), 2: log.fileno()})
+
+    def ended(self, process):
+        if self.process is process:
+            self.process = None
+        registry.timer('launch.runtime').record(process.runtime)
+        if process.crashed:
+            registry.counter('launch.crashes').inc()
+        if self.on_exit is not None:
+            self.on_exit(process)
+        return process
@@ -0,0 +1,329 @@
+# XonoticSimpleStarter - Headless mode
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+List, query and launch without opening a window
+
+    xonoticsimplestarter.py --headless list --filter "gametype:ctf players>0"
+    xonoticsimplestarter.py --headless list --sort ping --limit 10 --json
+    xonoticsimplestarter.py --headless favourites
+    xonoticsimplestarter.py --headless launch 127.0.0.1:26000 --dry-run
+
+The settings are read from the same starter.ini as the gui. Twisted and the
+serverlist modules are only imported by the commands that need them, so
+printing a launch command doesn't pay for them.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import starterconfig
+from launcher import LaunchError, build_command
+
+SORT_KEYS = ('name', 'numplayers', 'maxplayers', 'gametype', 'ping')
+
+PING_CONCURRENCY = 16
+PING_RATE = 50
+
+
+def _write(line, stream=None):
+    stream = sys.stdout if stream is None else stream
+    if sys.version_info[0] < 3 and isinstance(line, unicode):  # noqa
+        line = line.encode(stream.encoding or "utf-8", "replace")
+    stream.write(line + "\n")
+
+
+def _error(message):
+    _write("error: {}".format(message), sys.stderr)
+
+
+def record_dict(record):
+    return dict((field, getattr(record, field))
+                for field in record.FIELDS)
+
+
+def format_table(records):
+    """
+    Lines of a plain text table of 'records'
+    """
+    from serverlist import strip_colors
+    lines = [u"{:<40} {:<21} {:<16} {:>7} {:>5}".format(
+        "NAME", "ADDRESS", "GAMETYPE", "PLAYERS", "PING")]
+    for record in records:
+        name = strip_colors(record.name)
+        if len(name) > 40:
+            name = name[:39] + u"~"
+        lines.append(u"{:<40} {:<21} {:<16} {:>7} {:>5}".format(
+            name, record.address,
+            u"{} ({})".format(record.gametype, record.mod)[:16],
+            u"{}/{}".format(record.numplayers, record.maxplayers),
+            record.ping if record.ping is not None else u"-"))
+    return lines
+
+
+def output(records, as_json):
+    if as_json:
+        _write(json.dumps([record_dict(record) for record in records],
+                          indent=2, sort_keys=True))
+    else:
+        for line in format_table(records):
+            _write(line)
+
+
+def load_blocklist(config):
+    from serverlist import BlockList
+    filepath = starterconfig.checkupdate_path(
+        config.get('Xonotic', 'xon_path'))
+    if os.path.isfile(filepath):
+        return BlockList.from_checkupdate(filepath)
+    return BlockList()
+
+
+def fetch_http(reactor, blocklist, light, sort_key, timeout):
+    """
+    Fires with (SortedServers, ServerIndex) of the xml serverlist
+    """
+    from masterserver import MasterServer
+    from serverlistbuilder import ServerListBuilder
+    client = MasterServer(reactor, timeout)
+    builder = ServerListBuilder(blocklist, MasterServer.host,
+                                sort_key=sort_key)
+    d = client.fetch(client.list_url(light), builder.feed)
+
+    def built(result):
+        snapshot = builder.close()
+        for address, e in snapshot.errors:
+            _error("Could not parse server {}: {!r}".format(address, e))
+        return snapshot.servers, snapshot.index
+    d.addCallback(built)
+    return d
+
+
+def fetch_udp(query, blocklist, sort_key):
+    """
+    Fires with (SortedServers, ServerIndex) of the DarkPlaces master servers
+    """
+    from twisted.internet import defer
+    from serverlist import SortedServers
+    from serverquery import ServerIndex
+
+    @defer.inlineCallbacks
+    def fetch():
+        addresses = yield query.query_masters()
+        results = yield query.query_servers(
+            [address for address in addresses if address not in blocklist])
+        servers = SortedServers(results, sort_key=sort_key)
+        defer.returnValue((servers, ServerIndex(servers.values())))
+    return fetch()
+
+
+def ping_servers(query, servers, index, addresses):
+    """
+    Measure the latency of 'addresses' and update their records
+    """
+    import dpmaster
+    probe = dpmaster.PingProbe(query, max_in_flight=PING_CONCURRENCY,
+                               rate=PING_RATE)
+
+    def set_ping(address, rtt):
+        if rtt is not None:
+            servers[address] = servers[address].replace(
+                ping=int(round(rtt * 1000)))
+            index.add(servers[address])
+    return probe.probe_all(list(addresses), set_ping)
+
+
+def run_list(reactor, args, config):
+    from twisted.internet import defer
+    import dpmaster
+    from serverquery import Query
+
+    @defer.inlineCallbacks
+    def run():
+        query = Query(args.filter or "")
+        blocklist = load_blocklist(config)
+        dpquery = dpmaster.DarkPlacesQuery(reactor)
+        backend = args.backend or config.get('Xonotic', 'query_backend')
+        if backend == "udp":
+            servers, index = yield fetch_udp(dpquery, blocklist, args.sort)
+        else:
+            servers, index = yield fetch_http(reactor, blocklist, args.light,
+                                              args.sort, args.timeout)
+        matches = query.evaluate(index)
+        if args.ping or args.sort == 'ping':
+            uses_ping = any(term.field == 'ping' for term in query.terms)
+            yield ping_servers(dpquery, servers, index,
+                               index.records if matches is None or uses_ping
+                               else matches)
+            if uses_ping:
+                matches = query.evaluate(index)
+        dpquery.stop()
+        records = [record for address, record in servers.items()
+                   if matches is None or address in matches]
+        if args.limit:
+            records = records[:args.limit]
+        output(records, args.json)
+    return run()
+
+
+def run_favourites(reactor, args, config):
+    from twisted.internet import defer
+    import dpmaster
+    from serverlist import ServerRecord
+
+    @defer.inlineCallbacks
+    def run():
+        favourites = starterconfig.favourites(config)
+        dpquery = dpmaster.DarkPlacesQuery(reactor, timeout=args.timeout)
+        results = dict((yield dpquery.query_servers(list(favourites))))
+        dpquery.stop()
+        records = [results.get(address) or
+                   ServerRecord(address, status='DOWN', name=name, mod="??")
+                   for address, name in favourites.items()]
+        if args.json:
+            output(records, True)
+            return
+        for record in records:
+            _write(u"{:<4} {}".format(record.status,
+                                      format_table([record])[1]))
+    return run()
+
+
+def quote_command(args):
+    if sys.platform in ["win32", "cygwin"]:
+        return subprocess.list2cmdline(args)
+    try:
+        from shlex import quote
+    except ImportError:
+        from pipes import quote
+    return " ".join(quote(arg) for arg in args)
+
+
+def run_launch(args, config):
+    try:
+        command, cwd, env = build_command(
+            config, args.address,
+            profile=args.profile or config.get('Xonotic', 'launch_profile'))
+    except LaunchError as e:
+        _error(e)
+        return 1
+    if args.dry_run:
+        _write(quote_command(command))
+        return 0
+    try:
+        subprocess.Popen(command, cwd=cwd, env=env)
+    except OSError as e:
+        _error("Starting Xonotic failed: {}".format(e.strerror))
+        return 1
+    return 0
+
+
+def react(function, args, config):
+    """
+    Run 'function' in the twisted reactor and return the exit code
+    """
+    from twisted.internet import reactor
+    from twisted.python import failure
+    result = []
+
+    def done(value):
+        if isinstance(value, failure.Failure):
+            _error(value.getErrorMessage() or value.type.__name__)
+            result.append(1)
+        else:
+            result.append(0)
+        reactor.stop()
+
+    def start():
+        try:
+            d = function(reactor, args, config)
+        except Exception:
+            done(failure.Failure())
+        else:
+            d.addBoth(done)
+    reactor.callWhenRunning(start)
+    reactor.run()
+    return result[0] if result else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="xonoticsimplestarter.py --headless",
+        description="List, query and launch Xonotic servers without a "
+                    "window")
+    parser.add_argument("--config", help="config file, defaults to the "
+                        "starter.ini of the gui")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    list_parser = commands.add_parser("list", help="list public servers")
+    list_parser.add_argument("-f", "--filter",
+                             help='query, e.g. "gametype:ctf players>=4"')
+    list_parser.add_argument("-s", "--sort", choices=SORT_KEYS,
+                             default='name')
+    list_parser.add_argument("-n", "--limit", type=int, default=0,
+                             help="show at most this many servers")
+    list_parser.add_argument("--json", action="store_true")
+    list_parser.add_argument("--backend", choices=("http", "udp"),
+                             help="defaults to the query backend of the "
+                                  "config")
+    list_parser.add_argument("--light", action="store_true",
+                             help="request the list without players")
+    list_parser.add_argument("--ping", action="store_true",
+                             help="measure the latency of the listed "
+                                  "servers")
+    list_parser.add_argument("--timeout", type=float, default=10)
+
+    favourites_parser = commands.add_parser(
+        "favourites", help="query the favourites of the config")
+    favourites_parser.add_argument("--json", action="store_true")
+    favourites_parser.add_argument("--timeout", type=float, default=2,
+                                   help="seconds to wait for each server")
+
+    launch_parser = commands.add_parser("launch", help="start Xonotic")
+    launch_parser.add_argument("address", nargs="?",
+                               help="server to connect to")
+    launch_parser.add_argument("--profile",
+                               help="launch profile, defaults to the one "
+                                    "of the config")
+    launch_parser.add_argument("--dry-run", action="store_true",
+                               help="only print the command")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    config = starterconfig.load_config(args.config)
+    if args.command == "launch":
+        return run_launch(args, config)
+    if args.command == "list":
+        from serverquery import Query, QueryError
+        try:
+            Query(args.filter or "")
+        except QueryError as e:
+            parser.error(str(e))
+        return react(run_list, args, config)
+    return react(run_favourites, args, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+# XonoticSimpleStarter - Population history of the servers
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Population history of the servers
+
+Every refresh appends fixed-width (time, server id, players) records to
+samples.bin. Only servers with players get a record; a server without one
+was empty. Every refresh also adds one record with the server id 0, which
+holds the players of all servers together.
+
+Samples older than the retention are downsampled to hourly averages in
+hourly.bin, which has the same layout. Its values are tenths of players.
+
+Both files are kept in time order and read through mmap. A query bisects
+to the start of its time range and unpacks the records in chunks, so a
+file is never read as a whole.
+
+Compaction and queries run in a worker and hold a lock while they use the
+files. Recording never waits for it: while the lock is held the samples
+are kept in memory until the next refresh or the worker writes them. The
+buffer and the server ids have their own lock that is only held briefly.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+RECORD = struct.Struct("<IIH")
+# records unpacked at once
+CHUNK = 4096
+CHUNK_RECORDS = struct.Struct("<" + "IIH" * CHUNK)
+# server id of the records of a whole refresh
+REFRESH_ID = 0
+MAX_VALUE = 0xffff
+HOUR = 3600
+DAY = 24 * HOUR
+# samples older than this are downsampled
+RETENTION = 14 * DAY
+# hourly averages older than this are dropped
+MAX_AGE = 366 * DAY
+# hourly averages are stored in tenths of players
+SCALE = 10
+
+
+def _clamp(value):
+    return max(0, min(int(round(value)), MAX_VALUE))
+
+
+class RecordFile(object):
+    """
+    Append only file of RECORDs in time order
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.path) // RECORD.size
+        except OSError:
+            return 0
+
+    def append(self, records):
+        with open(self.path, "ab") as f:
+            # an interrupted write leaves a partial record behind
+            f.truncate(len(self) * RECORD.size)
+            f.write(b"".join(RECORD.pack(*record) for record in records))
+
+    def _find(self, mapped, count, timestamp):
+        """
+        Index of the first record at or after 'timestamp'
+        """
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            record = RECORD.unpack_from(mapped, middle * RECORD.size)
+            if record[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def read(self, start=None, end=None):
+        """
+        Yield the records with start <= time < end
+        """
+        count = len(self)
+        if not count:
+            return
+        with open(self.path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), count * RECORD.size,
+                               access=mmap.ACCESS_READ)
+            try:
+                first = self._find(mapped, count, start) if start else 0
+                last = self._find(mapped, count, end) if end else count
+                for offset in range(first, last, CHUNK):
+                    number = min(CHUNK, last - offset)
+                    if number == CHUNK:
+                        values = CHUNK_RECORDS.unpack_from(
+                            mapped, offset * RECORD.size)
+                    else:
+                        values = struct.unpack_from(
+                            "<" + "IIH" * number, mapped,
+                            offset * RECORD.size)
+                    for i in range(0, 3 * number, 3):
+                        yield values[i], values[i + 1], values[i + 2]
+            finally:
+                mapped.close()
+
+    def first_time(self):
+        for record in self.read():
+            return record[0]
+        return None
+
+    def truncate_before(self, timestamp):
+        """
+        Drop the records before 'timestamp', the rest is copied in chunks
+        """
+        path = self.path + ".tmp"
+        with open(path, "wb") as f:
+            records = []
+            for record in self.read(start=timestamp):
+                records.append(record)
+                if len(records) == CHUNK:
+                    f.write(b"".join(RECORD.pack(*r) for r in records))
+                    records = []
+            f.write(b"".join(RECORD.pack(*r) for r in records))
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(path, self.path)
+
+
+def _add(values, index, value):
+    values[index] = values.get(index, 0) + value
+
+
+class History(object):
+    """
+    Players of the servers over time, stored in 'directory'
+    """
+    def __init__(self, directory, retention=RETENTION, max_age=MAX_AGE):
+        self.directory = directory
+        self.retention = retention
+        self.max_age = max_age
+        self.samples = RecordFile(os.path.join(directory, "samples.bin"))
+        self.hourly = RecordFile(os.path.join(directory, "hourly.bin"))
+        self._ids_path = os.path.join(directory, "servers.json")
+        # address -> server id
+        self._ids = None
+        # held while the files are used, compaction and queries run in a
+        # worker
+        self._lock = threading.Lock()
+        # samples that were recorded while the lock was held
+        self._buffer = []
+        # guards _buffer and _ids, never held for long
+        self._state_lock = threading.Lock()
+
+    def _load_ids(self):
+        """
+        The state lock has to be held
+        """
+        if self._ids is None:
+            try:
+                with open(self._ids_path) as f:
+                    self._ids = json.load(f)
+            except (IOError, OSError, ValueError):
+                self._ids = {}
+        return self._ids
+
+    def _save_ids(self):
+        with open(self._ids_path + ".tmp", "w") as f:
+            json.dump(self._ids, f)
+        if os.path.exists(self._ids_path):
+            os.remove(self._ids_path)
+        os.rename(self._ids_path + ".tmp", self._ids_path)
+
+    def server_id(self, address):
+        with self._state_lock:
+            return self._load_ids().get(address)
+
+    def record(self, servers, now=None):
+        """
+        Append the players of the ServerRecords 'servers' at 'now'
+
+        Returns whether the samples were written, otherwise a worker holds
+        the lock and they are written later.
+        """
+        now = int(time.time() if now is None else now)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with self._state_lock:
+            ids = self._load_ids()
+            added = False
+            total = 0
+            records = []
+            for server in servers:
+                if server.numplayers <= 0:
+                    continue
+                total += server.numplayers
+                server_id = ids.get(server.address)
+                if server_id is None:
+                    server_id = ids[server.address] = len(ids) + 1
+                    added = True
+                records.append((now, server_id,
+                                _clamp(server.numplayers)))
+            if added:
+                self._save_ids()
+            records.insert(0, (now, REFRESH_ID, _clamp(total)))
+            self._buffer.extend(records)
+        if not self._lock.acquire(False):
+            return False
+        try:
+            self._flush()
+        finally:
+            self._lock.release()
+        return True
+
+    def _flush(self):
+        """
+        Write the buffered samples, the lock has to be held
+        """
+        with self._state_lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return
+        try:
+            self.samples.append(records)
+        except (IOError, OSError):
+            # keep them for the next attempt, before the newer ones
+            with self._state_lock:
+                self._buffer[:0] = records
+            raise
+
+    def compact(self, now=None):
+        """
+        Downsample the samples older than the retention to hourly averages
+        and drop the averages older than 'max_age'. Returns the number of
+        hours that were added.
+        """
+        now = time.time() if now is None else now
+        cutoff = int(now - self.retention) // HOUR * HOUR
+        with self._lock:
+            self._flush()
+            # hour -> number of refreshes, hour -> sum of all players
+            refreshes = {}
+            totals = {}
+            # hour -> {server id -> sum of players}
+            players = {}
+            for timestamp, server_id, value in self.samples.read(end=cutoff):
+                hour = timestamp // HOUR * HOUR
+                if server_id == REFRESH_ID:
+                    _add(refreshes, hour, 1)
+                    _add(totals, hour, value)
+                else:
+                    _add(players.setdefault(hour, {}), server_id, value)
+            if refreshes:
+                records = []
+                for hour in sorted(refreshes):
+                    count = float(refreshes[hour])
+                    records.append((hour, REFRESH_ID,
+                                    _clamp(totals[hour] * SCALE / count)))
+                    for server_id, value in sorted(
+                            players.get(hour, {}).items()):
+                        records.append((hour, server_id,
+                                        _clamp(value * SCALE / count)))
+                self.hourly.append(records)
+                self.samples.truncate_before(cutoff)
+            oldest = self.hourly.first_time()
+            if oldest is not None and oldest < now - self.max_age:
+                self.hourly.truncate_before(int(now - self.max_age))
+            # recorded in the meantime
+            self._flush()
+        return len(refreshes)
+
+    def hourly_profile(self, addresses=(), days=28, now=None):
+        """
+        Average players per hour of the local day over the last 'days'
+
+        Returns a dict that maps every address and None, for all servers
+        together, to a list of 24 averages. Hours without any refresh are
+        None.
+        """
+        now = time.time() if now is None else now
+        start = int(now - days * DAY)
+        with self._state_lock:
+            ids = self._load_ids()
+            wanted = dict((ids[address], address) for address in addresses
+                          if address in ids)
+        wanted[REFRESH_ID] = None
+        # hour of the day -> number of observed hours
+        observed = [0] * 24
+        # key -> hour of the day -> sum of the hourly averages
+        sums = dict((key, [0.0] * 24) for key in wanted.values())
+        sums.update((address, [0.0] * 24) for address in addresses)
+        local_hours = {}
+
+        def hour_of_day(hour):
+            result = local_hours.get(hour)
+            if result is None:
+                result = local_hours[hour] = time.localtime(hour).tm_hour
+            return result
+
+        with self._lock:
+            self._flush()
+            for hour, server_id, value in self.hourly.read(start=start):
+                if server_id == REFRESH_ID:
+                    observed[hour_of_day(hour)] += 1
+                if server_id in wanted:
+                    values = sums[wanted[server_id]]
+                    values[hour_of_day(hour)] += float(value) / SCALE
+            # the samples are averaged per hour first, like the hourly file
+            refreshes = {}
+            hours = {}
+            for timestamp, server_id, value in self.samples.read(
+                    start=start):
+                if server_id not in wanted:
+                    continue
+                hour = timestamp // HOUR * HOUR
+                if server_id == REFRESH_ID:
+                    _add(refreshes, hour, 1)
+                _add(hours.setdefault(hour, {}), server_id, value)
+        for hour, count in refreshes.items():
+            for server_id, value in hours[hour].items():
+                values = sums[wanted[server_id]]
+                values[hour_of_day(hour)] += float(value) / count
+            observed[hour_of_day(hour)] += 1
+        return dict((key, [values[i] / observed[i] if observed[i] else None
+                           for i in range(24)])
+                    for key, values in sums.items())
+
+
+def busy_hours(profile, share=0.8):
+    """
+    Describe the hours of the day with at least 'share' of the highest
+    average, e.g. "20-23h". None if the profile has no players.
+    """
+    known = [value for value in profile if value is not None]
+    if not known or max(known) <= 0:
+        return None
+    threshold = max(known) * share
+    busy = [value is not None and value >= threshold for value in profile]
+    ranges = []
+    hour = 0
+    while hour < 24:
+        if not busy[hour]:
+            hour += 1
+            continue
+        end = hour
+        while end + 1 < 24 and busy[end + 1]:
+            end += 1
+        ranges.append("{}h".format(hour) if end == hour else
+                      "{}-{}h".format(hour, end + 1))
+        hour = end + 1
+    return ", ".join(ranges)
@@ -28,6 +28,8 @@ from kivy.logger import Logger
 from twisted.internet import protocol, reactor
 from twisted.words.protocols import irc
 
+from metrics import registry
+
 
 Builder.load_file("ircchannelview.kv")
 
@@ -102,13 +104,16 @@ class IRCChannelView(BoxLayout):
         self.ids.txt_topic.text = formatting_from_irc(newTopic)
 
     def append_line(self, line):
+        registry.counter('irc.lines').inc()
         self.ids.txt_display.text += line + "\n"
 
     def append_msg(self, user, msg):
         """
         Append a message to the IRC chat
         """
-        self.append_line("{:>20} {}".format(user, formatting_from_irc(msg)))
+        with registry.timer('irc.format').time():
+            msg = formatting_from_irc(msg)
+        self.append_line("{:>20} {}".format(user, msg))
 
     def append_action(self, user, data):
         self.append_line(colored(italic("{:>20} {}".format(user, data))),
@@ -503,16 +508,16 @@ class IRCController(EventDispatcher):
 
     def on_is_connected(self, instance, value):
         maingui = App.get_running_app().root
-        irc_ids = [id for id in maingui.ids if id.startswith("irc")]
+        # views that are created later ask for the state themselves
         if value:
             # enable button
-            for id in irc_ids:
-                maingui.ids[id].on_connected()
+            for view in maingui.irc_views():
+                view.on_connected()
             maingui.ids.btn_connectIRC.text = "Disconnect from IRC"
         else:
             # disable button and input
-            for id in irc_ids:
-                maingui.ids[id].on_disconnected()
+            for view in maingui.irc_views():
+                view.on_disconnected()
             maingui.ids.btn_connectIRC.text = "Connect to IRC"
 
     def connect(self):
@@ -553,8 +558,4 @@ class IRCController(EventDispatcher):
             self.ircfactory.client.join(channel)
 
     def get_irc_widget(self, channel):
-        maingui = App.get_running_app().root
-        irc_ids = [id for id in maingui.ids if id.startswith("irc")]
-        for id in irc_ids:
-            if maingui.ids[id].channel == channel:
-                return maingui.ids[id]
+        return App.get_running_app().root.irc_view(channel)
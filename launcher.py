@@ -0,0 +1,175 @@
+# XonoticSimpleStarter - Launching Xonotic
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Resolve the command that starts Xonotic
+
+A launch profile is the binary, graphics version, environment and
+arguments of one Xonotic installation. The default profile uses the
+settings of the Xonotic section, more profiles can be added to starter.ini
+as sections named "Profile <name>" that override some of them.
+"""
+
+import os
+import sys
+
+import starterconfig
+from starterconfig import DEFAULT_PROFILE
+
+
+class LaunchError(Exception):
+    pass
+
+
+class LaunchProfile(object):
+    """
+    A resolved profile, everything needed to start its Xonotic
+    """
+    def __init__(self, name, binary, version, cwd, env=None, args=None):
+        self.name = name
+        self.binary = binary
+        self.version = version
+        self.cwd = cwd
+        # variables added to the environment of the starter
+        self.env = env or {}
+        self.args = args or []
+
+    def command(self, server=None):
+        """
+        Return (args, cwd, env), directly connect to 'server' if given
+        """
+        env = os.environ.copy()
+        env.update(self.env)
+        args = [self.binary] + self.args
+        if server:
+            args.extend(["+connect", server])
+        return args, self.cwd, env
+
+    def validate(self):
+        if not os.path.isdir(self.cwd):
+            raise LaunchError("Xonotic directory not found: {}".format(
+                self.cwd))
+        if not os.path.exists(self.binary):
+            raise LaunchError("Xonotic not found: {}".format(self.binary))
+
+    def __repr__(self):
+        return "LaunchProfile({!r}, {!r})".format(self.name, self.binary)
+
+
+def parse_env_vars(text):
+    """
+    Parse the comma separated 'NAME=value' list of the settings
+    """
+    env = {}
+    if text:
+        for var in text.split(","):
+            try:
+                name, value = var.strip().split("=")
+            except ValueError:
+                raise LaunchError(
+                    "Invalid environment variable: {}".format(var.strip()))
+            env[name] = value
+    return env
+
+
+def resolve_profile(settings, name=DEFAULT_PROFILE, platform=None):
+    """
+    Turn the settings of a profile into a LaunchProfile
+    """
+    platform = sys.platform if platform is None else platform
+    env = parse_env_vars(settings['env_vars'])
+
+    # Arguments
+    args = settings['args'].split()
+    # Path and Version like specified in the settings
+    xon_path = settings['xon_path']
+    xon_version = settings['xon_version']
+    # git version
+    if os.path.isfile(os.path.join(xon_path, "all")):
+        xon_app = "all"
+        args.insert(0, "run")
+        args.insert(1, xon_version)
+    # release and autobuild versions
+    elif platform.startswith('linux'):
+        xon_app = "xonotic-linux-{}.sh".format(xon_version)
+    elif platform in ["win32", "cygwin"]:
+        if xon_version == "sdl":
+            xon_app = "xonotic.exe"
+        else:
+            xon_app = "xonotic-wgl.exe"
+        args.extend(["-basedir", xon_path])
+    elif platform == "darwin":
+        xon_app = "Xonotic.app"
+    else:
+        raise LaunchError("Unsupported platform")
+    return LaunchProfile(name, os.path.join(xon_path, xon_app), xon_version,
+                         xon_path, env, args)
+
+
+def profile_settings(config, name=DEFAULT_PROFILE):
+    try:
+        return starterconfig.profile_settings(config, name)
+    except KeyError:
+        raise LaunchError("Unknown launch profile: {}".format(name))
+
+
+def build_command(config, server=None, platform=None,
+                  profile=DEFAULT_PROFILE):
+    """
+    Return (args, cwd, env) to start Xonotic with the environment variables
+    and arguments of 'config'. Also directly connect to 'server' if given.
+    """
+    return resolve_profile(profile_settings(config, profile), profile,
+                           platform).command(server)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class ProfileCache(object):
+    """
+    Resolved and validated profiles
+
+    A profile is only resolved again when its settings change or the
+    modification time of its directory or binary does, e.g. when the git
+    version is checked out or a release is updated.
+    """
+    def __init__(self, platform=None):
+        self.platform = platform
+        self._profiles = {}
+
+    def _stamp(self, profile):
+        return _mtime(profile.cwd), _mtime(profile.binary)
+
+    def get(self, config, name=DEFAULT_PROFILE):
+        settings = profile_settings(config, name)
+        key = tuple(sorted(settings.items()))
+        cached = self._profiles.get(name)
+        if cached is not None:
+            profile, cached_key, stamp = cached
+            if cached_key == key and stamp == self._stamp(profile):
+                return profile
+        profile = resolve_profile(settings, name, self.platform)
+        profile.validate()
+        self._profiles[name] = (profile, key, self._stamp(profile))
+        return profile
+
+    def clear(self):
+        self._profiles.clear()
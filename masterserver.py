@@ -0,0 +1,468 @@
+# XonoticSimpleStarter - Masterserver module
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import time
+import zlib
+
+from twisted.internet import defer
+from twisted.internet.error import TimeoutError
+from twisted.python import failure
+from twisted.internet.protocol import Protocol
+from twisted.web import error
+from twisted.web.client import Agent, ResponseDone
+from twisted.web.http import PotentialDataLoss
+from twisted.web.http_headers import Headers
+
+from metrics import registry
+
+
+class _BodyReceiver(Protocol):
+    """
+    Pass every chunk of a response body to 'consumer' as it arrives
+    """
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self.finished = defer.Deferred(lambda d: self.abort())
+
+    def abort(self):
+        if self.transport is not None:
+            self.transport.stopProducing()
+
+    def dataReceived(self, data):
+        if self.finished.called:
+            return
+        try:
+            self.consumer(data)
+        except Exception:
+            self.finished.errback()
+            self.abort()
+
+    def connectionLost(self, reason):
+        if self.finished.called:
+            return
+        if reason.check(ResponseDone, PotentialDataLoss):
+            self.finished.callback(None)
+        else:
+            self.finished.errback(reason)
+
+
+def receive_body(response, consumer):
+    """
+    Deliver the body of 'response' to 'consumer', fires when it is complete.
+    Cancelling the returned deferred aborts the transfer.
+    """
+    receiver = _BodyReceiver(consumer)
+    response.deliverBody(receiver)
+    return receiver.finished
+
+
+class FetchResult(object):
+    """
+    Transfer statistics of a single masterserver request
+    """
+    def __init__(self, url, code, received, decoded, duration,
+                 saved_bytes=0, saved_time=0.0):
+        self.url = url
+        self.code = code
+        self.received = received
+        self.decoded = decoded
+        self.duration = duration
+        self.saved_bytes = saved_bytes
+        self.saved_time = saved_time
+
+    @property
+    def not_modified(self):
+        return self.code == 304
+
+    def __str__(self):
+        return ("{} - {} bytes received ({} decoded) in {:.0f} ms, saved {} "
+                "bytes and {:.0f} ms".format(
+                    "not modified" if self.not_modified else "updated",
+                    self.received, self.decoded, self.duration * 1000,
+                    self.saved_bytes, self.saved_time * 1000))
+
+
+class MasterServer(object):
+    """
+    Client for the xml interface of dpmaster.deathmask.net
+
+    Responses are requested gzip compressed. For urls that were fetched
+    before, the request is made conditional with the ETag and Last-Modified
+    validators, so an unchanged list costs only a 304 response.
+    """
+    host = "dpmaster.deathmask.net"
+    base_url = "https://" + host + "/?game=xonotic&xml=1"
+
+    def __init__(self, reactor=None, timeout=10):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.reactor = reactor
+        self.timeout = timeout
+        self.agent = Agent(reactor)
+        # url -> {'etag': ..., 'last-modified': ...}
+        self.validators = {}
+        # url -> (decoded size, duration) of the last full download
+        self.last_download = {}
+
+    def list_url(self, light=False):
+        """
+        Url of the serverlist, a light list leaves out the players
+        """
+        if light:
+            return self.base_url
+        return self.base_url + "&showplayers=1"
+
+    def _headers(self, url, conditional):
+        headers = Headers({b'Accept-Encoding': [b'gzip'],
+                           b'User-Agent': [b'XonoticSimpleStarter']})
+        validators = self.validators.get(url, {})
+        if conditional and validators.get('etag'):
+            headers.addRawHeader(b'If-None-Match',
+                                 validators['etag'].encode("latin-1"))
+        if conditional and validators.get('last-modified'):
+            headers.addRawHeader(b'If-Modified-Since',
+                                 validators['last-modified'].encode("latin-1"))
+        return headers
+
+    def _store_validators(self, url, response):
+        validators = {}
+        for name in ('etag', 'last-modified'):
+            values = response.headers.getRawHeaders(name.encode("ascii"))
+            if values:
+                value = values[0]
+                if not isinstance(value, str):
+                    value = value.decode("latin-1")
+                validators[name] = value
+        if validators:
+            self.validators[url] = validators
+
+    @defer.inlineCallbacks
+    def fetch(self, url, consumer, conditional=True):
+        """
+        Request 'url' and pass the decoded body chunk by chunk to 'consumer'
+
+        Fires with a FetchResult. 'consumer' is not called at all if the
+        server answers with 304 Not Modified.
+        """
+        start = time.time()
+        d = self.agent.request(b'GET', url.encode("ascii"),
+                               self._headers(url, conditional))
+        timed_out = []
+
+        def cancel(d):
+            timed_out.append(True)
+            d.cancel()
+
+        timeout_call = self.reactor.callLater(self.timeout, cancel, d)
+        sizes = {'received': 0, 'decoded': 0}
+        try:
+            response = yield d
+            if response.code == 304:
+                yield receive_body(response, lambda data: None)
+            elif response.code >= 400:
+                yield receive_body(response, lambda data: None)
+                raise error.Error(response.code, response.phrase)
+            else:
+                encoding = response.headers.getRawHeaders(
+                    b'content-encoding', [b''])[0]
+                decoder = None
+                if encoding.lower() == b'gzip':
+                    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+                def chunk_received(data):
+                    sizes['received'] += len(data)
+                    if decoder is not None:
+                        data = decoder.decompress(data)
+                    sizes['decoded'] += len(data)
+                    consumer(data)
+
+                d = receive_body(response, chunk_received)
+                timeout_call.cancel()
+                timeout_call = self.reactor.callLater(self.timeout, cancel, d)
+                yield d
+                if decoder is not None:
+                    rest = decoder.flush()
+                    sizes['decoded'] += len(rest)
+                    if rest:
+                        consumer(rest)
+        except defer.CancelledError:
+            if timed_out:
+                raise TimeoutError("Request for {} timed out".format(url))
+            raise
+        finally:
+            if timeout_call.active():
+                timeout_call.cancel()
+        duration = time.time() - start
+        self._store_validators(url, response)
+        if response.code == 304:
+            decoded, full_duration = self.last_download.get(url, (0, 0.0))
+            result = FetchResult(url, response.code, 0, 0, duration,
+                                 saved_bytes=decoded,
+                                 saved_time=max(full_duration - duration, 0))
+        else:
+            self.last_download[url] = (sizes['decoded'], duration)
+            result = FetchResult(url, response.code, sizes['received'],
+                                 sizes['decoded'], duration,
+                                 saved_bytes=sizes['decoded'] -
+                                 sizes['received'])
+        registry.timer('masterserver.fetch').record(duration)
+        registry.counter('masterserver.bytes_received').inc(result.received)
+        registry.counter('masterserver.bytes_decoded').inc(result.decoded)
+        if result.not_modified:
+            registry.counter('masterserver.not_modified').inc()
+        defer.returnValue(result)
+
+
+class RequestManager(object):
+    """
+    Coalesce, supersede and retry requests
+
+    Requests with the same key share one in-flight attempt. A new request in
+    a channel cancels the request of that channel that is still running with
+    another key. Failed attempts are retried after a capped exponential
+    backoff with jitter, so clients don't retry in lockstep. 'on_retry' is
+    called with (key, delay, failure) whenever a retry is scheduled.
+    """
+    def __init__(self, reactor=None, base_delay=5.0, max_delay=300.0,
+                 max_retries=None, on_retry=None):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.reactor = reactor
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.on_retry = on_retry
+        # key -> request state
+        self._requests = {}
+        # channel -> key
+        self._channels = {}
+
+    @property
+    def pending(self):
+        """
+        Number of requests with an attempt in flight
+        """
+        return sum(1 for request in self._requests.values()
+                   if request['attempt_deferred'] is not None)
+
+    @property
+    def retrying(self):
+        """
+        Number of requests that wait for their next attempt
+        """
+        return sum(1 for request in self._requests.values()
+                   if request['timer'] is not None)
+
+    def backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def request(self, key, function, args=(), channel=None):
+        """
+        Run function(*args) unless a request with the same key is running
+
+        The returned deferred fires with the result of the first successful
+        attempt. It fails with CancelledError if the request is superseded.
+        """
+        if channel is not None:
+            running = self._channels.get(channel)
+            if running is not None and running != key:
+                self.cancel(running)
+            self._channels[channel] = key
+        waiter = defer.Deferred()
+        request = self._requests.get(key)
+        if request is None:
+            request = {'key': key, 'function': function, 'args': args,
+                       'channel': channel, 'attempt': 0, 'waiters': [waiter],
+                       'attempt_deferred': None, 'timer': None}
+            self._requests[key] = request
+            self._attempt(request)
+        else:
+            request['waiters'].append(waiter)
+            if request['timer'] is not None:
+                # asked for again while waiting for a retry: don't wait
+                request['timer'].cancel()
+                request['timer'] = None
+                self._attempt(request)
+        return waiter
+
+    def cancel(self, key):
+        request = self._requests.get(key)
+        if request is None:
+            return
+        if request['timer'] is not None:
+            request['timer'].cancel()
+            request['timer'] = None
+        attempt_deferred = request['attempt_deferred']
+        self._finish(request, failure.Failure(defer.CancelledError()))
+        if attempt_deferred is not None:
+            attempt_deferred.cancel()
+
+    def cancel_all(self):
+        for key in list(self._requests):
+            self.cancel(key)
+
+    def _attempt(self, request):
+        d = defer.maybeDeferred(request['function'], *request['args'])
+        request['attempt_deferred'] = d
+        d.addCallbacks(self._succeeded, self._failed,
+                       callbackArgs=(request, d), errbackArgs=(request, d))
+
+    def _succeeded(self, result, request, d):
+        if request['attempt_deferred'] is d:
+            self._finish(request, result)
+
+    def _failed(self, reason, request, d):
+        if request['attempt_deferred'] is not d:
+            # cancelled or superseded
+            return
+        request['attempt_deferred'] = None
+        if (self.max_retries is not None and
+                request['attempt'] >= self.max_retries):
+            self._finish(request, reason)
+            return
+        delay = self.backoff(request['attempt'])
+        request['attempt'] += 1
+        request['timer'] = self.reactor.callLater(delay, self._retry, request)
+        if self.on_retry is not None:
+            self.on_retry(request['key'], delay, reason)
+
+    def _retry(self, request):
+        request['timer'] = None
+        self._attempt(request)
+
+    def _finish(self, request, result):
+        request['attempt_deferred'] = None
+        if self._requests.get(request['key']) is request:
+            del self._requests[request['key']]
+        if self._channels.get(request['channel']) == request['key']:
+            del self._channels[request['channel']]
+        waiters, request['waiters'] = request['waiters'], []
+        for waiter in waiters:
+            if waiter.called:
+                # cancelled by the caller
+                continue
+            if isinstance(result, failure.Failure):
+                waiter.errback(result)
+            else:
+                waiter.callback(result)
+
+
+class RefreshScheduler(object):
+    """
+    Run refresh jobs periodically
+
+    Every job has its own interval in seconds, 0 disables it. While the user
+    is not looking at the list ('active' is False) all intervals are
+    multiplied by 'idle_factor'. When the user comes back, jobs that are due
+    by their normal interval run right away. A job is not started again
+    before the deferred it returned has fired.
+    """
+    def __init__(self, reactor=None, idle_factor=4.0):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.reactor = reactor
+        self.idle_factor = idle_factor
+        self.active = True
+        # name -> job state
+        self._jobs = {}
+
+    def add(self, name, function, interval):
+        """
+        Run 'function' every 'interval' seconds, the first time after one
+        interval
+        """
+        self._jobs[name] = {'name': name, 'function': function,
+                            'interval': interval,
+                            'last': self.reactor.seconds(), 'timer': None,
+                            'running': False}
+        self._schedule(self._jobs[name])
+
+    def set_interval(self, name, interval):
+        job = self._jobs[name]
+        job['interval'] = interval
+        self._schedule(job)
+
+    def set_active(self, active):
+        if active == self.active:
+            return
+        self.active = active
+        for job in self._jobs.values():
+            self._schedule(job)
+
+    def run_now(self, name):
+        """
+        Run a job right away, its interval starts again afterwards
+
+        A job that is still running is called again. Jobs that go through a
+        RequestManager share the running request that way, and a request
+        that waits for its retry is attempted right away.
+        """
+        job = self._jobs[name]
+        if not job['running']:
+            self._run(job)
+            return
+        job['last'] = self.reactor.seconds()
+        d = defer.maybeDeferred(job['function'])
+        # the running call reports the failures of the shared request
+        d.addErrback(lambda reason: None)
+
+    def next_run(self, name):
+        """
+        Seconds until the job runs next, None if it is not scheduled
+        """
+        timer = self._jobs[name]['timer']
+        if timer is None:
+            return None
+        return max(timer.getTime() - self.reactor.seconds(), 0)
+
+    def stop(self):
+        for job in self._jobs.values():
+            if job['timer'] is not None:
+                job['timer'].cancel()
+                job['timer'] = None
+
+    def _interval(self, job):
+        if self.active:
+            return job['interval']
+        return job['interval'] * self.idle_factor
+
+    def _schedule(self, job):
+        if job['timer'] is not None:
+            job['timer'].cancel()
+            job['timer'] = None
+        if job['interval'] <= 0 or job['running']:
+            return
+        delay = job['last'] + self._interval(job) - self.reactor.seconds()
+        job['timer'] = self.reactor.callLater(max(delay, 0), self._run, job)
+
+    def _run(self, job):
+        if job['timer'] is not None:
+            if job['timer'].active():
+                job['timer'].cancel()
+            job['timer'] = None
+        job['running'] = True
+        job['last'] = self.reactor.seconds()
+        d = defer.maybeDeferred(job['function'])
+        d.addBoth(self._done, job)
+
+    def _done(self, result, job):
+        job['running'] = False
+        self._schedule(job)
+        if isinstance(result, failure.Failure) and not result.check(
+                defer.CancelledError):
+            return result
@@ -0,0 +1,303 @@
+# XonoticSimpleStarter - Metrics
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class FrameTimer(object):
+    """
+    Collect the time between frames while something runs in the background
+
+    'tick' is meant to be scheduled on every frame, it is called with the
+    time since the last frame. A frame longer than 'budget' seconds is
+    counted as slow.
+    """
+    def __init__(self, budget=1 / 30.0):
+        self.budget = budget
+        self.frames = []
+
+    def start(self):
+        self.frames = []
+
+    def tick(self, dt):
+        self.frames.append(dt)
+
+    @property
+    def longest(self):
+        return max(self.frames) if self.frames else 0.0
+
+    @property
+    def slow(self):
+        return sum(1 for dt in self.frames if dt > self.budget)
+
+    def __str__(self):
+        return "{} frames, longest {:.0f} ms, {} slower than {:.0f} ms".format(
+            len(self.frames), self.longest * 1000, self.slow,
+            self.budget * 1000)
+
+
+class StartupTimeline(object):
+    """
+    Time of every phase of the startup
+
+    'mark' ends the current phase, its duration is the time since the
+    previous mark or since the timeline was created.
+    """
+    def __init__(self, start=None):
+        self.start = time.time() if start is None else start
+        # list of (phase, time at its end)
+        self.marks = []
+
+    def mark(self, phase, now=None):
+        self.marks.append((phase, time.time() if now is None else now))
+
+    def has(self, phase):
+        return any(name == phase for name, end in self.marks)
+
+    def elapsed(self, now=None):
+        return (time.time() if now is None else now) - self.start
+
+    def phases(self):
+        """
+        List of (phase, duration in seconds)
+        """
+        result = []
+        previous = self.start
+        for phase, end in self.marks:
+            result.append((phase, end - previous))
+            previous = end
+        return result
+
+    def __str__(self):
+        total = self.marks[-1][1] - self.start if self.marks else 0.0
+        return "{}, total {:.0f} ms".format(
+            ", ".join("{} {:.0f} ms".format(phase, duration * 1000)
+                      for phase, duration in self.phases()),
+            total * 1000)
+
+
+class Counter(object):
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def summary(self, elapsed):
+        return {'value': self.value,
+                'rate': self.value / elapsed if elapsed > 0 else 0.0}
+
+
+class Histogram(object):
+    """
+    Distribution of recorded values
+
+    Count, sum, minimum and maximum cover every value, the percentiles only
+    the last 'window' ones.
+    """
+    def __init__(self, window=1000):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def record(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, fraction):
+        if not self.values:
+            return None
+        values = sorted(self.values)
+        return values[min(int(fraction * len(values)), len(values) - 1)]
+
+    def summary(self, elapsed=None):
+        return {'count': self.count, 'sum': self.total,
+                'mean': self.total / self.count if self.count else None,
+                'min': self.minimum, 'max': self.maximum,
+                'p50': self.percentile(0.5), 'p90': self.percentile(0.9),
+                'p99': self.percentile(0.99)}
+
+
+class Timer(Histogram):
+    """
+    Histogram of durations in seconds
+
+        with registry.timer('serverlist.update').time():
+            ...
+    """
+    @contextmanager
+    def time(self):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(time.time() - start)
+
+
+class Registry(object):
+    """
+    Named counters, timers and histograms
+
+    Metrics are created on first use. Not thread safe, values have to be
+    recorded from the reactor thread.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.metrics = {}
+
+    def _get(self, name, cls):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls()
+        return metric
+
+    def counter(self, name):
+        return self._get(name, Counter)
+
+    def histogram(self, name):
+        return self._get(name, Histogram)
+
+    def timer(self, name):
+        return self._get(name, Timer)
+
+    def snapshot(self):
+        elapsed = time.time() - self.started
+        return {'uptime': elapsed,
+                'metrics': dict((name, dict(metric.summary(elapsed),
+                                            type=type(metric).__name__))
+                                for name, metric in self.metrics.items())}
+
+    def dump(self, path, extra=None):
+        """
+        Write the snapshot as JSON to 'path'
+        """
+        data = self.snapshot()
+        data.update(extra or {})
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path + ".tmp", path)
+
+    def lines(self):
+        """
+        Human readable summary, one line per metric
+        """
+        elapsed = time.time() - self.started
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            summary = metric.summary(elapsed)
+            if isinstance(metric, Counter):
+                lines.append("{}: {} ({:.2f}/s)".format(
+                    name, summary['value'], summary['rate']))
+            elif not summary['count']:
+                lines.append("{}: -".format(name))
+            elif isinstance(metric, Timer):
+                lines.append("{}: {} x, mean {:.2f} ms, p90 {:.2f} ms, max "
+                             "{:.2f} ms".format(
+                                 name, summary['count'],
+                                 summary['mean'] * 1000,
+                                 summary['p90'] * 1000,
+                                 summary['max'] * 1000))
+            else:
+                lines.append("{}: {} x, mean {:.1f}, p90 {}, max {}".format(
+                    name, summary['count'], summary['mean'], summary['p90'],
+                    summary['max']))
+        return lines
+
+
+# shared by the whole starter
+registry = Registry()
+
+
+class TimedMembership(object):
+    """
+    Wrap a container and add up the time spent in 'in' checks
+    """
+    def __init__(self, container):
+        self.container = container
+        self.duration = 0.0
+
+    def __contains__(self, item):
+        start = time.time()
+        try:
+            return item in self.container
+        finally:
+            self.duration += time.time() - start
+
+
+class Profiler(object):
+    """
+    Named cProfile sessions
+
+    Only one session runs at a time, starting another one while it runs is
+    ignored. A finished session is written to 'directory' as
+    <name>-<number>.prof and as text, sorted by cumulative time.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._running = None
+        self._profile = None
+        self._sessions = 0
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self, name):
+        if self._running is not None:
+            return False
+        import cProfile
+        self._profile = cProfile.Profile()
+        self._running = name
+        self._profile.enable()
+        return True
+
+    def stop(self, name):
+        """
+        Stop the session 'name' and return the path of its stats
+        """
+        if self._running != name:
+            return None
+        self._profile.disable()
+        import pstats
+        self._sessions += 1
+        directory = self.directory or os.getcwd()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, "{}-{}.prof".format(name,
+                                                           self._sessions))
+        self._profile.dump_stats(path)
+        with open(path[:-len(".prof")] + ".txt", "w") as f:
+            pstats.Stats(path, stream=f).sort_stats(
+                'cumulative').print_stats(40)
+        self._running = None
+        self._profile = None
+        return path
@@ -0,0 +1,143 @@
+# XonoticSimpleStarter - Quick join
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Pick the best server to join
+
+The listed servers are ranked by what the serverlist knows about them, the
+best ones are asked for their current players and latency at the same
+time. The best answer that arrives within the time budget wins.
+"""
+
+from twisted.internet import defer
+
+from dpmaster import record_from_info
+from metrics import registry
+
+CANDIDATES = 8
+# seconds until the decision is made
+BUDGET = 1.0
+# ping in ms that is assumed for servers that were not measured yet
+UNKNOWN_PING = 150
+# a player more on the server is worth this many ms of ping
+PLAYER_WEIGHT = 15.0
+# free slots up to this many are worth FREE_SLOT_WEIGHT ms each, a full
+# server is never picked
+FREE_SLOTS = 3
+FREE_SLOT_WEIGHT = 10.0
+
+
+def score(record, ping=None):
+    """
+    Rank of 'record', higher is better. None if it can't be joined.
+    """
+    free = record.maxplayers - record.numplayers
+    if free <= 0 or record.status != 'UP':
+        return None
+    if ping is None:
+        ping = record.ping if record.ping is not None else UNKNOWN_PING
+    return (record.numplayers * PLAYER_WEIGHT +
+            min(free, FREE_SLOTS) * FREE_SLOT_WEIGHT - ping)
+
+
+def candidates(records, limit=CANDIDATES):
+    """
+    The 'limit' best of 'records' by what is known about them
+    """
+    scored = []
+    for record in records:
+        value = score(record)
+        if value is not None:
+            scored.append((value, record))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [record for value, record in scored[:limit]]
+
+
+class QuickJoin(object):
+    """
+    Probe the best candidates of a serverlist concurrently and pick one
+
+    'query' is a dpmaster.DarkPlacesQuery, its 'getinfo' answers carry the
+    current number of players and measure the latency at once.
+    """
+    def __init__(self, query, budget=BUDGET, limit=CANDIDATES):
+        self.query = query
+        self.reactor = query.reactor
+        self.budget = budget
+        self.limit = limit
+
+    def pick(self, records):
+        """
+        Fires with (record, probed) of the best server within the budget,
+        the record is updated with the answer of the server. If no candidate
+        answered in time, the best one by the known state is picked and
+        'probed' is False. Fires with None if no server can be joined.
+        """
+        chosen = candidates(records, self.limit)
+        if not chosen:
+            return defer.succeed(None)
+        start = self.reactor.seconds()
+        done = defer.Deferred()
+        answers = []
+        settled = []
+
+        def answered(result, record):
+            if done.called:
+                return
+            rtt, info = result
+            try:
+                current = record_from_info(record.address, info)
+            except ValueError:
+                return
+            answers.append(record.replace(
+                numplayers=current.numplayers,
+                maxplayers=current.maxplayers,
+                ping=int(round(rtt * 1000))))
+
+        def probed(result):
+            # no need to wait for the budget once every server answered or
+            # failed
+            settled.append(result)
+            if len(settled) == len(chosen):
+                finish()
+
+        def finish():
+            if done.called:
+                return
+            if timer.active():
+                timer.cancel()
+            registry.timer('quickjoin.decision').record(
+                self.reactor.seconds() - start)
+            registry.histogram('quickjoin.answers').record(len(answers))
+            ranked = [(score(record, record.ping), record)
+                      for record in answers]
+            ranked = [item for item in ranked if item[0] is not None]
+            if ranked:
+                done.callback((max(ranked, key=lambda item: item[0])[1],
+                               True))
+            elif not answers:
+                done.callback((chosen[0], False))
+            else:
+                # everyone who answered is full by now
+                done.callback(None)
+
+        timer = self.reactor.callLater(self.budget, finish)
+        for record in chosen:
+            d = self.query.ping(record.address)
+            d.addCallback(answered, record)
+            d.addErrback(lambda reason: None)
+            d.addCallback(probed)
+        return done
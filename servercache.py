@@ -0,0 +1,101 @@
+# XonoticSimpleStarter - Serverlist cache
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import time
+import zlib
+
+from serverlist import ServerRecord
+
+
+class ServerCache(object):
+    """
+    Compressed on-disk copy of the last good serverlist and favourites
+
+    A cache older than 'max_age' seconds is evicted when it is loaded.
+    A 'max_age' of 0 disables the cache.
+    """
+    # 3: servers that are not UP are left out
+    VERSION = 3
+
+    def __init__(self, path, max_age=24 * 3600):
+        self.path = path
+        self.max_age = max_age
+
+    @property
+    def enabled(self):
+        return self.max_age > 0
+
+    def load(self, now=None):
+        """
+        Return (saved, servers, favourites, validators) or None if there is
+        no usable cache. 'servers' is a list of ServerRecords, 'favourites'
+        a list of (address, ServerRecord) and 'validators' are the http
+        cache validators of the masterserver urls.
+        """
+        if not self.enabled:
+            self.clear()
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                data = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+        except (IOError, OSError, ValueError, zlib.error):
+            return None
+        if data.get('version') != ServerCache.VERSION:
+            self.clear()
+            return None
+        now = time.time() if now is None else now
+        if now - data['saved'] > self.max_age:
+            self.clear()
+            return None
+        return (data['saved'],
+                [ServerRecord.from_tuple(values)
+                 for values in data['servers']],
+                [(address, ServerRecord.from_tuple(values))
+                 for address, values in data['favourites']],
+                data.get('validators', {}))
+
+    def store(self, servers, favourites, validators=None, now=None):
+        """
+        Write the given ServerRecords and (address, ServerRecord) of the
+        favourites to the cache file
+        """
+        if not self.enabled:
+            return
+        data = {'version': ServerCache.VERSION,
+                'saved': time.time() if now is None else now,
+                'servers': [record.to_tuple() for record in servers],
+                'favourites': [(address, record.to_tuple())
+                               for address, record in favourites],
+                'validators': validators or {}}
+        payload = zlib.compress(json.dumps(
+            data, separators=(",", ":")).encode("utf-8"))
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # write to a temporary file first, a crash must not leave a
+        # truncated cache behind
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
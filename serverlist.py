@@ -0,0 +1,708 @@
+# XonoticSimpleStarter - Serverlist module
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import re
+from xml.etree import cElementTree as ElementTree
+
+
+_interned = {}
+
+
+def _intern(text):
+    """
+    Share one string object for every distinct value, works for str and
+    unicode alike
+    """
+    return _interned.setdefault(text, text)
+
+
+def mod_category(mod):
+    """
+    Category of the serverlist a mod belongs to
+    """
+    if mod in ('Xonotic', 'Xpm'):
+        return 'vanilla'
+    elif mod == 'Instagib':
+        return 'insta'
+    elif mod == 'Overkill':
+        return 'ok'
+    elif mod == 'Xdf':
+        return 'xdf'
+    return 'other'
+
+
+class ServerRecord(object):
+    """
+    State of a single server
+
+    'type' is one of GAMESERVER, MASTERSERVER or BLOCKED. Gametype, version
+    and mod are interned as there are only a few distinct values, the
+    category of the mod is computed once. 'ping' is the measured latency in
+    milliseconds, it is not part of the serialized tuple.
+    """
+    __slots__ = ('address', 'type', 'status', 'name', 'numplayers',
+                 'maxplayers', 'gametype', 'version', 'mod', 'category',
+                 'ping')
+
+    FIELDS = __slots__
+
+    def __init__(self, address, type='GAMESERVER', status='UP', name="",
+                 numplayers=0, maxplayers=0, gametype="??", version="??",
+                 mod="??", ping=None):
+        self.address = address
+        self.type = type
+        self.status = status
+        self.name = name
+        self.numplayers = numplayers
+        self.maxplayers = maxplayers
+        self.gametype = _intern(gametype)
+        self.version = _intern(version)
+        self.mod = _intern(mod)
+        self.category = mod_category(mod)
+        self.ping = ping
+
+    def __eq__(self, other):
+        return (isinstance(other, ServerRecord) and
+                self.to_tuple() == other.to_tuple())
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "ServerRecord({})".format(", ".join(
+            "{}={!r}".format(field, getattr(self, field))
+            for field in ServerRecord.FIELDS))
+
+    def to_tuple(self):
+        return (self.address, self.type, self.status, self.name,
+                self.numplayers, self.maxplayers, self.gametype,
+                self.version, self.mod)
+
+    @classmethod
+    def from_tuple(cls, values):
+        return cls(*values)
+
+    def replace(self, **fields):
+        """
+        Return a copy with the given fields changed. Records are shared
+        between collections and must not be changed in place.
+        """
+        values = dict((field, getattr(self, field))
+                      for field in ServerRecord.FIELDS if field != 'category')
+        values.update(fields)
+        return ServerRecord(**values)
+
+
+def _name_key(record):
+    return record.name.lower()
+
+
+def _numplayers_key(record):
+    return -record.numplayers
+
+
+def _maxplayers_key(record):
+    return -record.maxplayers
+
+
+def _gametype_key(record):
+    return record.gametype.lower()
+
+
+def _ping_key(record):
+    # servers without a ping go last
+    return (record.ping is None, record.ping)
+
+
+class SortedServers(object):
+    """
+    ServerRecords by address that are iterated in the order of 'sort_key'
+
+    One sorted list of (key, address) is kept for every sort key that was
+    used so far. Adding, replacing or removing a single record updates those
+    lists with a binary search instead of sorting everything again, and
+    switching back to a sort key that was used before costs nothing.
+    Players are sorted in descending order, ties are broken by address.
+    """
+    SORT_KEYS = {'name': _name_key, 'numplayers': _numplayers_key,
+                 'maxplayers': _maxplayers_key, 'gametype': _gametype_key,
+                 'ping': _ping_key}
+
+    def __init__(self, items=(), sort_key='name'):
+        self._records = {}
+        # sort key -> sorted list of (key, address)
+        self._orders = {}
+        self._sort_key = None
+        for address, record in items:
+            self._records[address] = record
+        self.sort_key = sort_key
+
+    @property
+    def sort_key(self):
+        return self._sort_key
+
+    @sort_key.setter
+    def sort_key(self, sort_key):
+        if sort_key not in SortedServers.SORT_KEYS:
+            raise KeyError("Unknown sort key: {}".format(sort_key))
+        self._sort_key = sort_key
+        if sort_key not in self._orders:
+            function = SortedServers.SORT_KEYS[sort_key]
+            self._orders[sort_key] = sorted(
+                (function(record), address)
+                for address, record in self._records.items())
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, address):
+        return address in self._records
+
+    def __getitem__(self, address):
+        return self._records[address]
+
+    def get(self, address, default=None):
+        return self._records.get(address, default)
+
+    def __setitem__(self, address, record):
+        if address in self._records:
+            self._remove_keys(address, self._records[address])
+        self._records[address] = record
+        for sort_key, order in self._orders.items():
+            bisect.insort(order, (SortedServers.SORT_KEYS[sort_key](record),
+                                  address))
+
+    def __delitem__(self, address):
+        self._remove_keys(address, self._records.pop(address))
+
+    def _remove_keys(self, address, record):
+        for sort_key, order in self._orders.items():
+            entry = (SortedServers.SORT_KEYS[sort_key](record), address)
+            del order[bisect.bisect_left(order, entry)]
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        return (address for key, address in self._orders[self._sort_key])
+
+    def values(self):
+        records = self._records
+        return (records[address]
+                for key, address in self._orders[self._sort_key])
+
+    def items(self):
+        records = self._records
+        return ((address, records[address])
+                for key, address in self._orders[self._sort_key])
+
+
+def diff_servers(old, new):
+    """
+    Compare two collections of ServerRecords by address
+
+    Returns the lists of added, removed and changed addresses. Records are
+    compared without their ping.
+    """
+    added = []
+    changed = []
+    for address in new:
+        record = old.get(address)
+        if record is None:
+            added.append(address)
+        elif record != new[address]:
+            changed.append(address)
+    removed = [address for address in old if address not in new]
+    return added, removed, changed
+
+
+def split_host_port(address):
+    """
+    Split 'host:port' or '[ipv6]:port' into (host, port), port may be None
+    """
+    if address.startswith("["):
+        host, _, rest = address[1:].partition("]")
+        port = rest[1:] if rest.startswith(":") else None
+        return host, port or None
+    if address.count(":") == 1:
+        host, port = address.split(":")
+        return host, port or None
+    return address, None
+
+
+def _parse_ipv4(text):
+    octets = text.split(".")
+    if len(octets) != 4:
+        raise ValueError("Invalid IPv4 address: {}".format(text))
+    value = 0
+    for octet in octets:
+        if not octet.isdigit() or int(octet) > 255:
+            raise ValueError("Invalid IPv4 address: {}".format(text))
+        value = (value << 8) | int(octet)
+    return value
+
+
+def _parse_ipv6(text):
+    text = text.split("%", 1)[0]
+    groups = text.split(":")
+    # embedded IPv4 address like ::ffff:1.2.3.4
+    tail = []
+    if "." in groups[-1]:
+        ipv4 = _parse_ipv4(groups.pop())
+        tail = ["{:x}".format(ipv4 >> 16), "{:x}".format(ipv4 & 0xffff)]
+    text = ":".join(groups + tail)
+    head, separator, rest = text.partition("::")
+    head = head.split(":") if head else []
+    rest = rest.split(":") if rest else []
+    if separator:
+        missing = 8 - len(head) - len(rest)
+        if missing < 1:
+            raise ValueError("Invalid IPv6 address: {}".format(text))
+        groups = head + ["0"] * missing + rest
+    else:
+        groups = head
+    if len(groups) != 8:
+        raise ValueError("Invalid IPv6 address: {}".format(text))
+    value = 0
+    for group in groups:
+        if not 1 <= len(group) <= 4:
+            raise ValueError("Invalid IPv6 address: {}".format(text))
+        value = (value << 16) | int(group, 16)
+    return value
+
+
+def parse_ip(text):
+    """
+    Turn an IPv4 or IPv6 address into (bits, integer)
+    """
+    if ":" in text:
+        return 128, _parse_ipv6(text)
+    return 32, _parse_ipv4(text)
+
+
+class BlockList(object):
+    """
+    Index of blocked servers
+
+    Entries can be addresses with or without port ('1.2.3.4:26000',
+    '1.2.3.4', '[2001:db8::1]'), CIDR networks ('1.2.3.0/24',
+    '2001:db8::/32') and IPv4 prefixes with a trailing dot ('1.2.3.').
+    An address without port blocks all ports of that host. Networks are
+    stored in one set per prefix length, so a lookup needs at most one set
+    lookup per bit of the address instead of a scan over all entries.
+    """
+    def __init__(self, entries=()):
+        # exact 'host:port' entries and hosts that are not ip addresses
+        self._addresses = set()
+        self._hosts = set()
+        # address bits -> prefix length -> set of network numbers
+        self._networks = {32: {}, 128: {}}
+        self._prefixlens = {32: [], 128: []}
+        self._count = 0
+        # entries of checkupdate.txt that could not be parsed
+        self.invalid = []
+        for entry in entries:
+            self.add(entry)
+
+    @classmethod
+    def from_checkupdate(cls, filepath):
+        """
+        Read the 'B' lines of Xonotic's checkupdate.txt
+        """
+        blocklist = cls()
+        with open(filepath) as f:
+            for line in f:
+                if line.startswith("B"):
+                    try:
+                        blocklist.add(line[1:].strip())
+                    except ValueError:
+                        blocklist.invalid.append(line[1:].strip())
+        return blocklist
+
+    def __len__(self):
+        return self._count
+
+    def add(self, entry):
+        entry = entry.strip()
+        if not entry:
+            return
+        self._add(entry)
+        self._count += 1
+
+    def _add(self, entry):
+        if "/" in entry:
+            network, _, prefixlen = entry.partition("/")
+            bits, value = parse_ip(network.strip("[]"))
+            self._add_network(bits, value, int(prefixlen))
+            return
+        if entry.endswith(".") and ":" not in entry:
+            # legacy IPv4 prefix like '1.2.3.'
+            octets = entry.rstrip(".").split(".")
+            padded = ".".join(octets + ["0"] * (4 - len(octets)))
+            self._add_network(32, _parse_ipv4(padded), 8 * len(octets))
+            return
+        host, port = split_host_port(entry)
+        try:
+            bits, value = parse_ip(host)
+        except ValueError:
+            # host names and crypto fingerprints
+            if port is None:
+                self._hosts.add(host)
+            else:
+                self._addresses.add(entry)
+            return
+        if port is None:
+            self._add_network(bits, value, bits)
+        else:
+            self._addresses.add(self._key(bits, value, port))
+
+    def _add_network(self, bits, value, prefixlen):
+        if not 0 <= prefixlen <= bits:
+            raise ValueError("Invalid prefix length {}".format(prefixlen))
+        networks = self._networks[bits]
+        if prefixlen not in networks:
+            networks[prefixlen] = set()
+            self._prefixlens[bits] = sorted(networks)
+        networks[prefixlen].add(value >> (bits - prefixlen))
+
+    @staticmethod
+    def _key(bits, value, port):
+        return (bits, value, str(port))
+
+    def __contains__(self, address):
+        host, port = split_host_port(address)
+        try:
+            bits, value = parse_ip(host)
+        except ValueError:
+            return host in self._hosts or address in self._addresses
+        if port is not None and (
+                self._key(bits, value, port) in self._addresses):
+            return True
+        networks = self._networks[bits]
+        for prefixlen in self._prefixlens[bits]:
+            if value >> (bits - prefixlen) in networks[prefixlen]:
+                return True
+        return False
+
+
+def parse_qcstatus(qcstatus):
+    """
+    Extract gametype, version and mod from the 'qcstatus' rule of a server
+    """
+    gametype = version = mod = "??"
+    if qcstatus:
+        rules = qcstatus.split(":")
+        try:
+            gametype = rules[0]
+            version = rules[1]
+            mod = rules[5][1:].capitalize()
+        except IndexError:
+            # Some servers do not properly report qcstatus
+            pass
+    return gametype, version, mod
+
+
+# ^0-^9 and ^xRGB, '^^' is an escaped caret
+_COLOR_CODE = re.compile(r"\^(\^|[0-9]|x[0-9a-fA-F]{3})")
+
+
+def _replace_color_code(match):
+    return "^" if match.group(1) == "^" else ""
+
+
+def strip_colors(text):
+    """
+    Remove the DarkPlaces color codes from 'text'
+    """
+    return _COLOR_CODE.sub(_replace_color_code, text or "")
+
+
+def search_text(text):
+    """
+    Case fold 'text' and strip the DarkPlaces color codes from it
+    """
+    text = strip_colors(text)
+    try:
+        return text.casefold()
+    except AttributeError:
+        # python 2
+        return text.lower()
+
+
+def trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class SearchIndex(object):
+    """
+    Substring search over server names
+
+    Names are normalized with search_text once when they are added and every
+    trigram of a name points to the addresses that contain it. A query of
+    three or more characters only checks the servers that have all trigrams
+    of the query. A query that extends the previous one only checks the
+    previous result.
+    """
+    def __init__(self, servers=()):
+        # address -> normalized name
+        self.names = {}
+        # trigram -> set of addresses
+        self._postings = {}
+        # (query, matching addresses) of the last search
+        self._last = None
+        for address, name in servers:
+            self.add(address, name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, address, name):
+        name = search_text(name)
+        old = self.names.get(address)
+        if old == name:
+            return
+        if old is not None:
+            self.remove(address)
+        self.names[address] = name
+        for trigram in trigrams(name):
+            self._postings.setdefault(trigram, set()).add(address)
+        self._last = None
+
+    def remove(self, address):
+        name = self.names.pop(address, None)
+        if name is None:
+            return
+        for trigram in trigrams(name):
+            postings = self._postings[trigram]
+            postings.discard(address)
+            if not postings:
+                del self._postings[trigram]
+        self._last = None
+
+    def estimate(self, query):
+        """
+        Upper bound of the number of addresses 'search' has to check
+        """
+        query = search_text(query).strip()
+        if self._last is not None and self._last[0] in query:
+            return len(self._last[1])
+        if len(query) >= 3:
+            return min(len(self._postings.get(trigram, ()))
+                       for trigram in trigrams(query))
+        return len(self.names)
+
+    def search(self, query):
+        """
+        Return the set of addresses whose name contains 'query', or None if
+        the query is empty and everything matches
+        """
+        query = search_text(query).strip()
+        if not query:
+            return None
+        if self._last is not None and self._last[0] in query:
+            candidates = self._last[1]
+        elif len(query) >= 3:
+            postings = sorted((self._postings.get(trigram, ())
+                               for trigram in trigrams(query)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            candidates = self.names
+        names = self.names
+        result = set(address for address in candidates
+                     if query in names[address])
+        self._last = (query, result)
+        return result
+
+
+class PlayerIndex(object):
+    """
+    Find the servers players are on by their name
+
+    Names are normalized with search_text. A prefix lookup bisects the
+    sorted distinct names, a substring lookup only checks the names that
+    have all trigrams of the query, like SearchIndex does for servers.
+    """
+    def __init__(self, players=()):
+        # normalized name -> set of addresses
+        self.servers = {}
+        # normalized name -> name without colors, as it was first seen
+        self.display = {}
+        # trigram -> set of normalized names
+        self._postings = {}
+        self._sorted = None
+        self.count = 0
+        for address, names in players:
+            self.add(address, names)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, address, names):
+        """
+        Add the players 'names' of the server 'address'
+        """
+        for name in names:
+            key = search_text(name).strip()
+            if not key:
+                continue
+            self.count += 1
+            addresses = self.servers.get(key)
+            if addresses is None:
+                addresses = self.servers[key] = set()
+                self.display[key] = strip_colors(name).strip()
+                for trigram in trigrams(key):
+                    self._postings.setdefault(trigram, set()).add(key)
+                self._sorted = None
+            addresses.add(address)
+
+    def exact(self, name):
+        """
+        Addresses of the servers a player called 'name' is on
+        """
+        return self.servers.get(search_text(name).strip(), set())
+
+    def prefix(self, query):
+        """
+        Sorted normalized names that start with 'query'
+        """
+        query = search_text(query).strip()
+        if self._sorted is None:
+            self._sorted = sorted(self.servers)
+        names = self._sorted
+        result = []
+        for i in range(bisect.bisect_left(names, query), len(names)):
+            if not names[i].startswith(query):
+                break
+            result.append(names[i])
+        return result
+
+    def substring(self, query):
+        """
+        Normalized names that contain 'query'
+        """
+        query = search_text(query).strip()
+        if len(query) >= 3:
+            postings = sorted((self._postings.get(trigram, ())
+                               for trigram in trigrams(query)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            candidates = self.servers
+        return [name for name in candidates if query in name]
+
+    def search(self, query):
+        """
+        Names for 'query', a trailing '*' only matches the start of the
+        names. Returns a dict that maps the names without colors to the
+        addresses of their servers.
+        """
+        query = query.strip()
+        if query.endswith("*"):
+            names = self.prefix(query[:-1])
+        else:
+            names = self.substring(query)
+        return dict((self.display[name], self.servers[name])
+                    for name in names)
+
+
+def player_names(server):
+    """
+    Names of the players of the xml Element 'server'
+    """
+    return [element.text or "" for element in
+            server.findall('players/player/name')]
+
+
+def record_from_element(server, blocklist=(), masterserver=None):
+    """
+    Turn the xml Element 'server' into (address, ServerRecord)
+    """
+    address = server.attrib['address']
+    if address == masterserver:
+        return address, ServerRecord(address, type='MASTERSERVER')
+    elif address in blocklist:
+        return address, ServerRecord(address, type='BLOCKED')
+    # basic info
+    status = server.attrib['status']
+    # info is only available if the server is running
+    if status != 'UP':
+        return address, ServerRecord(address, status=status)
+    # gametype, mod etc
+    qcstatus = None
+    for rule in server.findall('rules/rule'):
+        if rule.attrib['name'] == "qcstatus":
+            qcstatus = rule.text
+    gametype, version, mod = parse_qcstatus(qcstatus)
+    return address, ServerRecord(
+        address, name=server.find('name').text or "",
+        numplayers=int(server.find('numplayers').text),
+        maxplayers=int(server.find('maxplayers').text),
+        gametype=gametype, version=version, mod=mod)
+
+
+class _ServerListTarget(object):
+    """
+    XMLParser target that hands out every <server> element on its own
+    """
+    def __init__(self, on_server):
+        self.on_server = on_server
+        self._builder = ElementTree.TreeBuilder()
+        self._stack = []
+
+    def start(self, tag, attrib):
+        element = self._builder.start(tag, attrib)
+        self._stack.append(element)
+        return element
+
+    def data(self, data):
+        self._builder.data(data)
+
+    def end(self, tag):
+        element = self._builder.end(tag)
+        self._stack.pop()
+        # only direct children of the root are servers
+        if tag == "server" and len(self._stack) == 1:
+            try:
+                self.on_server(element)
+            finally:
+                # drop the subtree as soon as it was handled
+                element.clear()
+                self._stack[0].remove(element)
+        return element
+
+    def close(self):
+        return self._builder.close()
+
+
+class ServerListParser(object):
+    """
+    Incremental parser for the xml serverlist of the masterserver
+
+    Feed it the response body chunk by chunk. 'on_server' is called with
+    every <server> element as soon as it is complete. The element is
+    discarded afterwards, so the whole document is never kept in memory.
+    """
+    def __init__(self, on_server):
+        self._parser = ElementTree.XMLParser(
+            target=_ServerListTarget(on_server))
+
+    def feed(self, data):
+        self._parser.feed(data)
+
+    def close(self):
+        self._parser.close()
@@ -0,0 +1,188 @@
+# XonoticSimpleStarter - Serverlist builder
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Build a serverlist away from the UI thread
+
+With install_twisted_reactor the reactor runs inside the Kivy main loop,
+everything done there blocks the window. The xml of the masterserver is
+parsed, filtered and sorted in a worker thread instead and only the
+finished ServerListSnapshot is handed back.
+"""
+
+import time
+
+from twisted.internet import defer, threads
+from twisted.python import failure
+
+from metrics import TimedMembership
+from serverlist import (PlayerIndex, ServerListParser, SortedServers,
+                        player_names, record_from_element)
+from serverquery import ServerIndex
+
+
+class ServerListSnapshot(object):
+    """
+    Finished serverlist, the worker does not touch it once it is handed out
+    """
+    __slots__ = ('servers', 'index', 'listed', 'blocked', 'errors',
+                 'duration', 'index_duration', 'block_duration', 'players',
+                 'down')
+
+    def __init__(self, servers, index, listed, blocked, errors, duration,
+                 index_duration=0.0, block_duration=0.0, players=None,
+                 down=()):
+        self.servers = servers
+        self.index = index
+        self.listed = listed
+        self.blocked = blocked
+        self.errors = errors
+        # addresses of the servers that are not UP
+        self.down = down
+        self.duration = duration
+        # parts of 'duration'
+        self.index_duration = index_duration
+        self.block_duration = block_duration
+        # PlayerIndex, None for a list without players
+        self.players = players
+
+    @property
+    def parsed(self):
+        """
+        Number of server entries in the xml
+        """
+        return (len(self.servers) + len(self.blocked) + len(self.errors) +
+                len(self.down))
+
+    def __str__(self):
+        return ("{} servers ({} listed, {} blocked, {} down, {} errors) "
+                "built in {:.0f} ms".format(
+                    len(self.servers), self.listed, len(self.blocked),
+                    len(self.down), len(self.errors), self.duration * 1000))
+
+
+class ServerListBuilder(object):
+    """
+    Turn the xml serverlist into sorted, indexed ServerRecords
+
+    Not thread safe, all calls have to come from the same worker. 'pings'
+    maps addresses to known latencies that are copied into the records.
+    """
+    def __init__(self, blocklist=(), masterserver=None, sort_key='name',
+                 pings=None):
+        # measures the time of the block list lookups
+        self.blocklist = TimedMembership(blocklist)
+        self.masterserver = masterserver
+        self.pings = pings or {}
+        self.servers = SortedServers(sort_key=sort_key)
+        self.listed = None
+        self.blocked = []
+        self.down = []
+        # (address, exception) of servers that could not be parsed
+        self.errors = []
+        self.duration = 0.0
+        # (address, player names) of the servers that have players
+        self.players = []
+        self.has_players = False
+        self._parser = ServerListParser(self._add)
+
+    def _add(self, server):
+        try:
+            address, record = record_from_element(server, self.blocklist,
+                                                  self.masterserver)
+        except Exception as e:
+            self.errors.append((server.attrib.get("address"), e))
+            return
+        if record.type == 'MASTERSERVER':
+            self.listed = server.attrib.get('servers')
+        elif record.type == 'BLOCKED':
+            self.blocked.append(address)
+        elif record.status != 'UP':
+            # the masterserver has nothing but the status of these, they
+            # would be blank rows. Favourites are queried on their own.
+            self.down.append(address)
+        else:
+            record.ping = self.pings.get(address)
+            self.servers[address] = record
+            names = player_names(server)
+            if names:
+                self.players.append((address, names))
+            if server.find('players') is not None:
+                self.has_players = True
+
+    def feed(self, data):
+        start = time.time()
+        self._parser.feed(data)
+        self.duration += time.time() - start
+
+    def close(self):
+        start = time.time()
+        self._parser.close()
+        index_start = time.time()
+        index = ServerIndex(self.servers.values())
+        players = PlayerIndex(self.players) if self.has_players else None
+        end = time.time()
+        self.duration += end - start
+        return ServerListSnapshot(self.servers, index, self.listed,
+                                  self.blocked, self.errors, self.duration,
+                                  end - index_start, self.blocklist.duration,
+                                  players, self.down)
+
+
+class ThreadedFeed(object):
+    """
+    Call 'function' with every chunk in a worker thread
+
+    Chunks are processed one at a time and in the order they arrived. After
+    an error the remaining chunks are dropped and 'close' fails.
+    """
+    def __init__(self, function, reactor=None):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.reactor = reactor
+        self.function = function
+        self._queue = defer.succeed(None)
+
+    def _run(self, function, *args):
+        return threads.deferToThreadPool(
+            self.reactor, self.reactor.getThreadPool(), function, *args)
+
+    def feed(self, data):
+        self._queue.addCallback(lambda _: self._run(self.function, data))
+
+    def close(self, function):
+        """
+        Run 'function' once all chunks are processed, fires with its result
+        """
+        d = defer.Deferred()
+        self._queue.addCallback(lambda _: self._run(function))
+        self._queue.addBoth(self._closed, d)
+        return d
+
+    def _closed(self, result, d):
+        # 'd' may have been cancelled in the meantime
+        if d.called:
+            return
+        if isinstance(result, failure.Failure):
+            d.errback(result)
+        else:
+            d.callback(result)
+
+    def discard(self):
+        """
+        Drop the result, errors of the remaining chunks are ignored
+        """
+        self._queue.addErrback(lambda reason: None)
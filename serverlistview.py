@@ -0,0 +1,163 @@
+# XonoticSimpleStarter - Serverlist view
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from kivy.lang import Builder
+from kivy.properties import (BooleanProperty, NumericProperty,
+                             ObjectProperty, StringProperty)
+from kivy.uix.behaviors import ButtonBehavior
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+
+
+Builder.load_file("serverlistview.kv")
+
+
+class ServerListItem(RecycleDataViewBehavior):
+    list_view = None
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.list_view = rv
+        return super(ServerListItem, self).refresh_view_attrs(rv, index,
+                                                               data)
+
+
+class ServerSectionHeader(ServerListItem, ButtonBehavior, BoxLayout):
+    category = StringProperty("")
+    title = StringProperty("")
+    count = NumericProperty(0)
+    is_open = BooleanProperty(True)
+
+    def on_release(self):
+        self.list_view.toggle_section(self.category)
+
+
+class ServerRow(ServerListItem, ButtonBehavior, BoxLayout):
+    address = StringProperty("")
+    name = StringProperty("")
+    gametype = StringProperty("")
+    players = StringProperty("")
+    ping = StringProperty("")
+    selected = BooleanProperty(False)
+    # a watched player is on the server
+    highlighted = BooleanProperty(False)
+
+    def on_release(self):
+        self.list_view.select(self.address)
+
+
+class ServerListView(RecycleView):
+    """
+    Virtualized serverlist with collapsible sections
+
+    Only the visible rows have widgets, they are recycled while scrolling.
+    The data of a row is cached by address and only rebuilt when its text
+    changes.
+    """
+    sections = [('fav', "Favourites"), ('vanilla', "All Weapons"),
+                ('insta', "Instagib"), ('ok', "Overkill"), ('xdf', "XDF"),
+                ('other', "Other")]
+    selected_address = ObjectProperty(None, allownone=True)
+
+    def __init__(self, **kwargs):
+        self.collapsed = set()
+        self.highlighted = set()
+        # category -> list of (address, row)
+        self._rows = dict((category, []) for category, title in self.sections)
+        # address -> (row, data of the row)
+        self._row_data = {}
+        # address -> index in data
+        self._index = {}
+        super(ServerListView, self).__init__(**kwargs)
+
+    def set_rows(self, rows):
+        """
+        Show the given rows, 'rows' maps a category to a list of
+        (address, (name, gametype, players, ping))
+        """
+        for category, title in self.sections:
+            self._rows[category] = rows.get(category, [])
+        self.refresh_data()
+
+    def set_highlighted(self, addresses):
+        """
+        Highlight the rows of 'addresses', takes effect with the next
+        set_rows
+        """
+        self.highlighted = set(addresses)
+
+    def _data_for(self, address, row):
+        highlighted = address in self.highlighted
+        cached = self._row_data.get(address)
+        if cached is not None and cached[0] == (row, highlighted):
+            return cached[1]
+        name, gametype, players, ping = row
+        data = {'viewclass': 'ServerRow', 'address': address, 'name': name,
+                'gametype': gametype, 'players': players, 'ping': ping,
+                'selected': False, 'highlighted': highlighted}
+        self._row_data[address] = ((row, highlighted), data)
+        return data
+
+    def refresh_data(self):
+        data = []
+        index = {}
+        visible = set()
+        for category, title in self.sections:
+            rows = self._rows[category]
+            is_open = category not in self.collapsed
+            data.append({'viewclass': 'ServerSectionHeader',
+                         'category': category, 'title': title,
+                         'count': len(rows), 'is_open': is_open})
+            for address, row in rows:
+                visible.add(address)
+                if not is_open:
+                    continue
+                row_data = self._data_for(address, row)
+                if address == self.selected_address:
+                    row_data = dict(row_data, selected=True)
+                index[address] = len(data)
+                data.append(row_data)
+        # forget rows that are gone
+        for address in set(self._row_data) - visible:
+            del self._row_data[address]
+        if self.selected_address not in visible:
+            self.selected_address = None
+        self._index = index
+        self.data = data
+
+    def toggle_section(self, category):
+        if category in self.collapsed:
+            self.collapsed.remove(category)
+        else:
+            self.collapsed.add(category)
+        self.refresh_data()
+
+    def scroll_to(self, address):
+        """
+        Scroll the row of 'address' into view if it is shown
+        """
+        i = self._index.get(address)
+        if i is None or len(self.data) < 2:
+            return
+        self.scroll_y = 1 - float(i) / (len(self.data) - 1)
+
+    def select(self, address):
+        old = self.selected_address
+        self.selected_address = address
+        for key, selected in ((old, False), (address, True)):
+            i = self._index.get(key)
+            if i is not None:
+                self.data[i] = dict(self.data[i], selected=selected)
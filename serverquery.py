@@ -0,0 +1,371 @@
+# XonoticSimpleStarter - Serverlist queries
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Filter queries for the serverlist
+
+A query is a list of terms separated by whitespace, all terms have to
+match:
+
+    gametype:ctf players>=4 mod:instagib -name:test version:0.8.*
+
+Plain words match the server name. 'field:value' compares text fields,
+'*' and '?' are wildcards. Numeric fields support ':', '=', '<', '<=', '>'
+and '>='. A leading '-' negates a term. Values with spaces can be quoted.
+"""
+
+import bisect
+import fnmatch
+import re
+
+from serverlist import SearchIndex, search_text
+
+
+class QueryError(ValueError):
+    pass
+
+
+# field name and aliases -> attribute of ServerRecord
+TEXT_FIELDS = {'name': 'name', 'gametype': 'gametype', 'gt': 'gametype',
+               'mod': 'mod', 'version': 'version', 'category': 'category',
+               'cat': 'category', 'address': 'address', 'ip': 'address'}
+NUMERIC_FIELDS = {'players': 'numplayers', 'max': 'maxplayers',
+                  'maxplayers': 'maxplayers', 'free': 'free', 'ping': 'ping'}
+
+_EMPTY = frozenset()
+
+_TERM = re.compile(r'(-?)(?:(\w+)(>=|<=|:|=|<|>))?("[^"]*"?|\S*)')
+
+
+def _free(record):
+    return record.maxplayers - record.numplayers
+
+
+def numeric_value(record, attribute):
+    if attribute == 'free':
+        return _free(record)
+    return getattr(record, attribute)
+
+
+class Term(object):
+    """
+    A single condition of a query
+    """
+    def __init__(self, field, operator, value, negated=False):
+        self.field = field
+        self.operator = operator
+        self.value = value
+        self.negated = negated
+        self.key = (field, operator, value.lower())
+        if field in NUMERIC_FIELDS:
+            try:
+                self.number = int(value)
+            except ValueError:
+                raise QueryError("'{}' needs a number".format(field))
+        elif operator != ':':
+            raise QueryError("'{}' only supports ':'".format(field))
+        else:
+            self.pattern = search_text(value)
+            self.wildcard = "*" in value or "?" in value
+            if self.wildcard:
+                self.regex = re.compile(fnmatch.translate(self.pattern))
+
+    def __repr__(self):
+        return "Term({!r}, {!r}, {!r}, negated={})".format(
+            self.field, self.operator, self.value, self.negated)
+
+    def _compare(self, number):
+        if number is None:
+            return False
+        operator = self.operator
+        if operator in (':', '='):
+            return number == self.number
+        elif operator == '<':
+            return number < self.number
+        elif operator == '<=':
+            return number <= self.number
+        elif operator == '>':
+            return number > self.number
+        return number >= self.number
+
+    def _match_text(self, text):
+        text = search_text(text)
+        if self.wildcard:
+            return self.regex.match(text) is not None
+        if self.field == 'name':
+            return self.pattern in text
+        return text == self.pattern
+
+    def match(self, record):
+        if self.field in NUMERIC_FIELDS:
+            result = self._compare(
+                numeric_value(record, NUMERIC_FIELDS[self.field]))
+        else:
+            result = self._match_text(
+                getattr(record, TEXT_FIELDS[self.field]))
+        return result != self.negated
+
+
+def parse_query(text):
+    """
+    Turn the query 'text' into a list of Terms
+
+    Terms without a value are left out, they are still being typed.
+    """
+    terms = []
+    for match in _TERM.finditer(text):
+        negated, field, operator, value = match.groups()
+        value = value.strip('"')
+        if not field:
+            field, operator = 'name', ':'
+        field = field.lower()
+        if field not in TEXT_FIELDS and field not in NUMERIC_FIELDS:
+            raise QueryError("Unknown field '{}'".format(field))
+        if field in TEXT_FIELDS:
+            field = TEXT_FIELDS[field]
+        if not value:
+            continue
+        terms.append(Term(field, operator, value, bool(negated)))
+    return terms
+
+
+class Query(object):
+    """
+    Compiled query
+
+    'evaluate' answers the query with the postings of a ServerIndex. The
+    terms are applied from the smallest to the biggest result; once the
+    candidates are few, the remaining terms are checked against their
+    records instead of being looked up. 'match' checks a single record, for
+    collections that are too small to be indexed.
+    """
+    # checking a record costs about as much as this many set operations
+    RESIDUAL_COST = 4
+
+    def __init__(self, text="", terms=()):
+        self.text = text
+        self.terms = parse_query(text) + list(terms)
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    __nonzero__ = __bool__
+
+    def match(self, record):
+        for term in self.terms:
+            if not term.match(record):
+                return False
+        return True
+
+    def evaluate(self, index):
+        """
+        Return the set of addresses in 'index' that match, or None if the
+        query is empty and everything matches. The set must not be changed.
+        """
+        if not self.terms:
+            return None
+        plan = []
+        for term in self.terms:
+            work, size = index.estimate(term)
+            plan.append((term.negated, work if term.negated else size, work,
+                         len(plan), term))
+        plan.sort()
+        result = None
+        for negated, order, work, position, term in plan:
+            if (result is not None and
+                    len(result) * Query.RESIDUAL_COST < work):
+                result = index.filter(term, result)
+                continue
+            addresses = index.lookup(term)
+            if result is None:
+                result = index.all_addresses()
+            if negated:
+                result = result.difference(addresses)
+            else:
+                result = result.intersection(addresses)
+        return result
+
+
+class ServerIndex(object):
+    """
+    Postings of the serverlist for the fields of a query
+
+    Names are searched through a SearchIndex, the text fields have one set
+    of addresses per normalized value and the numeric fields are kept as a
+    sorted list of (value, address) for range lookups. The result of every
+    term is cached until the index changes, so while a query is typed only
+    its last term has to be looked up.
+    """
+    CACHE_SIZE = 64
+
+    POSTING_FIELDS = ('gametype', 'mod', 'version', 'category', 'address')
+    RANGE_FIELDS = ('numplayers', 'maxplayers', 'free', 'ping')
+
+    def __init__(self, records=()):
+        self.records = {}
+        self.names = SearchIndex()
+        # field -> value -> set of addresses
+        self._postings = dict((field, {})
+                              for field in ServerIndex.POSTING_FIELDS)
+        # field -> sorted list of (value, address)
+        self._ranges = dict((field, []) for field in ServerIndex.RANGE_FIELDS)
+        # term key -> set of addresses
+        self._cache = {}
+        for record in records:
+            self.add(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, record):
+        """
+        Add or replace a record
+        """
+        address = record.address
+        if address in self.records:
+            self.remove(address)
+        self._cache.clear()
+        self.records[address] = record
+        self.names.add(address, record.name)
+        for field, postings in self._postings.items():
+            value = search_text(getattr(record, field))
+            postings.setdefault(value, set()).add(address)
+        for field, entries in self._ranges.items():
+            value = numeric_value(record, field)
+            if value is not None:
+                bisect.insort(entries, (value, address))
+
+    def remove(self, address):
+        record = self.records.pop(address, None)
+        if record is None:
+            return
+        self._cache.clear()
+        self.names.remove(address)
+        for field, postings in self._postings.items():
+            value = search_text(getattr(record, field))
+            postings[value].discard(address)
+            if not postings[value]:
+                del postings[value]
+        for field, entries in self._ranges.items():
+            value = numeric_value(record, field)
+            if value is not None:
+                del entries[bisect.bisect_left(entries, (value, address))]
+
+    def all_addresses(self):
+        result = self._cache.get(None)
+        if result is None:
+            result = self._cache[None] = frozenset(self.records)
+        return result
+
+    def filter(self, term, addresses):
+        """
+        Check 'term' against the records of 'addresses' one by one
+        """
+        if term.field == 'name':
+            matches = self._match_names(term, addresses)
+            if term.negated:
+                return set(addresses).difference(matches)
+            return matches
+        records = self.records
+        return set(address for address in addresses
+                   if term.match(records[address]))
+
+    def _match_names(self, term, addresses):
+        names = self.names.names
+        if term.wildcard:
+            match = term.regex.match
+            return set(address for address in addresses
+                       if match(names[address]))
+        pattern = term.pattern
+        return set(address for address in addresses
+                   if pattern in names[address])
+
+    def estimate(self, term):
+        """
+        Return (work, size), the rough number of steps a lookup of 'term'
+        takes and the number of addresses it returns
+        """
+        cached = self._cache.get(term.key)
+        if cached is not None:
+            return 0, len(cached)
+        if term.field == 'name' and not term.wildcard:
+            work = self.names.estimate(term.pattern)
+            return work, work
+        if term.field in self._postings:
+            postings = self._postings[term.field]
+            if not term.wildcard:
+                return 0, len(postings.get(term.pattern, _EMPTY))
+            return len(postings), len(self.records)
+        if term.field in NUMERIC_FIELDS:
+            low, high = self._bounds(NUMERIC_FIELDS[term.field], term)
+            return high - low, high - low
+        return len(self.records), len(self.records)
+
+    def lookup(self, term):
+        """
+        Addresses for which 'term' holds, ignoring the negation. The set
+        must not be changed.
+        """
+        result = self._cache.get(term.key)
+        if result is None:
+            if len(self._cache) >= ServerIndex.CACHE_SIZE:
+                self._cache.clear()
+            result = self._cache[term.key] = self._lookup(term)
+        return result
+
+    def _lookup(self, term):
+        if term.field == 'name':
+            if term.wildcard:
+                return self._match_names(term, self.records)
+            result = self.names.search(term.pattern)
+            return self.all_addresses() if result is None else result
+        if term.field in self._postings:
+            postings = self._postings[term.field]
+            if not term.wildcard:
+                return postings.get(term.pattern, _EMPTY)
+            result = set()
+            for value, addresses in postings.items():
+                if term.regex.match(value):
+                    result.update(addresses)
+            return result
+        if term.field in NUMERIC_FIELDS:
+            return self._range(NUMERIC_FIELDS[term.field], term)
+        # residual predicate
+        return set(address for address, record in self.records.items()
+                   if term.match(record) != term.negated)
+
+    def _range(self, field, term):
+        low, high = self._bounds(field, term)
+        return set(address for value, address in self._ranges[field][low:high])
+
+    def _bounds(self, field, term):
+        entries = self._ranges[field]
+        number = term.number
+        # (value, address) sorts before every entry with a bigger value
+        # when address is the empty string
+        low, high = 0, len(entries)
+        if term.operator in (':', '='):
+            low = bisect.bisect_left(entries, (number, ""))
+            high = bisect.bisect_left(entries, (number + 1, ""))
+        elif term.operator == '<':
+            high = bisect.bisect_left(entries, (number, ""))
+        elif term.operator == '<=':
+            high = bisect.bisect_left(entries, (number + 1, ""))
+        elif term.operator == '>':
+            low = bisect.bisect_left(entries, (number + 1, ""))
+        else:
+            low = bisect.bisect_left(entries, (number, ""))
+        return low, high
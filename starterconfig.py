@@ -0,0 +1,131 @@
+# XonoticSimpleStarter - Configuration
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Defaults and paths of the starter's configuration
+
+Kept free of kivy, so the headless mode can read the same starter.ini as
+the gui without opening a window.
+"""
+
+import os
+import sys
+from collections import OrderedDict
+
+try:
+    from ConfigParser import RawConfigParser
+except ImportError:
+    from configparser import RawConfigParser
+
+DEFAULT_PROFILE = "default"
+# settings a launch profile can override
+PROFILE_KEYS = ('xon_path', 'xon_version', 'env_vars', 'args')
+PROFILE_SECTION = "Profile "
+
+
+def script_dir():
+    return os.path.dirname(os.path.realpath(sys.argv[0]))
+
+
+def config_path():
+    """
+    Path of the config file, the same one kivy uses for the app
+    """
+    return os.path.join(script_dir(), "starter.ini")
+
+
+def defaults():
+    """
+    Default values of every section
+    """
+    return {
+        'Xonotic': {
+            'xon_path': script_dir(),
+            'env_vars': "",
+            'xon_version': "sdl",
+            'args': "",
+            'launch_profile': DEFAULT_PROFILE,
+            'query_backend': "http",
+            'cache_max_age': 24,
+            'light_refresh': True,
+            'refresh_interval': 5,
+            'favourites_interval': 60,
+            'idle_factor': 4,
+            'friends': "",
+            'history': True},
+        'IRC': {
+            'nick': "XonoticFan",
+            'username': "",
+            'password': "",
+            'autojoin': False}}
+
+
+def load_config(path=None):
+    """
+    Read the config file without kivy, missing values are filled in with
+    their defaults
+    """
+    config = RawConfigParser()
+    for section, values in defaults().items():
+        config.add_section(section)
+        for key, value in values.items():
+            config.set(section, key, str(value))
+    config.read(path or config_path())
+    return config
+
+
+def favourites(config):
+    """
+    Map the addresses of all favourites in 'config' to their names
+    """
+    result = OrderedDict()
+    if config.has_section('Favourites'):
+        for name in config.options('Favourites'):
+            result[config.get('Favourites', name).strip()] = name
+    return result
+
+
+def profile_names(config):
+    """
+    Names of all launch profiles in 'config', the default one first
+    """
+    return [DEFAULT_PROFILE] + [section[len(PROFILE_SECTION):]
+                                for section in config.sections()
+                                if section.startswith(PROFILE_SECTION)]
+
+
+def profile_settings(config, name=DEFAULT_PROFILE):
+    """
+    The settings of the launch profile 'name', its section overrides the
+    Xonotic section. Raises KeyError for unknown profiles.
+    """
+    settings = dict((key, config.get('Xonotic', key))
+                    for key in PROFILE_KEYS)
+    if name != DEFAULT_PROFILE:
+        section = PROFILE_SECTION + name
+        if not config.has_section(section):
+            raise KeyError(name)
+        for key in PROFILE_KEYS:
+            if config.has_option(section, key):
+                settings[key] = config.get(section, key)
+    return settings
+
+
+def checkupdate_path(xon_path):
+    """
+    Xonotic's checkupdate.txt, it holds the list of blocked servers
+    """
+    return os.path.join(xon_path, "misc", "infrastructure", "checkupdate.txt")
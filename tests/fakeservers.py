@@ -0,0 +1,131 @@
+# XonoticSimpleStarter - Fake DarkPlaces servers for the tests
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Master and game servers on 127.0.0.1 that speak just enough of the
+DarkPlaces protocol for dpmaster.DarkPlacesQuery
+"""
+
+import socket
+import struct
+
+from twisted.internet import reactor
+from twisted.internet.protocol import DatagramProtocol
+
+from dpmaster import EOT, HEADER
+
+HOST = "127.0.0.1"
+
+
+class FakeServer(DatagramProtocol):
+    """
+    Base of the fake servers, 'received' lists the commands of all packets
+    """
+    def __init__(self):
+        self.received = []
+        self.port = None
+
+    def listen(self):
+        self.port = reactor.listenUDP(0, self, interface=HOST)
+        return self
+
+    def stop(self):
+        return self.port.stopListening()
+
+    @property
+    def addr(self):
+        return (HOST, self.port.getHost().port)
+
+    @property
+    def address(self):
+        return "{}:{}".format(*self.addr)
+
+    def datagramReceived(self, data, addr):
+        if not data.startswith(HEADER):
+            return
+        command = data[len(HEADER):].decode("ascii").split(" ")
+        self.received.append(command[0])
+        self.answer(command, addr)
+
+    def answer(self, command, addr):
+        pass
+
+
+class FakeMaster(FakeServer):
+    """
+    Answers 'getservers' with 'addresses', 'per_packet' addresses in every
+    packet. A 'silent' master never answers.
+    """
+    def __init__(self, addresses, per_packet=100, silent=False):
+        FakeServer.__init__(self)
+        self.addresses = list(addresses)
+        self.per_packet = per_packet
+        self.silent = silent
+
+    def answer(self, command, addr):
+        if command[0] != "getservers" or self.silent:
+            return
+        chunks = [self.addresses[i:i + self.per_packet]
+                  for i in range(0, len(self.addresses), self.per_packet)]
+        chunks = chunks or [[]]
+        for i, chunk in enumerate(chunks):
+            packet = HEADER + b"getserversResponse"
+            for address in chunk:
+                host, port = address.split(":")
+                packet += (b"\\" + socket.inet_aton(host) +
+                           struct.pack(">H", int(port)))
+            if i == len(chunks) - 1:
+                packet += b"\\" + EOT
+            self.transport.write(packet, addr)
+
+
+class FakeGameServer(FakeServer):
+    """
+    Answers 'getinfo' and 'getstatus' with 'info' and 'players', a list of
+    (score, ping, name). The first 'drop' packets are ignored, every answer
+    is sent 'delay' seconds late.
+    """
+    def __init__(self, info=None, players=(), drop=0, delay=0.0):
+        FakeServer.__init__(self)
+        self.info = {'hostname': "Fake server", 'clients': "1",
+                     'sv_maxclients': "16",
+                     'qcstatus': "dm:0.8.2:P0:S15:F5:MXPM::score!!"}
+        self.info.update(info or {})
+        self.players = list(players)
+        self.drop = drop
+        self.delay = delay
+
+    def answer(self, command, addr):
+        if command[0] not in ("getinfo", "getstatus"):
+            return
+        if self.drop > 0:
+            self.drop -= 1
+            return
+        info = dict(self.info)
+        info['challenge'] = command[1]
+        infostring = "".join("\\{}\\{}".format(key, value)
+                             for key, value in sorted(info.items()))
+        if command[0] == "getinfo":
+            packet = "infoResponse\n" + infostring
+        else:
+            packet = "statusResponse\n" + infostring + "".join(
+                '\n{} {} "{}"'.format(score, ping, name)
+                for score, ping, name in self.players)
+        packet = HEADER + packet.encode("utf-8")
+        if self.delay:
+            reactor.callLater(self.delay, self.transport.write, packet, addr)
+        else:
+            self.transport.write(packet, addr)
@@ -0,0 +1,268 @@
+# XonoticSimpleStarter - Tests of the DarkPlaces query module
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from twisted.internet import defer, task
+from twisted.trial import unittest
+
+import dpmaster
+from tests.fakeservers import FakeGameServer, FakeMaster
+
+TIMEOUT = 0.2
+
+
+class ParseTest(unittest.TestCase):
+    def test_split_address(self):
+        self.assertEqual(dpmaster.split_address("1.2.3.4:26001"),
+                         ("1.2.3.4", 26001))
+        self.assertEqual(dpmaster.split_address("[::1]:26001"),
+                         ("::1", 26001))
+        self.assertEqual(dpmaster.split_address("example.org"),
+                         ("example.org", dpmaster.DEFAULT_PORT))
+
+    def test_info_response(self):
+        info, players = dpmaster.parse_info_response(
+            dpmaster.HEADER + b'statusResponse\n\\hostname\\A\\clients\\1'
+            b'\n12 40 "^1player"')
+        self.assertEqual(info, {'hostname': "A", 'clients': "1"})
+        self.assertEqual(players, [{'score': "12", 'ping': "40",
+                                    'name': "^1player"}])
+
+    def test_not_a_response(self):
+        self.assertRaises(ValueError, dpmaster.parse_info_response,
+                          b"garbage")
+        self.assertRaises(ValueError, dpmaster.parse_getservers_response,
+                          b"garbage")
+
+
+class QueryTestCase(unittest.TestCase):
+    """
+    A DarkPlacesQuery with short timeouts and fake servers that are stopped
+    after the test
+    """
+    def setUp(self):
+        self.query = dpmaster.DarkPlacesQuery(timeout=TIMEOUT, retries=1)
+        self.servers = []
+
+    def tearDown(self):
+        return defer.gatherResults(
+            [server.stop() for server in self.servers] +
+            [defer.maybeDeferred(self.query.stop)])
+
+    def game_server(self, **kwargs):
+        server = FakeGameServer(**kwargs).listen()
+        self.servers.append(server)
+        return server
+
+    def master(self, addresses, **kwargs):
+        server = FakeMaster(addresses, **kwargs).listen()
+        self.servers.append(server)
+        return server
+
+
+class MasterTest(QueryTestCase):
+    @defer.inlineCallbacks
+    def test_addresses_of_all_masters(self):
+        first = self.master(["10.0.0.1:26000", "10.0.0.2:26000"])
+        second = self.master(["10.0.0.2:26000", "10.0.0.3:26001"])
+        addresses = yield self.query.query_masters([first.addr,
+                                                    second.addr])
+        self.assertEqual(sorted(addresses), ["10.0.0.1:26000",
+                                             "10.0.0.2:26000",
+                                             "10.0.0.3:26001"])
+
+    @defer.inlineCallbacks
+    def test_several_packets(self):
+        expected = ["10.0.{}.{}:26000".format(i // 200, i % 200 + 1)
+                    for i in range(250)]
+        master = self.master(expected, per_packet=60)
+        addresses = yield self.query.query_masters([master.addr])
+        self.assertEqual(addresses, expected)
+
+    @defer.inlineCallbacks
+    def test_silent_master_is_skipped(self):
+        master = self.master(["10.0.0.1:26000"])
+        silent = self.master(["10.0.0.2:26000"], silent=True)
+        addresses = yield self.query.query_masters([silent.addr,
+                                                    master.addr])
+        self.assertEqual(addresses, ["10.0.0.1:26000"])
+
+    @defer.inlineCallbacks
+    def test_empty_list(self):
+        master = self.master([])
+        self.query.start()
+        addresses = yield self.query._query_master(
+            master.addr[0], master.addr[1], dpmaster.GAMENAME,
+            dpmaster.PROTOCOL_VERSION)
+        self.assertEqual(addresses, [])
+
+
+class ServerTest(QueryTestCase):
+    @defer.inlineCallbacks
+    def test_getinfo(self):
+        server = self.game_server(info={'hostname': "^1Red"})
+        info = yield self.query.query_server(server.address)
+        self.assertEqual(info['hostname'], "^1Red")
+        self.assertEqual(server.received, ["getinfo"])
+
+    @defer.inlineCallbacks
+    def test_getstatus(self):
+        server = self.game_server(players=[(10, 50, "one"), (3, 80, "two")])
+        info, players = yield self.query.query_server(server.address,
+                                                      "getstatus")
+        self.assertEqual(info['clients'], "1")
+        self.assertEqual([player['name'] for player in players],
+                         ["one", "two"])
+
+    @defer.inlineCallbacks
+    def test_lost_packet_is_resent(self):
+        server = self.game_server(drop=1)
+        info = yield self.query.query_server(server.address)
+        self.assertEqual(info['hostname'], "Fake server")
+        self.assertEqual(server.received, ["getinfo", "getinfo"])
+
+    def test_timeout(self):
+        server = self.game_server(drop=2)
+        d = self.query.query_server(server.address)
+        return self.assertFailure(d, dpmaster.QueryTimeout)
+
+    @defer.inlineCallbacks
+    def test_unreachable_address(self):
+        # the socket is IPv4 only
+        yield self.assertFailure(self.query.query_server("[::1]:26000"),
+                                 Exception)
+        self.assertEqual(self.query._pending, {})
+        # no timeout fires later
+        yield sleep(TIMEOUT * 2)
+
+    @defer.inlineCallbacks
+    def test_request_serverlist(self):
+        up = self.game_server(info={'hostname': "up", 'clients': "3"})
+        down = self.game_server(drop=2)
+        master = self.master([up.address, down.address])
+        found = []
+        results = yield self.query.request_serverlist(
+            [master.addr], on_server=lambda address, record: found.append(
+                address))
+        self.assertEqual(found, [up.address])
+        [(address, record)] = results
+        self.assertEqual(address, up.address)
+        self.assertEqual((record.name, record.numplayers, record.maxplayers,
+                          record.gametype, record.mod),
+                         ("up", 3, 16, "dm", "Xpm"))
+
+    @defer.inlineCallbacks
+    def test_concurrent_queries_to_one_server(self):
+        server = self.game_server(players=[(1, 20, "one")], delay=0.05)
+        results = yield defer.gatherResults([
+            self.query.ping(server.address),
+            self.query.query_server(server.address, "getstatus"),
+            self.query.query_server(server.address)])
+        (rtt, ping_info), (info, players), getinfo = results
+        self.assertTrue(rtt >= 0.05)
+        self.assertEqual(ping_info['hostname'], "Fake server")
+        self.assertEqual(len(players), 1)
+        self.assertEqual(getinfo['hostname'], "Fake server")
+        self.assertEqual(sorted(server.received),
+                         ["getinfo", "getinfo", "getstatus"])
+
+
+def sleep(seconds):
+    from twisted.internet import reactor
+    return task.deferLater(reactor, seconds, lambda: None)
+
+
+class PingProbeTest(QueryTestCase):
+    def setUp(self):
+        QueryTestCase.setUp(self)
+        self.probe = dpmaster.PingProbe(self.query, ttl=0.3)
+
+    @defer.inlineCallbacks
+    def test_rtt(self):
+        server = self.game_server(delay=0.05)
+        rtt = yield self.probe.probe(server.address)
+        self.assertTrue(0.05 <= rtt < TIMEOUT)
+        self.assertEqual(self.probe.rtt(server.address), rtt)
+        self.assertEqual(self.probe.rtts(), {server.address: rtt})
+
+    @defer.inlineCallbacks
+    def test_cached_within_ttl(self):
+        server = self.game_server()
+        first = yield self.probe.probe(server.address)
+        second = yield self.probe.probe(server.address)
+        self.assertEqual(first, second)
+        self.assertEqual(server.received, ["getinfo"])
+
+    @defer.inlineCallbacks
+    def test_concurrent_probes_share_a_packet(self):
+        server = self.game_server(delay=0.05)
+        first, second = yield defer.gatherResults(
+            [self.probe.probe(server.address),
+             self.probe.probe(server.address)])
+        self.assertEqual(first, second)
+        self.assertEqual(server.received, ["getinfo"])
+
+    @defer.inlineCallbacks
+    def test_probed_again_after_ttl(self):
+        server = self.game_server()
+        yield self.probe.probe(server.address)
+        self.assertTrue(self.probe.is_fresh(server.address))
+        yield sleep(0.35)
+        self.assertFalse(self.probe.is_fresh(server.address))
+        server.delay = 0.1
+        rtt = yield self.probe.probe(server.address)
+        self.assertEqual(server.received, ["getinfo", "getinfo"])
+        # moving average of both measurements
+        self.assertTrue(0.0 < rtt < 0.1)
+
+    @defer.inlineCallbacks
+    def test_silent_server_is_cached(self):
+        server = self.game_server(drop=10)
+        rtt = yield self.probe.probe(server.address)
+        self.assertIdentical(rtt, None)
+        self.assertTrue(self.probe.is_fresh(server.address))
+        yield self.probe.probe(server.address)
+        self.assertEqual(server.received, ["getinfo"])
+
+    @defer.inlineCallbacks
+    def test_probe_during_status_query(self):
+        server = self.game_server(players=[(1, 20, "one")], delay=0.05)
+        status = self.query.query_server(server.address, "getstatus")
+        rtt = yield self.probe.probe(server.address)
+        info, players = yield status
+        self.assertNotIdentical(rtt, None)
+        self.assertEqual(len(players), 1)
+
+    @defer.inlineCallbacks
+    def test_status_query_during_probe(self):
+        server = self.game_server(delay=0.05)
+        probe = self.probe.probe(server.address)
+        info = yield self.query.query_server(server.address)
+        rtt = yield probe
+        self.assertEqual(info['hostname'], "Fake server")
+        self.assertNotIdentical(rtt, None)
+
+    @defer.inlineCallbacks
+    def test_probe_all(self):
+        servers = [self.game_server() for _ in range(3)]
+        silent = self.game_server(drop=10)
+        results = []
+        yield self.probe.probe_all(
+            [server.address for server in servers + [silent]],
+            on_result=lambda address, rtt: results.append((address, rtt)))
+        self.assertEqual(len(results), 4)
+        self.assertEqual(dict(results)[silent.address], None)
+        self.assertEqual(sorted(self.probe.rtts()),
+                         sorted(server.address for server in servers))
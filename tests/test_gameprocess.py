@@ -0,0 +1,110 @@
+# XonoticSimpleStarter - Tests of the supervision of the Xonotic client
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import stat
+import sys
+
+from twisted.internet import defer, reactor, task
+from twisted.trial import unittest
+
+from gameprocess import GameSupervisor
+from launcher import LaunchProfile
+
+# stands in for the Xonotic binary, 'exit' as first argument makes it fail
+FAKE_XONOTIC = """#!/bin/sh
+echo "started $*"
+if [ "$1" = "exit" ]; then
+    exit 3
+fi
+exec sleep 30
+"""
+
+
+class SupervisorTest(unittest.TestCase):
+    if sys.platform in ["win32", "cygwin"]:
+        skip = "needs a POSIX shell"
+
+    def setUp(self):
+        directory = os.path.abspath(self.mktemp())
+        os.makedirs(directory)
+        self.binary = os.path.join(directory, "xonotic-sdl")
+        with open(self.binary, "w") as f:
+            f.write(FAKE_XONOTIC)
+        os.chmod(self.binary, stat.S_IRWXU)
+        self.ended = []
+        self.supervisor = GameSupervisor(reactor, log_dir=directory,
+                                         on_exit=self.ended.append)
+
+    def tearDown(self):
+        if self.supervisor.running:
+            d = self.started()
+            d.addCallback(lambda _: self.supervisor.stop())
+            return d
+
+    def started(self):
+        """
+        Give the client time to start, a signal that arrives before it
+        replaced the forked process is lost
+        """
+        return task.deferLater(reactor, 0.2, lambda: None)
+
+    def profile(self, *args):
+        return LaunchProfile("test", self.binary, "sdl",
+                             os.path.dirname(self.binary), args=list(args))
+
+    def test_running_client_is_left_alone(self):
+        profile = self.profile()
+        self.assertEqual(self.supervisor.launch(profile, "1.2.3.4:26000"),
+                         'started')
+        process = self.supervisor.process
+        self.assertEqual(self.supervisor.launch(profile, "5.6.7.8:26000"),
+                         'running')
+        self.assertIdentical(self.supervisor.process, process)
+        self.assertEqual(process.server, "1.2.3.4:26000")
+
+    @defer.inlineCallbacks
+    def test_restart(self):
+        profile = self.profile()
+        self.supervisor.launch(profile, "1.2.3.4:26000")
+        old = self.supervisor.process
+        yield self.started()
+        result = yield self.supervisor.restart(profile, "5.6.7.8:26000")
+        self.assertEqual(result, 'started')
+        self.assertEqual(self.ended, [old])
+        # killed by the restart, which is no crash
+        self.assertTrue(old.signal)
+        self.assertFalse(old.crashed)
+        self.assertTrue(self.supervisor.running)
+        self.assertEqual(self.supervisor.process.server, "5.6.7.8:26000")
+
+    @defer.inlineCallbacks
+    def test_restart_without_running_client(self):
+        result = yield self.supervisor.restart(self.profile(),
+                                               "5.6.7.8:26000")
+        self.assertEqual(result, 'started')
+        self.assertEqual(self.ended, [])
+
+    @defer.inlineCallbacks
+    def test_crash(self):
+        self.supervisor.launch(self.profile("exit"), "1.2.3.4:26000")
+        process = yield self.supervisor.process.ended
+        self.assertTrue(process.crashed)
+        self.assertEqual(process.exit_code, 3)
+        self.assertEqual(self.ended, [process])
+        self.assertFalse(self.supervisor.running)
+        self.assertEqual(process.output.tail(1),
+                         ["started exit +connect 1.2.3.4:26000"])
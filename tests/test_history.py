@@ -0,0 +1,139 @@
+# XonoticSimpleStarter - Tests of the population history
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+
+from twisted.trial import unittest
+
+from history import DAY, HOUR, History, busy_hours
+from serverlist import ServerRecord
+
+ADDRESS = "1.2.3.4:26000"
+OTHER = "1.2.3.5:26000"
+
+
+def refresh(players, other=0):
+    return [ServerRecord(ADDRESS, numplayers=players, maxplayers=16),
+            ServerRecord(OTHER, numplayers=other, maxplayers=16)]
+
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.history = History(self.mktemp())
+        # the start of an hour 30 days ago
+        self.start = int(time.time() - 30 * DAY) // HOUR * HOUR
+
+    def hour_of_day(self, timestamp):
+        return time.localtime(timestamp).tm_hour
+
+    def test_record(self):
+        self.assertTrue(self.history.record(refresh(4), self.start))
+        self.history.record(refresh(0, 2), self.start + 300)
+        self.assertEqual(list(self.history.samples.read()),
+                         [(self.start, 0, 4), (self.start, 1, 4),
+                          (self.start + 300, 0, 2),
+                          (self.start + 300, 2, 2)])
+
+    def test_profile(self):
+        now = self.start + 10 * DAY
+        for day in range(10):
+            self.history.record(refresh(6, 1), self.start + day * DAY)
+            self.history.record(refresh(2, 1), self.start + day * DAY + 1800)
+        profile = self.history.hourly_profile([ADDRESS, OTHER, "unknown"],
+                                              now=now)
+        hour = self.hour_of_day(self.start)
+        self.assertEqual(profile[ADDRESS][hour], 4.0)
+        self.assertEqual(profile[OTHER][hour], 1.0)
+        self.assertEqual(profile[None][hour], 5.0)
+        self.assertEqual(profile["unknown"][hour], 0.0)
+        self.assertEqual([value for i, value in enumerate(profile[None])
+                          if i != hour], [None] * 23)
+        self.assertEqual(busy_hours(profile[ADDRESS]),
+                         "{}h".format(hour))
+
+    def test_compact_keeps_the_profile(self):
+        now = self.start + 30 * DAY
+        for day in range(30):
+            for step in range(4):
+                self.history.record(refresh(step * 2, 1),
+                                    self.start + day * DAY + step * 900)
+        before = self.history.hourly_profile([ADDRESS, OTHER], now=now)
+        hours = self.history.compact(now)
+        self.assertEqual(hours, 16)
+        after = self.history.hourly_profile([ADDRESS, OTHER], now=now)
+        self.assertEqual(before, after)
+        self.assertEqual(self.history.samples.first_time(),
+                         self.start + 16 * DAY)
+
+    def test_record_does_not_wait_for_a_worker(self):
+        self.history.record(refresh(1), self.start)
+        # a worker compacts or reads the files
+        self.history._lock.acquire()
+        try:
+            self.assertFalse(self.history.record(refresh(3), self.start + 1))
+            self.assertEqual(len(self.history.samples), 2)
+        finally:
+            self.history._lock.release()
+        self.history.compact(self.start + 2)
+        self.assertEqual(len(self.history.samples), 4)
+        self.history.record(refresh(5), self.start + 3)
+        self.assertEqual([value for timestamp, server_id, value in
+                          self.history.samples.read() if server_id],
+                         [1, 3, 5])
+
+    def test_no_sample_is_lost_while_a_worker_reads(self):
+        refreshes = 2000
+        done = threading.Event()
+
+        def worker():
+            while not done.is_set():
+                self.history.hourly_profile([ADDRESS], now=self.start)
+        thread = threading.Thread(target=worker)
+        thread.start()
+        try:
+            for i in range(refreshes):
+                self.history.record(refresh(1), self.start + i)
+        finally:
+            done.set()
+            thread.join()
+        self.history.compact(self.start)
+        self.assertEqual(len(self.history.samples), 2 * refreshes)
+        self.assertEqual([timestamp for timestamp, server_id, value in
+                          self.history.samples.read() if server_id],
+                         list(range(self.start, self.start + refreshes)))
+
+    def test_failed_write_keeps_the_samples(self):
+        self.history.record(refresh(1), self.start)
+        append = self.history.samples.append
+
+        def fail(records):
+            raise IOError("disk full")
+        self.history.samples.append = fail
+        self.assertRaises(IOError, self.history.record, refresh(2),
+                          self.start + 1)
+        self.history.samples.append = append
+        self.history.record(refresh(3), self.start + 2)
+        self.assertEqual([value for timestamp, server_id, value in
+                          self.history.samples.read() if server_id],
+                         [1, 2, 3])
+
+    def test_busy_hours(self):
+        profile = [None] * 24
+        self.assertIdentical(busy_hours(profile), None)
+        profile[20:24] = [8, 9, 10, 9]
+        profile[2] = 1
+        self.assertEqual(busy_hours(profile), "20-24h")
@@ -0,0 +1,72 @@
+# XonoticSimpleStarter - Tests of the masterserver requests
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from twisted.internet import defer, task
+from twisted.trial import unittest
+
+from masterserver import RefreshScheduler, RequestManager
+
+
+class RefreshTest(unittest.TestCase):
+    """
+    A 'serverlist' job that goes through a RequestManager, like the one of
+    the starter
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self.requests = RequestManager(self.clock, base_delay=300.0)
+        self.scheduler = RefreshScheduler(self.clock)
+        self.scheduler.add('serverlist', self.refresh, 60)
+        self.attempts = []
+        # results of the next attempts, a pending Deferred by default
+        self.results = []
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.requests.cancel_all()
+
+    def refresh(self):
+        d = self.requests.request('serverlist', self.fetch,
+                                  channel='serverlist')
+        d.addErrback(lambda reason: reason.trap(defer.CancelledError))
+        return d
+
+    def fetch(self):
+        self.attempts.append(self.clock.seconds())
+        if self.results:
+            return self.results.pop(0)
+        return defer.Deferred()
+
+    def test_interval(self):
+        self.results = [defer.succeed(None), defer.succeed(None)]
+        self.clock.advance(60)
+        self.clock.advance(60)
+        self.assertEqual(self.attempts, [60, 120])
+
+    def test_run_now_while_running_shares_the_request(self):
+        self.scheduler.run_now('serverlist')
+        self.scheduler.run_now('serverlist')
+        self.assertEqual(len(self.attempts), 1)
+
+    def test_run_now_during_backoff_retries_immediately(self):
+        self.results = [defer.fail(RuntimeError("unreachable"))]
+        self.scheduler.run_now('serverlist')
+        self.assertEqual(self.requests.retrying, 1)
+        self.clock.advance(100)
+        self.scheduler.run_now('serverlist')
+        self.assertEqual(self.attempts, [0, 100])
+        self.assertEqual(self.requests.retrying, 0)
+        self.assertEqual(self.requests.pending, 1)
@@ -0,0 +1,72 @@
+# XonoticSimpleStarter - Tests of the serverlist builder
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from twisted.trial import unittest
+
+from serverlistbuilder import ServerListBuilder
+
+MASTERSERVER = "dpmaster.deathmask.net"
+
+
+def server_xml(address, status="UP", name="A server"):
+    if status != "UP":
+        return ('<server type="XONOTICS" address="{}" status="{}">'
+                '</server>'.format(address, status))
+    return ('<server type="XONOTICS" address="{}" status="UP">'
+            '<name>{}</name><numplayers>2</numplayers>'
+            '<maxplayers>16</maxplayers><rules>'
+            '<rule name="qcstatus">ctf:0.8.2:P0:S14:F5:MXonotic::score!!'
+            '</rule></rules></server>'.format(address, name))
+
+
+def serverlist_xml(servers):
+    return ('<?xml version="1.0" encoding="utf-8"?><qstat>'
+            '<server type="XONOTICM" address="{}" status="UP" servers="{}">'
+            '</server>{}</qstat>'.format(MASTERSERVER, len(servers),
+                                         "".join(servers))).encode("utf-8")
+
+
+class ServerListBuilderTest(unittest.TestCase):
+    def build(self, servers, blocklist=()):
+        builder = ServerListBuilder(blocklist, MASTERSERVER)
+        builder.feed(serverlist_xml(servers))
+        return builder.close()
+
+    def test_servers(self):
+        snapshot = self.build([server_xml("1.2.3.4:26000", name="one"),
+                               server_xml("1.2.3.5:26000", name="two")])
+        self.assertEqual(list(snapshot.servers), ["1.2.3.4:26000",
+                                                  "1.2.3.5:26000"])
+        record = snapshot.servers["1.2.3.4:26000"]
+        self.assertEqual((record.name, record.numplayers, record.gametype,
+                          record.mod), ("one", 2, "ctf", "Xonotic"))
+        self.assertEqual(snapshot.listed, "2")
+
+    def test_servers_that_are_not_up_are_left_out(self):
+        snapshot = self.build([server_xml("1.2.3.4:26000"),
+                               server_xml("1.2.3.5:26000", "TIMEOUT"),
+                               server_xml("1.2.3.6:26000", "DOWN")])
+        self.assertEqual(list(snapshot.servers), ["1.2.3.4:26000"])
+        self.assertEqual(snapshot.down, ["1.2.3.5:26000", "1.2.3.6:26000"])
+        self.assertEqual(snapshot.parsed, 3)
+        self.assertEqual(len(snapshot.index), 1)
+
+    def test_blocked(self):
+        snapshot = self.build([server_xml("1.2.3.4:26000"),
+                               server_xml("1.2.3.5:26000")],
+                              blocklist=["1.2.3.5:26000"])
+        self.assertEqual(list(snapshot.servers), ["1.2.3.4:26000"])
+        self.assertEqual(snapshot.blocked, ["1.2.3.5:26000"])
@@ -0,0 +1,207 @@
+# XonoticSimpleStarter - Theme atlas
+# Copyright (C) <2016>  <Sebastian Schmidt>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Pack the images of a theme into a single texture
+
+A theme 'name' is themes/<name>.kv with its images in themes/<name>/. The
+images are packed into a kivy atlas that is named by the hash of their
+content, so it is only built again when an image changes. Building needs
+Pillow; without it the theme uses the single images.
+
+    python themeatlas.py luma
+
+builds the atlas ahead of time into themes/atlas/, otherwise it is built
+into the user's cache on first use.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+
+from kivy.logger import Logger
+
+# part of the hash, a new version rebuilds all atlases
+ATLAS_VERSION = 1
+IMAGE_EXTENSIONS = (".tga", ".png", ".jpg")
+PADDING = 2
+# page sizes to try before settling for more than one texture
+MAX_ATTEMPTS = 8
+
+
+def theme_images(theme, themes_dir="themes"):
+    """
+    Sorted list of the image files of 'theme'
+    """
+    return sorted(filename for filename in
+                  glob.glob(os.path.join(themes_dir, theme, "*"))
+                  if os.path.splitext(filename)[1].lower() in
+                  IMAGE_EXTENSIONS)
+
+
+def content_hash(filenames):
+    digest = hashlib.sha1("{}".format(ATLAS_VERSION).encode("ascii"))
+    for filename in filenames:
+        digest.update(os.path.basename(filename).encode("utf-8"))
+        with open(filename, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def _atlas_sizes(filenames):
+    """
+    (width, height) in powers of two that might hold all images, the
+    smallest first. The page is decoded and uploaded on every start, so it
+    should not be bigger than needed.
+    """
+    from PIL import Image
+    area = 0
+    widest = highest = 0
+    for filename in filenames:
+        width, height = Image.open(filename).size
+        area += (width + 2 * PADDING) * (height + 2 * PADDING)
+        widest = max(widest, width + 2 * PADDING)
+        highest = max(highest, height + 2 * PADDING)
+    lengths = [2 ** exponent for exponent in range(6, 13)]
+    return sorted(((width, height) for width in lengths for height in lengths
+                   if width >= widest and height >= highest and
+                   width * height >= area),
+                  key=lambda size: (size[0] * size[1], abs(size[0] - size[1])))
+
+
+def _pages(atlas_path):
+    with open(atlas_path) as f:
+        return list(json.load(f))
+
+
+def _remove_atlas(basename):
+    for filename in glob.glob(basename + ".atlas") + glob.glob(
+            basename + "-*.*"):
+        os.remove(filename)
+
+
+def _store_uncompressed(atlas_path):
+    """
+    Convert the png pages of an atlas to uncompressed tga, decoding a big
+    png takes longer than loading all single images
+    """
+    from PIL import Image
+    with open(atlas_path) as f:
+        meta = json.load(f)
+    directory = os.path.dirname(atlas_path)
+    converted = {}
+    for page, regions in meta.items():
+        name = os.path.splitext(page)[0] + ".tga"
+        Image.open(os.path.join(directory, page)).save(
+            os.path.join(directory, name))
+        os.remove(os.path.join(directory, page))
+        converted[name] = regions
+    with open(atlas_path, "w") as f:
+        json.dump(converted, f)
+
+
+def prebuilt_dir(themes_dir="themes"):
+    return os.path.join(themes_dir, "atlas")
+
+
+def theme_atlas(theme, cache_dir, themes_dir="themes"):
+    """
+    Return the base name of the atlas of 'theme'. A prebuilt atlas of the
+    current images is used if there is one, otherwise it is built into
+    'cache_dir'. Returns None if the theme has no images or the atlas can't
+    be built.
+    """
+    filenames = theme_images(theme, themes_dir)
+    if not filenames:
+        return None
+    name = "{}-{}".format(theme, content_hash(filenames))
+    for directory in (prebuilt_dir(themes_dir), cache_dir):
+        basename = os.path.join(directory, name)
+        if os.path.isfile(basename + ".atlas"):
+            return basename
+    return build_atlas(theme, filenames, os.path.join(cache_dir, name))
+
+
+def texture_count(basename):
+    """
+    Number of textures of an atlas
+    """
+    return len(_pages(basename + ".atlas"))
+
+
+def build_atlas(theme, filenames, basename):
+    """
+    Pack 'filenames' into the atlas 'basename', older atlases of the theme
+    next to it are removed
+    """
+    cache_dir = os.path.dirname(basename)
+    try:
+        from kivy.atlas import Atlas
+        sizes = _atlas_sizes(filenames)
+    except ImportError:
+        Logger.warn("Theme: Pillow is needed to build the atlas of {}, "
+                    "using the single images".format(theme))
+        return None
+    if not sizes:
+        Logger.warn("Theme: the images of {} don't fit into one atlas "
+                    "page, using the single images".format(theme))
+        return None
+    if cache_dir and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    # atlases of older images
+    for old in glob.glob(os.path.join(cache_dir,
+                                      theme + "-" + "?" * 16 + ".atlas")):
+        _remove_atlas(old[:-len(".atlas")])
+    # one page means one texture, grow it until everything fits
+    for size in sizes[:MAX_ATTEMPTS]:
+        _remove_atlas(basename)
+        try:
+            result = Atlas.create(basename, filenames, list(size), PADDING)
+        except Exception as e:
+            Logger.warn("Theme: building the atlas of {} failed: {}".format(
+                theme, e))
+            _remove_atlas(basename)
+            return None
+        if not result:
+            return None
+        if texture_count(basename) == 1:
+            break
+    _store_uncompressed(basename + ".atlas")
+    Logger.info("Theme: built a {}x{} atlas of {} images for {}".format(
+        size[0], size[1], len(filenames), theme))
+    return basename
+
+
+def atlas_kv(kv, theme, basename):
+    """
+    Replace the paths of the theme images in the rules 'kv' with their
+    atlas urls
+    """
+    url = "atlas://" + basename.replace(os.sep, "/")
+    pattern = re.compile(r"""(["'])themes/{}/([^"'/]+?)\.(?:{})\1""".format(
+        re.escape(theme), "|".join(extension[1:] for extension in
+                                   IMAGE_EXTENSIONS)), re.IGNORECASE)
+    return pattern.sub(lambda match: "{0}{1}/{2}{0}".format(
+        match.group(1), url, match.group(2)), kv)
+
+
+if __name__ == "__main__":
+    built = theme_atlas(sys.argv[1], prebuilt_dir())
+    print(built)
+    sys.exit(0 if built else 1)
@@ -16,6 +16,27 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import sys
+
+from metrics import Profiler, StartupTimeline, registry
+
+startup = StartupTimeline()
+
+# kivy opens a window as soon as it is imported, the headless mode has to
+# be dispatched before that
+if __name__ == "__main__" and "--headless" in sys.argv[1:]:
+    import headless
+    sys.exit(headless.main(
+        [arg for arg in sys.argv[1:] if arg != "--headless"]))
+
+# --profile wraps the startup and every serverlist refresh in cProfile and
+# dumps the metrics periodically, kivy doesn't know the option
+profiler = None
+if __name__ == "__main__" and "--profile" in sys.argv[1:]:
+    sys.argv.remove("--profile")
+    profiler = Profiler()
+    profiler.start("startup")
+
 from kivy.app import App
 from kivy.lang import Builder
 from kivy.logger import Logger
@@ -25,27 +46,41 @@ from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.popup import Popup
-from kivy.uix.treeview import TreeViewLabel
+from kivy.uix.tabbedpanel import TabbedPanelItem
+from kivy.properties import ObjectProperty, StringProperty
 from kivy.core.text import LabelBase
+from kivy.core.window import Window
 
-from basewidgets import TreeViewContainerNode, WinSettingPath
+from basewidgets import Sparkline, WinSettingPath
 
 install_twisted_reactor()
 
-from xml.etree import cElementTree as ElementTree
-from twisted.internet import defer, error, reactor
-from treq import get
+from twisted.internet import defer, error, reactor, threads
 
-import subprocess
+import io
 import os
-import sys
+import platform
+import time
 from collections import OrderedDict
 
-import irc
-
+import dpmaster
+from masterserver import MasterServer, RefreshScheduler, RequestManager
+from servercache import ServerCache
+from serverlistview import ServerListView
+import themeatlas
+from metrics import FrameTimer
+from serverlist import (BlockList, PlayerIndex, ServerRecord,
+                        SortedServers, diff_servers, strip_colors)
+from serverlistbuilder import ServerListBuilder, ThreadedFeed
+from serverquery import Query, QueryError, ServerIndex, Term
+from quickjoin import QuickJoin
+from history import History, busy_hours
+import starterconfig
+from starterconfig import checkupdate_path, script_dir
+from launcher import LaunchError, ProfileCache
+from gameprocess import GameSupervisor
 
-def script_dir():
-    return os.path.dirname(os.path.realpath(sys.argv[0]))
+startup.mark("imports")
 
 
 def register_fonts():
@@ -56,19 +91,80 @@ def register_fonts():
                        fn_bold="Xolonium-Bold.otf",)
 
 
-def apply_theme(theme):
+def apply_theme(theme, cache_dir=None):
     """
     Apply a theme specified by theme/<themename>.kv
+
+    Its images are taken from an atlas when there is one or it can be built
+    in 'cache_dir'.
     """
     if not theme or theme == 'default':
         return
-    Builder.load_file("themes/{}.kv".format(theme))
+    filename = "themes/{}.kv".format(theme)
+    images = len(themeatlas.theme_images(theme))
+    atlas = None
+    if cache_dir is not None:
+        atlas = themeatlas.theme_atlas(theme, cache_dir)
+    if atlas is None:
+        Logger.info("Theme: {}, {} images in {} textures".format(
+            theme, images, images))
+        Builder.load_file(filename)
+        return
+    Logger.info("Theme: {}, {} images in {} textures from {}".format(
+        theme, images, themeatlas.texture_count(atlas), atlas))
+    with io.open(filename, encoding="utf-8") as f:
+        kv = f.read()
+    Builder.load_string(themeatlas.atlas_kv(kv, theme, atlas),
+                        filename=filename)
 
 
 class MainGUI(BoxLayout):
     def ircrules_popup(self):
         IRCRulesPopup().open()
 
+    def irc_tabs(self):
+        return [tab for tab in self.ids.tabs.tab_list
+                if isinstance(tab, IRCTab)]
+
+    def irc_view(self, channel):
+        """
+        View of 'channel', it is created if its tab was never opened
+        """
+        for tab in self.irc_tabs():
+            if tab.channel == channel:
+                return tab.load_view()
+
+    def irc_views(self):
+        """
+        All channel views that were created so far
+        """
+        return [tab.view for tab in self.irc_tabs() if tab.view is not None]
+
+
+class IRCTab(TabbedPanelItem):
+    """
+    Tab of an IRC channel
+
+    The IRC module and the view of the channel are only loaded when the tab
+    is opened for the first time or the channel is joined.
+    """
+    channel = StringProperty("")
+    view = ObjectProperty(None, allownone=True)
+
+    def on_state(self, instance, state):
+        if state == 'down':
+            self.load_view()
+
+    def load_view(self):
+        if self.view is None:
+            controller = App.get_running_app().load_irc()
+            import irc
+            self.view = irc.IRCChannelView(channel=self.channel)
+            self.add_widget(self.view)
+            if controller.is_connected:
+                self.view.on_connected()
+        return self.view
+
 
 class IRCRulesPopup(Popup):
     ircrules = ("#1: Don't ask to ask - just ask\n#2: Behave as you would do "
@@ -81,30 +177,339 @@ class AddFavouritePopup(Popup):
     pass
 
 
+class SaveFilterPopup(Popup):
+    pass
+
+
+class PeakHoursPopup(Popup):
+    """
+    Average players per hour of the day of all servers and the favourites
+    """
+    def add_row(self, name, profile):
+        busy = busy_hours(profile)
+        self.ids.rows.add_widget(Label(text=strip_colors(name),
+                                       shorten=True))
+        self.ids.rows.add_widget(Sparkline(values=profile))
+        self.ids.rows.add_widget(Label(
+            text="busy at {}".format(busy) if busy else "no players yet"))
+
+
+class StatsPopup(Popup):
+    """
+    The metrics of the running starter, opened with F12
+    """
+    text = StringProperty("")
+    _event = None
+
+    def on_open(self):
+        self.update()
+        self._event = Clock.schedule_interval(lambda dt: self.update(), 1)
+
+    def on_dismiss(self):
+        if self._event is not None:
+            self._event.cancel()
+
+    def update(self):
+        self.text = "\n".join(registry.lines()) or "Nothing measured yet"
+
+    def dump(self):
+        path = App.get_running_app().dump_metrics()
+        self.title = "Statistics - written to {}".format(path)
+
+
 class StarterWidget(BoxLayout):
-    masterserver = "dpmaster.deathmask.net"
-    options = "/?game=xonotic&?&xml=1&?&showplayers=1"
-    request_url = "https://" + masterserver + options
+    masterserver = MasterServer.host
     TIMEOUT = 10
-    RETRY_DELAY = 30
+    RETRY_DELAY = 5
+    RETRY_MAX_DELAY = 300
+
+    PROGRESSIVE_UPDATE_DELAY = 0.25
+    FILTER_DELAY = 0.3
+    PING_CONCURRENCY = 16
+    PING_RATE = 50
+    PING_TTL = 300
 
     def __init__(self, *args, **kwargs):
-        self.servers = {}
-        self.fav_servers = {}
+        self.servers = SortedServers()
+        self.fav_servers = SortedServers()
+        self.server_index = ServerIndex()
+        self.player_index = PlayerIndex()
+        # jump to the first matching server after the player filter changed
+        self._jump = False
+        # (filter text, show empty, show full) and the compiled query
+        self._query = (None, None)
+        self.filter_error = None
+        self.dpquery = None
+        self.ping_probe = None
+        self.quick_joiner = None
+        self._quick_join = None
+        self.frame_timer = FrameTimer()
+        self._frame_event = None
+        self.masterserver_client = MasterServer(timeout=StarterWidget.TIMEOUT)
+        self.requests = RequestManager(
+            base_delay=StarterWidget.RETRY_DELAY,
+            max_delay=StarterWidget.RETRY_MAX_DELAY,
+            on_retry=self.request_retry)
+        # rebuild the list at most every few frames while pings come in
+        self._trigger_update = Clock.create_trigger(
+            lambda dt: self.update_serverlist(),
+            StarterWidget.PROGRESSIVE_UPDATE_DELAY)
+        # filter once the user stopped typing
+        self._trigger_filter = Clock.create_trigger(
+            lambda dt: self.update_serverlist(), StarterWidget.FILTER_DELAY)
+        # time of the cached list that is shown until the first refresh
+        self.stale_since = None
+        config = App.get_running_app().config
+        self.cache = ServerCache(
+            os.path.join(App.get_running_app().user_data_dir,
+                         "serverlist.cache"),
+            max_age=config.getfloat('Xonotic', 'cache_max_age') * 3600)
+        self.history = None
+        if config.getboolean('Xonotic', 'history'):
+            self.history = History(os.path.join(
+                App.get_running_app().user_data_dir, "history"))
+        # refresh in the background, slower while nobody is looking
+        self.scheduler = RefreshScheduler()
+        self.scheduler.add('serverlist', self.request_serverlist, 0)
+        self.scheduler.add('favourites', self.refresh_favourites, 0)
+        self.configure_refresh()
+        self.window_focused = True
+        self.tab_visible = True
+        Window.bind(focus=self.window_focus_changed)
+        self.blocked_IPs = BlockList()
+        # the cache is read and indexed in a worker while the window draws
+        # its first frame
+        self._cache_loaded = threads.deferToThread(
+            self.read_cache, self.favourite_addresses())
+        self._cache_loaded.addCallback(self.show_cache)
+        self._cache_loaded.addErrback(lambda failure: Logger.warn(
+            "Could not read the serverlist cache: {}".format(
+                failure.getErrorMessage())))
+        # it is written in a worker as well, one list at a time
+        self._cache_storing = None
+        self._cache_snapshot = None
+        # the block list is read and the first request is made once the
+        # window has drawn its first frame
+        Window.bind(on_flip=self.first_frame)
+        return super(StarterWidget, self).__init__(*args, **kwargs)
+
+    def first_frame(self, window):
+        Window.unbind(on_flip=self.first_frame)
+        startup.mark("first frame")
+        Clock.schedule_once(lambda dt: self.start_requests())
+
+    def start_requests(self):
+        if profiler is not None:
+            Logger.info("Profile: startup written to {}".format(
+                profiler.stop("startup")))
         self.check_blocked_IPs()
+        startup.mark("block list")
+        # the first request uses the validators of the cached list
+        self._cache_loaded.addCallback(lambda _: self.first_request())
+        if self.history is not None:
+            d = threads.deferToThread(self.history.compact)
+            d.addCallback(lambda hours: Logger.info(
+                "History: {} hours downsampled".format(hours)))
+            d.addErrback(lambda failure: Logger.warn(
+                "History: compacting failed: {}".format(
+                    failure.getErrorMessage())))
+
+    def first_request(self):
+        startup.mark("cache")
         self.request_info()
-        return super(StarterWidget, self).__init__(*args, **kwargs)
+        startup.mark("first request")
+        Logger.info("Startup: {}".format(startup))
+
+    def configure_refresh(self):
+        """
+        Take the refresh intervals from the settings
+        """
+        config = App.get_running_app().config
+        self.scheduler.idle_factor = max(
+            config.getfloat('Xonotic', 'idle_factor'), 1)
+        self.scheduler.set_interval(
+            'serverlist', config.getfloat('Xonotic', 'refresh_interval') * 60)
+        self.scheduler.set_interval(
+            'favourites', config.getfloat('Xonotic', 'favourites_interval'))
+
+    def window_focus_changed(self, window, focused):
+        self.window_focused = focused
+        self.update_activity()
+
+    def set_tab_visible(self, visible):
+        self.tab_visible = visible
+        self.update_activity()
+
+    def update_activity(self):
+        self.scheduler.set_active(self.window_focused and self.tab_visible)
+
+    def read_cache(self, favourites):
+        """
+        Read and index the last good serverlist, runs in a worker
+
+        Returns (saved, servers, index, favourites, validators) or None.
+        """
+        cached = self.cache.load()
+        if not cached:
+            return None
+        saved, servers, fav_servers, validators = cached
+        servers = SortedServers((record.address, record)
+                                for record in servers)
+        # evict favourites that were removed in the meantime
+        fav_servers = SortedServers(
+            (address, server) for address, server in fav_servers
+            if address in favourites)
+        return (saved, servers, ServerIndex(servers.values()), fav_servers,
+                validators)
+
+    def show_cache(self, cached):
+        """
+        Show the last good serverlist until the first refresh replaces it
+        """
+        # a refresh that was quicker than the cache wins
+        if not cached or self.servers:
+            return
+        saved, servers, index, fav_servers, validators = cached
+        self.servers = servers
+        self.server_index = index
+        self.fav_servers = fav_servers
+        self.stale_since = saved
+        # an unchanged list can be answered with 'not modified'
+        self.masterserver_client.validators = validators
+        Clock.schedule_once(lambda dt: self.sort_by(
+            self.ids.spinner_sort.text))
+        Clock.schedule_once(lambda dt: self.update_status())
+
+    def store_cache(self):
+        """
+        Write the current serverlist to the cache in a worker
+
+        The lists are copied here, the stored fields of the records never
+        change. A list that arrives while the last one is written waits for
+        it, only the newest is kept.
+        """
+        self._cache_snapshot = (list(self.servers.values()),
+                                list(self.fav_servers.items()),
+                                dict(self.masterserver_client.validators))
+        if self._cache_storing is None:
+            self._store_snapshot()
+
+    def _store_snapshot(self):
+        snapshot, self._cache_snapshot = self._cache_snapshot, None
+        d = threads.deferToThread(self.cache.store, *snapshot)
+        d.addErrback(lambda failure: Logger.warn(
+            "Could not write the serverlist cache: {}".format(
+                failure.getErrorMessage())))
+        d.addCallback(self._snapshot_stored)
+        self._cache_storing = d
+
+    def _snapshot_stored(self, _):
+        self._cache_storing = None
+        if self._cache_snapshot is not None:
+            self._store_snapshot()
+
+    def record_history(self):
+        if self.history is None:
+            return
+        servers = list(self.servers.values())
+        servers.extend(server for address, server in self.fav_servers.items()
+                       if address not in self.servers)
+        try:
+            self.history.record(servers)
+        except (IOError, OSError) as e:
+            Logger.warn("History: could not record the refresh: {}".format(
+                e))
+
+    def show_history(self, address):
+        """
+        Show when the selected server is usually busy
+        """
+        self.ids.sparkline_history.values = []
+        self.ids.lbl_history.text = ""
+        if self.history is None or address is None:
+            return
+        d = threads.deferToThread(self.history.hourly_profile, [address])
+        d.addCallback(self.history_loaded, address)
+        d.addErrback(lambda failure: Logger.warn(
+            "History: reading failed: {}".format(failure.getErrorMessage())))
+
+    def history_loaded(self, profiles, address):
+        # another server may have been selected in the meantime
+        if self.ids.server_list.selected_address != address:
+            return
+        busy = busy_hours(profiles[address])
+        self.ids.sparkline_history.values = profiles[address]
+        self.ids.lbl_history.text = ("Usually busy at {}".format(busy)
+                                     if busy else "No players seen yet")
+
+    def peak_hours_popup(self):
+        if self.history is None:
+            self.update_status("The server history is disabled")
+            return
+        favourites = OrderedDict(
+            (address, self.fav_servers[address].name
+             if address in self.fav_servers else name)
+            for address, name in self.favourite_addresses().items())
+        popup = PeakHoursPopup()
+        popup.open()
+        d = threads.deferToThread(self.history.hourly_profile,
+                                  list(favourites))
+
+        def loaded(profiles):
+            popup.add_row("All servers", profiles[None])
+            for address, name in favourites.items():
+                popup.add_row(name, profiles[address])
+        d.addCallback(loaded)
+        d.addErrback(lambda failure: Logger.warn(
+            "History: reading failed: {}".format(failure.getErrorMessage())))
+
+    def update_status(self, text=""):
+        """
+        Show a status message, the age of a stale list takes precedence
+        """
+        if self.filter_error is not None:
+            text = self.filter_error
+        elif self.stale_since is not None:
+            text = "Cached list from {} - {}".format(
+                time.strftime("%H:%M", time.localtime(self.stale_since)),
+                text or "refreshing...")
+        self.ids.lbl_status.text = text
+
+    def finish_serverlist_refresh(self):
+        """
+        Render the complete list of a successful refresh and cache it
+        """
+        self._trigger_update.cancel()
+        missing = self.resolve_favourites()
+        self.update_serverlist()
+        self.stale_since = None
+        self.update_status()
+        online = self.friends_online()
+        if online:
+            self.update_status("Friends online: {}".format(", ".join(
+                "{} ({})".format(friend, strip_colors(self.servers[address]
+                                                      .name))
+                for friend, address in online)))
+        self.store_cache()
+        self.record_history()
+        self.request_favourites(missing)
+        self.ping_servers()
+        if not startup.has("serverlist"):
+            startup.mark("serverlist")
+            Logger.info("Startup: serverlist shown after {:.0f} ms".format(
+                startup.elapsed() * 1000))
 
     def check_blocked_IPs(self):
-        self.blocked_IPs = set()
+        self.blocked_IPs = BlockList()
         xon_path = App.get_running_app().config.get('Xonotic', 'xon_path')
-        filepath = os.path.join(xon_path, "misc", "infrastructure",
-                                "checkupdate.txt")
+        filepath = checkupdate_path(xon_path)
         if os.path.isfile(filepath):
-            with open(filepath) as f:
-                for line in f.readlines():
-                    if line.startswith("B"):
-                        self.blocked_IPs.add(line[1:].strip())
+            self.blocked_IPs = BlockList.from_checkupdate(filepath)
+            for entry in self.blocked_IPs.invalid:
+                Logger.warn("Invalid entry in {}: {}".format(filepath, entry))
+
+    def is_blocked(self, address):
+        return address in self.blocked_IPs
 
     def add_favourite(self, name, address):
         if not (name and address) or ":" not in address:
@@ -130,348 +535,772 @@ class StarterWidget(BoxLayout):
         address = self.popup.ids.txt_inpt_address.text.strip()
         if self.add_favourite(name, address):
             self.popup.dismiss()
-            if ":" in address:
-                addr, port = address.split(":")
-                self.request_serverinfo(addr, port)
-            else:
-                self.request_serverinfo(address)
+            self.fav_servers[address] = self.favourite_placeholder(address,
+                                                                   name)
+            missing = self.resolve_favourites([address])
+            self.update_serverlist()
+            self.request_favourites(missing)
 
     def add_server_to_favourites(self):
-        if self.ids.server_list.selected_node:
-            server = self.ids.server_list.selected_node.address
-            if server not in self.fav_servers.keys():
-                self.add_favourite_popup(address=server)
+        server = self.ids.server_list.selected_address
+        if server and server not in self.fav_servers:
+            self.add_favourite_popup(address=server)
 
     def connect_to_server(self):
         """
         Get the selected server and connect to it
         """
-        if self.ids.server_list.selected_node:
-            server = self.ids.server_list.selected_node.address
+        server = self.ids.server_list.selected_address
+        if server:
             App.get_running_app().start_xon(server)
 
+    def quick_join_candidates(self):
+        """
+        The servers that are shown with the current filter, only the
+        category of the selected server if there is one
+        """
+        query = self.filter_query()
+        if query is None:
+            return []
+        collapsed = self.ids.server_list.collapsed
+        selected = self.ids.server_list.selected_address
+        selected = (self.fav_servers.get(selected) or
+                    self.servers.get(selected))
+        records = []
+        if 'fav' not in collapsed:
+            records.extend(server for server in self.fav_servers.values()
+                           if query.match(server))
+        matches = query.evaluate(self.server_index)
+        for address, server in self.servers.items():
+            if (server.category not in collapsed and
+                    (matches is None or address in matches)):
+                records.append(server)
+        if selected is not None:
+            records = [server for server in records
+                       if server.category == selected.category]
+        return records
+
+    def quick_join(self):
+        """
+        Join the best of the shown servers. The best candidates are asked
+        for their current players and latency, the decision takes at most
+        QuickJoin.budget seconds.
+        """
+        if self._quick_join is not None:
+            return self._quick_join
+        if self.dpquery is None:
+            self.dpquery = dpmaster.DarkPlacesQuery()
+        if self.quick_joiner is None:
+            self.quick_joiner = QuickJoin(self.dpquery)
+        self.update_status("Looking for a server")
+        d = self._quick_join = self.quick_joiner.pick(
+            self.quick_join_candidates())
+        d.addCallback(self.quick_join_picked)
+        d.addErrback(lambda failure: Logger.error(
+            "Quick join failed: {}".format(failure.getErrorMessage())))
+        d.addBoth(self.quick_join_done)
+        return d
+
+    def quick_join_picked(self, result):
+        if result is None:
+            self.update_status("No server to join")
+            return
+        record, probed = result
+        Logger.info("Quick join: {} ({}/{}, {} ms){}".format(
+            record.address, record.numplayers, record.maxplayers,
+            record.ping, "" if probed else ", no server answered"))
+        self.update_status("Joining {}".format(strip_colors(record.name)))
+        App.get_running_app().start_xon(record.address)
+
+    def quick_join_done(self, result):
+        self._quick_join = None
+
     def request_info(self):
         """
         Request the serverlist and info about favourite servers
         from the masterserver.
         """
-        self.request_serverlist()
-        # Favourites
+        for address, name in self.favourite_addresses().items():
+            # keep the last known state until the server answers
+            if address not in self.fav_servers:
+                self.fav_servers[address] = self.favourite_placeholder(address,
+                                                                   name)
+        self.scheduler.run_now('serverlist')
+
+    def favourite_addresses(self):
+        """
+        Map the addresses of all favourites in the config to their names
+        """
+        return starterconfig.favourites(App.get_running_app().config)
+
+    def favourite_placeholder(self, address, name):
+        return ServerRecord(address, status='DOWN', name=name, mod="??",
+                            version="")
+
+    def resolve_favourites(self, addresses=None):
+        """
+        Take the state of the favourites from the current serverlist
+
+        Returns the addresses of the favourites that are not in the list.
+        """
+        if addresses is None:
+            addresses = self.favourite_addresses()
+        missing = []
+        for address in addresses:
+            # favourites may leave out the default port
+            key = dpmaster.format_address(*dpmaster.split_address(address))
+            server = self.servers.get(key)
+            if server and server.status == 'UP':
+                self.fav_servers[address] = server
+            else:
+                missing.append(address)
+        return missing
+
+    def request_favourites(self, addresses):
+        """
+        Query the given favourites directly, all of them in a single batch.
+        The list is updated once the whole batch is done.
+        """
+        if not addresses:
+            return
+        d = self.requests.request(('favourites', tuple(addresses)),
+                                  self._request_favourites, (addresses,))
+        d.addErrback(lambda failure: failure.trap(defer.CancelledError))
+        return d
+
+    @defer.inlineCallbacks
+    def _request_favourites(self, addresses):
+        if self.dpquery is None:
+            self.dpquery = dpmaster.DarkPlacesQuery()
+        results = dict((yield self.dpquery.query_servers(addresses)))
+        names = self.favourite_addresses()
+        changed = False
+        for address in addresses:
+            if address in results:
+                record = results[address]
+                record.ping = self.known_ping(address)
+            elif address in names:
+                record = self.favourite_placeholder(address, names[address])
+            else:
+                continue
+            if self.fav_servers.get(address) != record:
+                self.fav_servers[address] = record
+                changed = True
+        if changed:
+            self.update_serverlist()
+
+    def refresh_favourites(self):
+        return self.request_favourites(list(self.favourite_addresses()))
+
+    def request_serverlist(self, light=None):
+        """
+        Request a list of currently public servers with the backend
+        specified in the settings
+
+        Overlapping refreshes share one request, a refresh with other options
+        supersedes the running one. Failed refreshes are retried with an
+        increasing delay.
+        """
         config = App.get_running_app().config
-        if config.has_section('Favourites'):
-            for name in config.options('Favourites'):
-                addr_port = config.get('Favourites', name)
-                # domain name and port or IPv4 and port
-                if ":" in addr_port:
-                    address, port = addr_port.split(":")
-                    self.request_serverinfo(address, port)
-                # domain name or IPv4 without port
-                else:
-                    self.request_serverinfo(addr_port)
-                self.fav_servers[addr_port] = {'name': name,
-                                               'status': 'DOWN',
-                                               'numplayers': 0,
-                                               'maxplayers': 0,
-                                               'gametype': "??",
-                                               'mod': "??",
-                                               'version': ""}
+        if light is None:
+            light = (config.getboolean('Xonotic', 'light_refresh') and
+                     not self.players_needed())
+        profiling = profiler is not None and profiler.start("refresh")
+        if config.get('Xonotic', 'query_backend') == "udp":
+            d = self.requests.request(('serverlist', "udp"),
+                                      self.request_serverlist_udp,
+                                      channel='serverlist')
+        else:
+            d = self.requests.request(('serverlist', "http", light),
+                                      self.request_serverlist_http, (light,),
+                                      channel='serverlist')
+        if profiling:
+            d.addBoth(self.stop_profile)
+        d.addErrback(lambda failure: failure.trap(defer.CancelledError))
+        return d
+
+    def stop_profile(self, result):
+        Logger.info("Profile: refresh written to {}".format(
+            profiler.stop("refresh")))
+        App.get_running_app().dump_metrics()
+        return result
+
+    def request_retry(self, key, delay, failure):
+        Logger.debug("Request {} failed, retrying in {:.1f} s "
+                     "({} pending, {} retrying)".format(
+                         key, delay, self.requests.pending,
+                         self.requests.retrying))
+        if key[0] == 'serverlist':
+            self.update_status("Refresh failed, retrying in {:.0f} s".format(
+                delay))
 
     @defer.inlineCallbacks
-    def request_serverlist(self):
+    def request_serverlist_udp(self):
         """
-        Request a list of currently public servers from dpmaster.deathmask.net
+        Query the DarkPlaces master servers and every listed server directly
         """
+        if self.dpquery is None:
+            self.dpquery = dpmaster.DarkPlacesQuery()
         try:
-            response = yield get(StarterWidget.request_url,
-                                 timeout=StarterWidget.TIMEOUT)
+            addresses = yield self.dpquery.query_masters()
+        except defer.CancelledError:
+            raise
         except Exception as e:
-            Logger.debug("Requesting serverlist timed out: {}".format(e))
-            reactor.callLater(StarterWidget.RETRY_DELAY,
-                              self.request_serverlist)
-        else:
-            xmlstring = yield response.content()
-            tree = ElementTree.ElementTree(ElementTree.fromstring(xmlstring))
-            root = tree.getroot()
-
-            self.servers = OrderedDict()
-            # iterate
-            for server in root:
-                try:
-                    address, serverdict = self.dictify_server(server)
-                    if serverdict['type'] == 'MASTERSERVER':
-                        Logger.debug("Number of servers: {}".format(
-                                    serverdict['numservers']))
-                    elif serverdict['type'] == 'BLOCKED':
-                        Logger.debug("Blocked server: {}".format(address))
-                    else:
-                        self.servers[address] = serverdict
-                except Exception as e:
-                    Logger.error("Exception caught while parsing server with "
-                                 "address {}: {!r}".format(
-                                     server.attrib["address"], e))
-                    continue
-            # sort the list
-            self.sort_by(self.ids.spinner_sort.text)
+            Logger.debug("Querying the master servers failed: {}".format(e))
+            self.request_favourites(list(self.favourite_addresses()))
+            raise
+        Logger.debug("Number of servers: {}".format(len(addresses)))
+        servers = SortedServers(sort_key=self.servers.sort_key)
+        pings = self.known_pings()
+
+        def add_server(address, record):
+            record.ping = pings.get(address)
+            servers[address] = record
+
+        start = time.time()
+        yield self.dpquery.query_servers(
+            [address for address in addresses if not self.is_blocked(address)],
+            add_server)
+        registry.timer('serverlist.udp_query').record(time.time() - start)
+        registry.histogram('serverlist.servers').record(len(servers))
+        # getinfo doesn't tell the players
+        self.player_index = PlayerIndex()
+        self.apply_servers(servers)
+        self.finish_serverlist_refresh()
 
     @defer.inlineCallbacks
-    def request_serverinfo(self, address, port=26000):
+    def request_serverlist_http(self, light):
         """
-        Request info about a specific server from dpmaster.deathmask.net
+        Request a list of currently public servers from dpmaster.deathmask.net
+
+        The response is parsed, filtered and sorted in a worker thread while
+        it is downloaded, the window stays responsive. The current list is
+        replaced once the new one is complete. A light list leaves out the
+        players of every server.
+
+        The players are not kept with the validators, a 'not modified'
+        response can't fill an empty PlayerIndex. The full list is requested
+        unconditionally when the players are needed and not known.
         """
-        url = StarterWidget.request_url + "&server={}:{}".format(address, port)
+        url = self.masterserver_client.list_url(light)
+        conditional = (light or not self.players_needed() or
+                       bool(len(self.player_index)))
+        builder = ServerListBuilder(self.blocked_IPs,
+                                    StarterWidget.masterserver,
+                                    sort_key=self.servers.sort_key,
+                                    pings=self.known_pings())
+        feed = ThreadedFeed(builder.feed)
+        self.start_frame_timer()
         try:
-            response = yield get(url, timeout=StarterWidget.TIMEOUT)
+            result = yield self.masterserver_client.fetch(
+                url, feed.feed, conditional=conditional)
+            snapshot = None
+            if not result.not_modified:
+                snapshot = yield feed.close(builder.close)
         except Exception as e:
-            Logger.debug("Requesting serverinfo for server {}:{} "
-                         "timed out: {}".format(address, port, e))
-            reactor.callLater(StarterWidget.RETRY_DELAY,
-                              self.request_serverinfo, address, port)
-        else:
-            xmlstring = yield response.content()
-            tree = ElementTree.ElementTree(ElementTree.fromstring(xmlstring))
-            root = tree.getroot()
-            server = root[0]
-            address, serverdict = self.dictify_server(server)
-            if serverdict['status'] == 'UP':
-                self.fav_servers[address] = serverdict
-                self.sort_favourites()
-            self.update_serverlist()
+            feed.discard()
+            # the next request must not be answered with 'not modified'
+            self.masterserver_client.validators.pop(url, None)
+            if not isinstance(e, defer.CancelledError):
+                Logger.debug("Requesting serverlist failed: {}".format(e))
+                self.request_favourites(list(self.favourite_addresses()))
+            raise
+        finally:
+            self.stop_frame_timer()
+        Logger.info("Serverlist: {}".format(result))
+        if snapshot is not None:
+            Logger.info("Serverlist: {}".format(snapshot))
+            self.apply_snapshot(snapshot)
+        Logger.info("Serverlist: frames during refresh: {}".format(
+            self.frame_timer))
+        self.finish_serverlist_refresh()
 
-    def dictify_server(self, server):
+    def apply_snapshot(self, snapshot):
         """
-        Turn the xml Element 'server' into a dictionary
+        Replace the serverlist with one that was built by a worker
         """
-        serverdict = {}
-        if server.attrib['address'] == StarterWidget.masterserver:
-            serverdict['type'] = 'MASTERSERVER'
-            serverdict['numservers'] = server.attrib['servers']
-        elif any([server.attrib['address'].startswith(ip) for ip in
-                  self.blocked_IPs]):
-            serverdict['type'] = 'BLOCKED'
-        else:
-            # basic info
-            serverdict['status'] = server.attrib['status']
-            # info is only available if the server is running
-            if serverdict['status'] == 'UP':
-                serverdict['type'] = 'GAMESERVER'
-                serverdict['name'] = server.find('name').text
-                for field in ['numplayers', 'maxplayers']:
-                    serverdict[field] = int(server.find(field).text)
-                # gametype, mod etc
-                serverdict['gametype'] = "??"
-                serverdict['version'] = "??"
-                serverdict['mod'] = "??"
-                for rule in server.findall('rules/rule'):
-                    if rule.attrib['name'] == "qcstatus":
-                        rules = rule.text.split(":")
-                        try:
-                            serverdict['gametype'] = rules[0]
-                            serverdict['version'] = rules[1]
-                            serverdict['mod'] = rules[5][1:].capitalize()
-                        except IndexError:
-                            # Some servers do not properly report qcstatus
-                            pass
-        return server.attrib['address'], serverdict
+        registry.timer('serverlist.build').record(snapshot.duration)
+        registry.timer('serverlist.index').record(snapshot.index_duration)
+        registry.timer('serverlist.blocklist').record(snapshot.block_duration)
+        if snapshot.parsed:
+            registry.timer('serverlist.parse_per_server').record(
+                (snapshot.duration - snapshot.index_duration) /
+                snapshot.parsed)
+        registry.histogram('serverlist.servers').record(
+            len(snapshot.servers))
+        self.player_index = snapshot.players or PlayerIndex()
+        registry.histogram('serverlist.players').record(
+            len(self.player_index))
+        if snapshot.listed is not None:
+            Logger.debug("Number of servers: {}".format(snapshot.listed))
+        for address in snapshot.blocked:
+            Logger.debug("Blocked server: {}".format(address))
+        for address, e in snapshot.errors:
+            Logger.error("Exception caught while parsing server with "
+                         "address {}: {!r}".format(address, e))
+        self.apply_servers(snapshot.servers, snapshot.index)
 
-    def sort_by(self, text):
-        keydict = {"Name": 'name', "Current Players": 'numplayers',
-                   "Maximum Players": 'maxplayers', "Gametype": 'gametype'}
-        self.sort_serverlist(keydict[text])
-        self.sort_favourites(keydict[text])
-
-    def sort_serverlist(self, key='name'):
-        # don't sort an empty server list
-        if not self.servers:
+    def apply_servers(self, servers, index=None):
+        """
+        Bring the serverlist up to date with a newly built one
+
+        Only the added, removed and changed servers are applied to the
+        current list and its index. If most of the list changed, the new one
+        simply replaces it.
+        """
+        added, removed, changed = diff_servers(self.servers, servers)
+        Logger.info("Serverlist: {} added, {} removed, {} changed".format(
+            len(added), len(removed), len(changed)))
+        if len(added) + len(removed) + len(changed) > len(servers) // 2:
+            # the order may have been changed during the refresh
+            servers.sort_key = self.servers.sort_key
+            self.servers = servers
+            if index is None:
+                index = ServerIndex(servers.values())
+            self.server_index = index
             return
-        # use different sorting for 'numplayers' and 'maxplayers'
-        if key in ['numplayers', 'maxplayers']:
-            self.servers = OrderedDict(
-                sorted(self.servers.items(),
-                       key=lambda item: item[1][key], reverse=True))
-        else:
-            self.servers = OrderedDict(
-                sorted(self.servers.items(),
-                       key=lambda item: item[1][key].lower()))
+        for address in removed:
+            del self.servers[address]
+            self.server_index.remove(address)
+        for address in added + changed:
+            record = servers[address]
+            self.servers[address] = record
+            self.server_index.add(record)
+
+    def start_frame_timer(self):
+        self.frame_timer.start()
+        if self._frame_event is None:
+            self._frame_event = Clock.schedule_interval(self.frame_timer.tick,
+                                                        0)
+
+    def stop_frame_timer(self):
+        if self._frame_event is not None:
+            self._frame_event.cancel()
+            self._frame_event = None
+
+    def ping_servers(self):
+        """
+        Measure the latency of all listed servers, the rows are updated as
+        the results come in
+        """
+        if self.ping_probe is None:
+            if self.dpquery is None:
+                self.dpquery = dpmaster.DarkPlacesQuery()
+            self.ping_probe = dpmaster.PingProbe(
+                self.dpquery, max_in_flight=StarterWidget.PING_CONCURRENCY,
+                rate=StarterWidget.PING_RATE, ttl=StarterWidget.PING_TTL)
+        addresses = [address for servers in (self.fav_servers, self.servers)
+                     for address, server in servers.items()
+                     if server.status == 'UP']
+        return self.ping_probe.probe_all(addresses, self.set_ping)
+
+    def known_pings(self):
+        """
+        Map addresses to their last measured latency in milliseconds
+        """
+        if self.ping_probe is None:
+            return {}
+        return dict((address, int(round(rtt * 1000)))
+                    for address, rtt in self.ping_probe.rtts().items())
+
+    def known_ping(self, address):
+        """
+        Last measured latency of 'address' in milliseconds
+        """
+        if self.ping_probe is None:
+            return None
+        rtt = self.ping_probe.rtt(address)
+        return int(round(rtt * 1000)) if rtt is not None else None
+
+    def set_ping(self, address, rtt):
+        ping = int(round(rtt * 1000)) if rtt is not None else None
+        if ping is not None:
+            registry.histogram('ping.rtt').record(ping)
+        for servers in (self.servers, self.fav_servers):
+            server = servers.get(address)
+            if server is not None and server.ping != ping:
+                servers[address] = server.replace(ping=ping)
+                if servers is self.servers:
+                    self.server_index.add(servers[address])
+        self._trigger_update()
+
+    sort_keys = {"Name": 'name', "Current Players": 'numplayers',
+                 "Maximum Players": 'maxplayers', "Gametype": 'gametype',
+                 "Ping": 'ping'}
+
+    def sort_by(self, text):
+        """
+        Change the order of the serverlist and the favourites. Both keep
+        their order up to date, so the list is only rendered once.
+        """
+        key = StarterWidget.sort_keys[text]
+        with registry.timer('serverlist.sort').time():
+            self.servers.sort_key = key
+            self.fav_servers.sort_key = key
         self.update_serverlist()
 
-    def sort_favourites(self, key='name'):
-        # don't sort an empty server list
-        if not self.fav_servers:
-            return
-        # use different sorting for 'numplayers' and 'maxplayers'
-        if key in ['numplayers', 'maxplayers']:
-            self.fav_servers = OrderedDict(
-                sorted(self.fav_servers.items(),
-                       key=lambda item: item[1][key], reverse=True))
+    def filter_changed(self):
+        if self.player_mode():
+            self._jump = True
+        self._trigger_filter()
+
+    def player_mode(self):
+        """
+        Whether the filter text searches players instead of servers
+        """
+        return self.ids.spinner_mode.text == "Players"
+
+    def filter_mode_changed(self):
+        if self.player_mode():
+            self.ids.txt_input_filter.hint_text = ("player name, name* "
+                                                   "for the start")
+            if not len(self.player_index):
+                # the list was requested without players
+                self.request_serverlist(light=False)
+        else:
+            self.ids.txt_input_filter.hint_text = "gametype:ctf players>=4"
+        self.filter_changed()
+
+    def players_needed(self):
+        return self.player_mode() or bool(self.friends())
+
+    def player_matches(self):
+        """
+        Addresses of the servers of the players that match the filter text,
+        None if the filter doesn't search players
+        """
+        text = self.ids.txt_input_filter.text
+        if not self.player_mode() or not text.strip():
+            return None
+        start = time.time()
+        found = self.player_index.search(text)
+        registry.timer('players.search').record(time.time() - start)
+        addresses = set()
+        for servers in found.values():
+            addresses.update(servers)
+        if self._jump:
+            if found:
+                names = sorted(found)
+                self.update_status("{} players on {} servers: {}{}".format(
+                    len(found), len(addresses), ", ".join(names[:5]),
+                    "..." if len(names) > 5 else ""))
+            else:
+                self.update_status("No player found")
+        return addresses
+
+    def friends(self):
+        """
+        The watched player names of the settings
+        """
+        friends = App.get_running_app().config.get('Xonotic', 'friends')
+        return [name.strip() for name in friends.split(",") if name.strip()]
+
+    def friends_online(self):
+        """
+        List of (friend, address) of the watched players on a listed server
+        """
+        return [(friend, address) for friend in self.friends()
+                for address in sorted(self.player_index.exact(friend))
+                if address in self.servers]
+
+    def watch_player(self):
+        """
+        Add the player name of the filter to the watched players, the full
+        name if the filter only matches a single player
+        """
+        text = self.ids.txt_input_filter.text
+        found = self.player_index.search(text) if text.strip() else {}
+        if len(found) == 1:
+            name = list(found)[0]
         else:
-            self.fav_servers = OrderedDict(
-                sorted(self.fav_servers.items(),
-                       key=lambda item: item[1][key].lower()))
+            name = text.strip().rstrip("*").strip()
+        if not name or "," in name:
+            return
+        friends = self.friends()
+        if name in friends:
+            return
+        app = App.get_running_app()
+        app.config.set('Xonotic', 'friends', ", ".join(friends + [name]))
+        app.config.write()
         self.update_serverlist()
 
     def update_serverlist(self):
         """
         Update the serverlist. Favourites will always stay on top.
+
+        Only the data of the list is rebuilt, the view creates widgets for
+        the visible rows. Collapsed categories and the selected server
+        survive an update.
         """
-        self.clear_serverlist()
-        tree = self.ids.server_list
-        filter_str = self.ids.txt_input_filter.text.strip().lower()
-        servers = OrderedDict()
+        self._trigger_filter.cancel()
+        query = self.filter_query()
+        if query is None:
+            return
+        start = time.time()
+        matches = query.evaluate(self.server_index)
+        players = self.player_matches()
+        if players is not None:
+            matches = players if matches is None else matches & players
+        filtered = time.time()
+        registry.timer('serverlist.filter').record(filtered - start)
+        rows = dict((category, []) for category, title in
+                    ServerListView.sections)
         for address, server in self.fav_servers.items():
-            if filter_str not in server['name'].lower():
-                continue
-            if not self.ids.switch_empty.active and server['numplayers'] == 0:
-                continue
-            if (not self.ids.switch_full.active and
-                    server['numplayers'] == server['maxplayers']):
-                continue
-            node = TreeViewContainerNode(height=32)
-            node.add_widget(Label(text="[b]{}[/b]".format(server['name']),
-                                  size_hint_x=0.6))
-            node.add_widget(Label(text="{} ({})".format(server['gametype'],
-                                                        server['mod']),
-                                  size_hint_x=0.2))
-            node.add_widget(Label(text="{}/{}".format(server['numplayers'],
-                                                      server['maxplayers']),
-                                  size_hint_x=0.2))
-            tree.add_node(node, self.servertype_nodes['fav'])
-            node.address = address
+            # only a handful of favourites, they are not indexed
+            if query.match(server) and (players is None or
+                                        address in players):
+                rows['fav'].append(
+                    (address, self.server_row(server, favourite=True)))
         for address, server in self.servers.items():
             if address in self.fav_servers:
                 continue
-            if filter_str not in server['name'].lower():
-                continue
-            if not self.ids.switch_empty.active and server['numplayers'] == 0:
-                continue
-            if (not self.ids.switch_full.active and
-                    server['numplayers'] == server['maxplayers']):
-                continue
-            if server['mod'] in ('Xonotic', 'Xpm'):
-                parent = self.servertype_nodes['vanilla']
-            elif server['mod'] == 'Instagib':
-                parent = self.servertype_nodes['insta']
-            elif server['mod'] == 'Overkill':
-                parent = self.servertype_nodes['ok']
-            elif server['mod'] == 'Xdf':
-                parent = self.servertype_nodes['xdf']
-            else:
-                parent = self.servertype_nodes['other']
-            node = TreeViewContainerNode(height=32)
-            node.add_widget(Label(text=server['name'], size_hint_x=0.6))
-            node.add_widget(Label(text="{} ({})".format(server['gametype'],
-                                                        server['mod']),
-                                  size_hint_x=0.2))
-            node.add_widget(Label(text="{}/{}".format(server['numplayers'],
-                                                      server['maxplayers']),
-                                  size_hint_x=0.2))
-            tree.add_node(node, parent)
-            node.address = address
-
-    def clear_serverlist(self):
-        tree = self.ids.server_list
-        for node in list(tree.iterate_all_nodes()):
-            tree.remove_node(node)
-
-        nodes = {}
-        nodes['fav'] = tree.add_node(TreeViewLabel(text="Favourites",
-                                                   is_open=True,
-                                                   no_selection=True))
-        nodes['vanilla'] = tree.add_node(TreeViewLabel(text="All Weapons",
-                                                       is_open=True,
-                                                       no_selection=True))
-        nodes['insta'] = tree.add_node(TreeViewLabel(text="Instagib",
-                                                     is_open=True,
-                                                     no_selection=True))
-        nodes['ok'] = tree.add_node(TreeViewLabel(text="Overkill",
-                                                  is_open=True,
-                                                  no_selection=True))
-        nodes['xdf'] = tree.add_node(TreeViewLabel(text="XDF",
-                                                   is_open=True,
-                                                   no_selection=True))
-        nodes['other'] = tree.add_node(TreeViewLabel(text="Other",
-                                                     is_open=True,
-                                                     no_selection=True))
-        self.servertype_nodes = nodes
+            if matches is None or address in matches:
+                rows[server.category].append(
+                    (address, self.server_row(server)))
+        rows_done = time.time()
+        registry.timer('serverlist.rows').record(rows_done - filtered)
+        server_list = self.ids.server_list
+        server_list.set_highlighted(
+            address for friend, address in self.friends_online())
+        server_list.set_rows(rows)
+        registry.timer('serverlist.set_rows').record(time.time() - rows_done)
+        if self._jump:
+            self._jump = False
+            self.jump_to_first(rows)
+
+    def jump_to_first(self, rows):
+        """
+        Select the first shown server and scroll to it
+        """
+        server_list = self.ids.server_list
+        for category, title in ServerListView.sections:
+            if rows[category] and category not in server_list.collapsed:
+                address = rows[category][0][0]
+                server_list.select(address)
+                server_list.scroll_to(address)
+                return
+
+    def filter_query(self):
+        """
+        Compile the filter text and the 'show empty' and 'show full'
+        switches into a Query, it is only parsed again when they change.
+        Returns None if the filter is invalid. The text of the player search
+        is not a query.
+        """
+        text = "" if self.player_mode() else self.ids.txt_input_filter.text
+        key = (text, self.ids.switch_empty.active,
+               self.ids.switch_full.active)
+        if self._query[0] == key:
+            return self._query[1]
+        text, show_empty, show_full = key
+        terms = []
+        if not show_empty:
+            terms.append(Term('players', '>', "0"))
+        if not show_full:
+            terms.append(Term('free', '>', "0"))
+        try:
+            query = Query(text, terms)
+        except QueryError as e:
+            query = None
+            self.filter_error = "Invalid filter: {}".format(e)
+            self.update_status()
+        else:
+            if self.filter_error is not None:
+                self.filter_error = None
+                self.update_status()
+        self._query = (key, query)
+        return query
+
+    def saved_filters(self):
+        """
+        Map the names of the saved filters to their queries
+        """
+        filters = OrderedDict()
+        config = App.get_running_app().config
+        if config.has_section('Filters'):
+            for name in config.options('Filters'):
+                filters[name] = config.get('Filters', name)
+        return filters
+
+    def apply_saved_filter(self, name):
+        filters = self.saved_filters()
+        if name in filters:
+            self.ids.txt_input_filter.text = filters[name]
+            self.update_serverlist()
+
+    def save_filter_popup(self):
+        self.popup = SaveFilterPopup()
+        self.popup.ids.txt_inpt_filter.text = self.ids.txt_input_filter.text
+        self.popup.ids.save_filter_btn.bind(
+            on_press=self.save_filter_btn_callback)
+        self.popup.open()
+
+    def save_filter_btn_callback(self, sender):
+        name = self.popup.ids.txt_inpt_name.text.strip()
+        text = self.popup.ids.txt_inpt_filter.text.strip()
+        if not name or not text:
+            return
+        try:
+            Query(text)
+        except QueryError as e:
+            self.popup.ids.lbl_error.text = str(e)
+            return
+        app = App.get_running_app()
+        if not app.config.has_section('Filters'):
+            app.config.add_section('Filters')
+        app.config.set('Filters', name, text)
+        app.config.write()
+        self.popup.dismiss()
+        self.ids.spinner_filter.values = list(self.saved_filters())
+
+    def server_row(self, server, favourite=False):
+        name = "[b]{}[/b]".format(server.name) if favourite else server.name
+        ping = "{} ms".format(server.ping) if server.ping is not None else "-"
+        return (name, "{} ({})".format(server.gametype, server.mod),
+                "{}/{}".format(server.numplayers, server.maxplayers), ping)
 
 
 class StarterApp(App):
     title = "Xonotic Starter"
     use_kivy_settings = False
 
+    irccontroller = None
+    # lines of the output shown in the log when Xonotic crashed
+    CRASH_LINES = 20
+    # seconds between the metric dumps of --profile
+    METRICS_INTERVAL = 60
+    # opens the statistics
+    STATS_KEY = 293  # F12
+
     def on_start(self):
-        self.irccontroller = irc.IRCController()
+        startup.mark("start")
+        if profiler is not None:
+            Clock.schedule_interval(lambda dt: self.dump_metrics(),
+                                    StarterApp.METRICS_INTERVAL)
 
     def on_stop(self):
         # Disconnect from IRC if window is destroyed
-        self.irccontroller.disconnect()
+        if self.irccontroller is not None:
+            self.irccontroller.disconnect()
+        if profiler is not None:
+            self.dump_metrics()
+
+    def dump_metrics(self):
+        """
+        Write the metrics to metrics.json in the user data dir, the startup
+        timeline and the system make results of different machines
+        comparable
+        """
+        path = os.path.join(self.user_data_dir, "metrics.json")
+        registry.dump(path, {'startup': startup.phases(),
+                             'platform': platform.platform(),
+                             'python': platform.python_version()})
+        return path
+
+    def on_keyboard(self, window, key, *args):
+        if key == StarterApp.STATS_KEY:
+            StatsPopup().open()
+            return True
+
+    def load_irc(self):
+        """
+        Import the IRC module and create its controller on first use
+        """
+        if self.irccontroller is None:
+            start = time.time()
+            import irc
+            self.irccontroller = irc.IRCController()
+            Logger.info("IRC: loaded in {:.0f} ms".format(
+                (time.time() - start) * 1000))
+        return self.irccontroller
 
     def start_xon(self, server=None):
         """
-        Start Xonotic with the given environment variables and arguments
+        Start Xonotic with the launch profile of the settings
         Also directly connect to a server if given
+
+        A running Xonotic is not started a second time. It can't be sent to
+        another server, so restarting it is offered instead.
         """
-        # Environment variables
-        myenv = os.environ.copy()
-        env_vars = self.config.get("Xonotic", "env_vars")
-        if env_vars:
-            env_vars = env_vars.split(",")
-            for var in env_vars:
-                name, value = var.strip().split("=")
-                myenv[name] = value
-
-        # Arguments
-        args = self.config.get("Xonotic", "args").split()
-        # Path and Version like specified in the settings
-        xon_path = self.config.get('Xonotic', 'xon_path')
-        xon_version = self.config.get('Xonotic', 'xon_version')
-        # git version
-        if os.path.isfile(os.path.join(xon_path, "all")):
-            xon_app = "all"
-            args.insert(0, "run")
-            args.insert(1, xon_version)
-        # release and autobuild versions
-        elif sys.platform.startswith('linux'):
-            xon_app = "xonotic-linux-{}.sh".format(xon_version)
-        elif sys.platform in ["win32", "cygwin"]:
-            if xon_version == "sdl":
-                xon_app = "xonotic.exe"
-            else:
-                xon_app = "xonotic-wgl.exe"
-            args.extend(["-basedir", xon_path])
-        elif sys.platform == "darwin":
-            xon_app = "Xonotic.app"
-        else:
-            Logger.error("Unsupported platform")
+        requested = time.time()
+        try:
+            profile = self.launch_profiles.get(
+                self.config, self.config.get('Xonotic', 'launch_profile'))
+            result = self.game.launch(profile, server, requested)
+        except LaunchError as e:
+            Logger.error("Starting Xonotic failed: {}".format(e))
+            self.error_popup("An error occured: {}".format(e))
+            return
+        except OSError as e:
+            self.error_popup("An error occured: " + e.strerror)
             return
+        if result == 'started':
+            Logger.info("Launch: started {} in {:.0f} ms".format(
+                profile.binary, (time.time() - requested) * 1000))
+        elif server and server != self.game.process.server:
+            self.restart_popup(profile, server)
+        else:
+            self.root.ids.starter.update_status("Xonotic is already running")
 
-        args.insert(0, os.path.join(xon_path, xon_app))
+    def restart_popup(self, profile, server):
+        content = BoxLayout(orientation='vertical')
+        content.add_widget(Label(
+            text="Xonotic is already running and can't be sent to another "
+                 "server.\nRestart it and connect to {}?".format(server),
+            halign='center'))
+        buttons = BoxLayout(orientation='horizontal', size_hint_y=0.2)
+        restart_btn = Button(text="Restart Xonotic")
+        cancel_btn = Button(text="Cancel")
+        buttons.add_widget(restart_btn)
+        buttons.add_widget(cancel_btn)
+        content.add_widget(buttons)
+        popup = Popup(title="Xonotic is running", content=content,
+                      size_hint=(0.6, 0.4))
+        cancel_btn.bind(on_press=popup.dismiss)
 
-        if server:
-            args.extend(["+connect", server])
+        def restart(button):
+            popup.dismiss()
+            self.root.ids.starter.update_status("Restarting Xonotic")
+            d = self.game.restart(profile, server)
+            d.addCallback(
+                lambda result: self.root.ids.starter.update_status())
+            d.addErrback(lambda failure: self.error_popup(
+                "Restarting Xonotic failed: {}".format(
+                    failure.getErrorMessage())))
+        restart_btn.bind(on_press=restart)
+        popup.open()
 
-        try:
-            subprocess.Popen(args, cwd=xon_path, env=myenv)
-        except OSError as e:
-            content = BoxLayout(orientation='vertical')
-            content.add_widget(Label(text="An error occured: " + e.strerror))
-            close_btn = Button(text="Close Popup")
-            close_btn.size_hint_y = 0.1
-            content.add_widget(close_btn)
-            popup = Popup(title="Error", content=content)
-            close_btn.bind(on_press=popup.dismiss)
-            popup.open()
+    def game_ended(self, process):
+        if not process.crashed:
+            Logger.info("Launch: Xonotic {} after {:.0f} s".format(
+                process.describe_exit(), process.runtime))
+            return
+        Logger.error("Launch: Xonotic {} after {:.0f} s, last output:\n"
+                     "{}".format(process.describe_exit(), process.runtime,
+                                 "\n".join(process.output.tail(
+                                     StarterApp.CRASH_LINES))))
+        self.root.ids.starter.update_status("Xonotic {}".format(
+            process.describe_exit()))
+
+    def error_popup(self, text):
+        content = BoxLayout(orientation='vertical')
+        content.add_widget(Label(text=text))
+        close_btn = Button(text="Close Popup")
+        close_btn.size_hint_y = 0.1
+        content.add_widget(close_btn)
+        popup = Popup(title="Error", content=content)
+        close_btn.bind(on_press=popup.dismiss)
+        popup.open()
 
     def build_config(self, config):
-        config.setdefaults('Xonotic', {
-            'xon_path': script_dir(),
-            'env_vars': "",
-            'xon_version': "sdl",
-            'args': ""})
-        config.setdefaults('IRC', {
-            'nick': "XonoticFan",
-            'username': "",
-            'password': "",
-            'autojoin': False})
+        for section, values in sorted(starterconfig.defaults().items()):
+            config.setdefaults(section, values)
+
+    def on_config_change(self, config, section, key, value):
+        if section == 'Xonotic' and key in ('refresh_interval',
+                                            'favourites_interval',
+                                            'idle_factor'):
+            self.root.ids.starter.configure_refresh()
 
     def build_settings(self, settings):
         settings.register_type('winPath', WinSettingPath)
@@ -486,8 +1315,16 @@ class StarterApp(App):
         self.icon = os.path.join(self.config.get('Xonotic', 'xon_path'),
                                  "misc/logos/icons_png/xonotic_64.png")
         register_fonts()
-        apply_theme("luma")
-        return MainGUI()
+        apply_theme("luma", os.path.join(self.user_data_dir, "atlas"))
+        if profiler is not None:
+            profiler.directory = os.path.join(self.user_data_dir, "profile")
+        Window.bind(on_keyboard=self.on_keyboard)
+        self.launch_profiles = ProfileCache()
+        self.game = GameSupervisor(reactor, log_dir=self.user_data_dir,
+                                   on_exit=self.game_ended)
+        root = MainGUI()
+        startup.mark("build")
+        return root
 
 
 if __name__ == "__main__":